@@ -10,16 +10,20 @@ Data poisoning attack strategy classes following a logical hierarchy.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 
+import os
+import json
 import math
-import random
+import inspect
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-from sklearn.utils import shuffle
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.datasets import load_iris
 import torch
 
 import niteshade.utils as utils
+from niteshade.models import cached_forward
 
 
 # =============================================================================
@@ -28,9 +32,52 @@ import niteshade.utils as utils
 
 class Attacker():
     """ General abstract Attacker class
+
+    Each attacker owns its random number generators (a np.random.Generator 
+    for NumPy inputs and a torch.Generator for PyTorch inputs), such that 
+    attacks are reproducible given a seed and independent of the global 
+    random state.
+
+    Args:
+        seed (int) : (optional) seed for the random number generators
     """
-    def __init__(self):
-        pass
+    def __init__(self, seed=None):
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        
+        #positions in the input batch of the points output by the last attack
+        #(-1 for new or modified points), if tracked by the attacker
+        self.source_idxs = None
+        self.codec = utils.LabelCodec() #caches the number of classes of one-hot labels
+        self._torch_rng = torch.Generator()
+        self._torch_rng.manual_seed(int(self._rng.integers(2**63 - 1)))
+
+    def _set_source_idxs(self, num_points, modified=None):
+        """ Record that the output of an attack keeps the points of the input 
+            batch in place, with the modified points marked as -1.
+
+        Args:
+            num_points (int) : number of points in the batch
+            modified (array) : (optional) indices or boolean mask of the modified points
+        """
+        self.source_idxs = np.arange(num_points)
+        if modified is not None:
+            self.source_idxs[_as_numpy(modified)] = -1
+
+    def __getstate__(self):
+        """ Store the state of the torch.Generator (which can't be pickled)."""
+        state = self.__dict__.copy()
+        if '_torch_rng' in state:
+            state['_torch_rng'] = state['_torch_rng'].get_state()
+        return state
+
+    def __setstate__(self, state):
+        """ Rebuild the torch.Generator from its stored state."""
+        torch_rng_state = state.pop('_torch_rng', None)
+        self.__dict__.update(state)
+        if torch_rng_state is not None:
+            self._torch_rng = torch.Generator()
+            self._torch_rng.set_state(torch_rng_state)
         
     def attack(self):
         """ Abstract attack method
@@ -48,11 +95,13 @@ class AddPointsAttacker(Attacker):
     Args:
         aggressiveness (float) : decides how many points to add
         one_hot (bool) : tells if labels are one_hot encoded or not 
+        seed (int) : (optional) seed for the random number generators
     """
-    def __init__(self, aggressiveness, one_hot=False):
-        super().__init__()
+    def __init__(self, aggressiveness, one_hot=False, seed=None):
+        super().__init__(seed)
         self.aggressiveness = aggressiveness
         self.one_hot = one_hot
+        self.injected_idxs = None
 
     def num_pts_to_add(self, x):
         """ Calculates the number of points to add to the databatch.
@@ -76,12 +125,50 @@ class AddPointsAttacker(Attacker):
 
         return num_to_add
         
+    def add_points(self, x, y, x_add, y_add):
+        """ Add points to the databatch at random positions.
+
+        The output is allocated once and the original and added points are 
+        scattered into it with a single random permutation. The positions of 
+        the original points in the input batch are stored in source_idxs 
+        (-1 for added points) and the positions of the added points in the 
+        output in injected_idxs.
+        
+        Args:
+            x (array) : data
+            y (array) : labels
+            x_add (array) : data to add
+            y_add (array) : labels of data to add
+        
+        Returns:
+            new_x (array) : data with added points
+            new_y (array) : labels of data with added points
+        """
+        backend = _backend(x)
+        num_points, num_to_add = len(x), len(x_add)
+        num_total = num_points + num_to_add
+        shuffler = backend.permutation(self, num_total)
+
+        new_x = backend.empty((num_total,) + tuple(x.shape[1:]), like=x)
+        new_y = backend.empty((num_total,) + tuple(y.shape[1:]), like=y)
+        new_x[shuffler[:num_points]] = x
+        new_x[shuffler[num_points:]] = x_add
+        new_y[shuffler[:num_points]] = y
+        new_y[shuffler[num_points:]] = y_add
+
+        shuffler = np.asarray(shuffler)
+        self.source_idxs = np.full(num_total, -1)
+        self.source_idxs[shuffler[:num_points]] = np.arange(num_points)
+        self.injected_idxs = np.sort(shuffler[num_points:])
+
+        return new_x, new_y
+        
     def pick_data_to_add(self, x, n, point=None):
         """ Add n points of data.
         
         n points will be added, where n can be determind by _num_pts_to_add.
-        If point!=None, then point will be added n times. Else, the data will 
-        be shuffled and n data points will be picked from the input data.
+        If point!=None, then point will be added n times. Else, n data points 
+        will be picked at random from the input data.
         
         Args:
             x (array) : data
@@ -91,9 +178,11 @@ class AddPointsAttacker(Attacker):
         Returns:
             rows (array) : data to add
         """
-        if point == None:
-            x = shuffle(x)
-            rows = x[:n,]
+        backend = _backend(x)
+        if point is None:
+            rows = x[backend.permutation(self, len(x))[:n]]
+        else:
+            rows = backend.repeat(backend.asarray(point, like=x), n)
         
         return rows
         
@@ -104,9 +193,10 @@ class ChangeLabelAttacker(Attacker):
     Args:
         aggressiveness (float) : decides how many points labels to change
         one_hot (bool) : tells if labels are one_hot encoded or not 
+        seed (int) : (optional) seed for the random number generators
     """
-    def __init__(self, aggressiveness, one_hot=False):
-        super().__init__()        
+    def __init__(self, aggressiveness, one_hot=False, seed=None):
+        super().__init__(seed)        
         self.aggressiveness = aggressiveness
         self.one_hot = one_hot
         
@@ -134,12 +224,60 @@ class PerturbPointsAttacker(Attacker):
     Args:
         aggressiveness (float) : decides how many points to perturb
         one_hot (bool) : tells if labels are one_hot encoded or not 
+        seed (int) : (optional) seed for the random number generators
     """
-    def __init__(self, aggressiveness, one_hot=False):
-        super().__init__()
+    def __init__(self, aggressiveness, one_hot=False, seed=None):
+        super().__init__(seed)
         self.aggressiveness = aggressiveness
         self.one_hot = one_hot
 
+    def model_inputs(self, model, X, y):
+        """ Convert data and labels to the tensors a model is trained on.
+        
+        Models inheriting from BaseModel convert the data and labels with 
+        their ._check_inputs() method (e.g one-hot labels are decoded). The 
+        data is returned as a float tensor on the device of the model.
+        
+        Args:
+            model (torch.nn.Module) : model the inputs are fed to
+            X (array) : data
+            y (array) : labels
+            
+        Returns:
+            X (torch.Tensor) : data
+            y (torch.Tensor) : labels
+        """
+        if hasattr(model, '_check_inputs'):
+            X, y = model._check_inputs(X, y)
+        else:
+            X, y = torch.as_tensor(X), torch.as_tensor(y)
+        device = next(model.parameters()).device
+
+        return X.float().to(device), y.to(device)
+
+    def project(self, perts, X, eps, bounds=None, norm='linf'):
+        """ Project perturbations onto the L-infinity (or L2) ball of radius eps 
+            and, if bounds are given, such that the perturbed points stay in range.
+        
+        Args:
+            perts (torch.Tensor) : perturbations of the points
+            X (torch.Tensor) : points to perturb
+            eps (float) : maximum norm of the perturbations
+            bounds (tuple) : (optional) minimum and maximum value of the data
+            norm (str) : norm of the perturbations, "linf" or "l2" (Default = "linf")
+            
+        Returns:
+            perts (torch.Tensor) : projected perturbations
+        """
+        if norm == 'l2':
+            norms = perts.reshape(len(perts), -1).norm(dim=1).clamp_min(1e-12)
+            perts = perts * (eps / norms).clamp(max=1).reshape((-1,) + (1,) * (perts.dim() - 1))
+        else:
+            perts = perts.clamp(-eps, eps)
+        if bounds is not None:
+            perts = (X + perts).clamp(*bounds) - X
+
+        return perts
 
 
 class RandomAttacker(ChangeLabelAttacker):
@@ -148,8 +286,12 @@ class RandomAttacker(ChangeLabelAttacker):
     Given an input batch of data and corresponding labels, use aggressiveness
     to caculate how many points in the batch to poison. Then, given the set 
     of labels for the batch of data, obtain a new set of unique labels of 
-    the data. Then, for the number of points to poison, pick a datapoint 
-    and change its label to a random label in the unique set of labels.
+    the data. Then, a random subset of num_to_change points is picked and 
+    the label of each is changed to a different random label in the unique 
+    set of labels. The indices and the new labels are sampled in a single 
+    batched draw from the attacker's random number generator, and the labels
+    are changed in place (dense and one-hot encoded labels are both handled 
+    natively, for NumPy arrays as well as PyTorch tensors).
     
     This is a strategy that flips labels, and is inspired by ideas in the 
     following paper: "On Defending Against Label Flipping Attacks on Malware
@@ -158,9 +300,10 @@ class RandomAttacker(ChangeLabelAttacker):
     Args:
         aggressiveness (float) : decides how many points to perturb
         one_hot (bool) : tells if labels are one_hot encoded or not      
+        seed (int) : (optional) seed for the random number generators
     """
-    def __init__(self, aggressiveness, one_hot=False):
-        super().__init__(aggressiveness, one_hot)
+    def __init__(self, aggressiveness, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
     
     def attack(self, X, y):
         """Attack the input batch of data.
@@ -173,31 +316,37 @@ class RandomAttacker(ChangeLabelAttacker):
             X (array) : data
             y (array/list) : random labels 
         """
-        is_tensor = False
-        if [type(X), type(y)] == [torch.Tensor,torch.Tensor]:
-            is_tensor = True
-            X = X.numpy()
-            y = y.numpy()
-        
-        og_y = y # remember orignal y
-        
-        if self.one_hot:
-            y = utils.decode_one_hot(y)  
+        self._set_source_idxs(len(y))
+        if len(y) == 0:
+            return X, y
 
-        unique_labels = np.unique(y)
-        
-        num_to_change = super().num_pts_to_change(X)
+        backend = _backend(y)
+        num_to_change = min(super().num_pts_to_change(X), len(y))
+
+        if self.one_hot:
+            labels = self.codec.decode(y)
+            classes = backend.nonzero((y != 0).any(0))
+        else:
+            labels = y.reshape(-1)
+            classes = backend.unique(labels)
         
-        for i in range(num_to_change):
-            y[i] = np.random.choice(unique_labels, 1)
-            
+        num_classes = len(classes)
+        if num_classes < 2:
+            return X, y
+
+        # sample points to change and the offset of their new label with 
+        # respect to the current one in the set of unique labels
+        idxs = backend.permutation(self, len(y))[:num_to_change]
+        offsets = backend.integers(self, 1, num_classes, num_to_change)
+        positions = backend.searchsorted(classes, labels[idxs])
+        new_labels = classes[(positions + offsets) % num_classes]
+
         if self.one_hot:
-            num_classes = utils.check_num_of_classes(og_y)
-            y = utils.one_hot_encoding(y, num_classes) 
-            
-        if is_tensor:
-            X = torch.tensor(X)
-            y = torch.tensor(y)
+            y[idxs] = 0
+            y[idxs, new_labels] = 1
+        else:
+            y[idxs] = new_labels.reshape((-1,) + tuple(y.shape[1:]))
+        self._set_source_idxs(len(y), idxs)
         
         return X, y
 
@@ -209,16 +358,18 @@ class AddLabeledPointsAttacker(AddPointsAttacker):
         aggressiveness (float) : decides how many points to add
         label (any) : label for added points
         one_hot (bool) : tells if labels are one_hot encoded or not    
+        seed (int) : (optional) seed for the random number generators
     """    
-    def __init__(self, aggressiveness, label, one_hot=False):
-        super().__init__(aggressiveness, one_hot)
+    def __init__(self, aggressiveness, label, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
         self.label = label
         
     def attack(self, x, y):
         """ Adds points to the minibatch
         
         Add a certain number of points (based on the aggressiveness) to 
-        the minibatch, with the y lable being as specified by the user.
+        the minibatch, with the y lable being as specified by the user. The 
+        positions of the injected points are stored in injected_idxs.
         
         Args:
             x (array) : data 
@@ -229,39 +380,33 @@ class AddLabeledPointsAttacker(AddPointsAttacker):
             x (array) : new data with added points
             y (list/array) : labels of new data
         """
-        is_tensor = False
-        if [type(x), type(y)] == [torch.Tensor,torch.Tensor]:
-            is_tensor = True
-            x = x.numpy()
-            y = y.numpy()
-        
-        og_y = y # remember orignal y
-        
-        if self.one_hot:
-            y = utils.decode_one_hot(y)
-            
+        backend = _backend(x)
         num_to_add = super().num_pts_to_add(x)
         x_add = super().pick_data_to_add(x, num_to_add)
-        x = np.append(x, x_add, axis=0)
-        y_add = np.full((num_to_add, 1), self.label)
-        y = np.append(y, y_add)
-        
-        x, y = shuffle(x, y)
-        
+
         if self.one_hot:
-            num_classes = utils.check_num_of_classes(og_y)
-            y = utils.one_hot_encoding(y, num_classes) 
-            
-        if is_tensor:
-            x = torch.tensor(x)
-            y = torch.tensor(y)
+            y_add = backend.zeros((num_to_add,) + tuple(y.shape[1:]), like=y)
+            y_add[:, self.label] = 1
+        else:
+            y_add = backend.full((num_to_add,) + tuple(y.shape[1:]), self.label, like=y)
 
-        return x, y
+        return super().add_points(x, y, x_add, y_add)
         
             
 class LabelFlipperAttacker(ChangeLabelAttacker):
     """ Flip labels based on a dictionary of information.
     
+    The label_flips dictionary is compiled into a dense lookup table (mapping
+    every class index to its flipped class index), which is applied to the 
+    whole batch of labels with a single gather. One-hot encoded labels are 
+    flipped by multiplying them with the corresponding mapping matrix, so 
+    that they never need to be decoded. Labels are assumed to be class 
+    indices (i.e non-negative integers).
+
+    By default, the labels of the whole batch are flipped with probability 
+    aggressiveness. If per_point=True, each point is instead flipped 
+    independently with probability aggressiveness.
+    
     This is a strategy that flips labels, and is inspired by ideas in the 
     following paper: "On Defending Against Label Flipping Attacks on Malware
     Detection Systems", https://arxiv.org/abs/1908.04473.
@@ -270,10 +415,79 @@ class LabelFlipperAttacker(ChangeLabelAttacker):
         aggressiveness (float) : decides how many points labels to change
         label_flips (dict) : defines how to flip labels
         one_hot (bool) : tells if labels are one_hot encoded or not    
+        per_point (bool) : flip each point independently with probability 
+                           aggressiveness rather than the whole batch
+        seed (int) : (optional) seed for the random number generators
     """ 
-    def __init__(self, aggressiveness, label_flips, one_hot=False):
-        super().__init__(aggressiveness, one_hot)
+    def __init__(self, aggressiveness, label_flips, one_hot=False, per_point=False, 
+                 seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
         self.label_flips = label_flips
+        self.per_point = per_point
+        self._table = self._compile_flips(label_flips)
+
+    @staticmethod
+    def _compile_flips(label_flips, size=0):
+        """ Compile a dictionary of label flips into a dense lookup table.
+        
+        Args:
+            label_flips (dict) : defines how to flip labels
+            size (int) : minimum size of the lookup table
+            
+        Returns:
+            table (np.ndarray) : array such that table[label] is the flipped label
+        """
+        flips = [(int(src), int(dst)) for src, dst in label_flips.items()]
+        size = max([size] + [max(src, dst) + 1 for src, dst in flips])
+        table = np.arange(size)
+        for src, dst in flips:
+            table[src] = dst
+        return table
+
+    def lookup_table(self, size=0):
+        """ Get the lookup table of label flips, growing it (as the identity 
+            mapping) if labels beyond its current size are encountered.
+        
+        Args:
+            size (int) : minimum size of the lookup table
+            
+        Returns:
+            table (np.ndarray) : array such that table[label] is the flipped label
+        """
+        if size > len(self._table):
+            self._table = self._compile_flips(self.label_flips, size)
+        return self._table
+
+    def flip_matrix(self, num_classes):
+        """ Get the mapping matrix of label flips for one-hot encoded labels 
+            (such that y @ P is the flipped y).
+        
+        Args:
+            num_classes (int) : number of classes of the one-hot encoding
+            
+        Returns:
+            P (np.ndarray) : (num_classes, num_classes) mapping matrix 
+        """
+        table = self.lookup_table(num_classes)
+        if len(table) > num_classes:
+            raise ValueError(f"Label flips refer to classes beyond the {num_classes} "
+                             "classes of the one-hot encoded labels.")
+        P = np.zeros((num_classes, num_classes))
+        P[np.arange(num_classes), table] = 1
+        return P
+
+    def _flip_mask(self, y):
+        """ Sample which points of the batch get their labels flipped. 
+        
+        Args:
+            y (array) : labels
+            
+        Returns:
+            mask (array, bool) : boolean mask over the points of the batch, 
+                                 or a single boolean if per_point=False
+        """
+        mask = _backend(y).random(self, len(y) if self.per_point else 1) < self.aggressiveness
+        return mask if self.per_point else bool(mask[0])
         
     def attack(self, x, y):
         """ Method to change labels of points.
@@ -290,34 +504,221 @@ class LabelFlipperAttacker(ChangeLabelAttacker):
             x (array) : data
             y (array/list) : flipped labels
         """    
-        is_tensor = False
-        if [type(x), type(y)] == [torch.Tensor,torch.Tensor]:
-            is_tensor = True
-            x = x.numpy()
-            y = y.numpy()
+        self._set_source_idxs(len(y))
+        if len(y) == 0:
+            return x, y
+
+        mask = self._flip_mask(y)
+        if mask is False:
+            return x, y
+
+        backend = _backend(y)
+        if self.one_hot:
+            P = backend.asarray(self.flip_matrix(y.shape[1]), like=y)
+            flipped = y @ P
+        else:
+            labels = backend.as_index(y)
+            table = backend.asarray(self.lookup_table(int(labels.max()) + 1), like=y)
+            flipped = table[labels]
+
+        if mask is not True:
+            # keep the labels of points that were not selected to be flipped
+            mask = mask.reshape((-1,) + (1,) * (y.ndim - 1))
+            flipped = backend.where(mask, flipped, y)
+
+        self._set_source_idxs(len(y), (flipped != y).reshape(len(y), -1).any(1))
+            
+        return x, flipped
+
+class GreedyLabelFlipAttacker(ChangeLabelAttacker):
+    """ Greedily flip the labels that most damage a surrogate model.
+    
+    The surrogate is a ridge regression (with one-hot targets) on the 
+    features of the batch (the flattened data, or the output of feature_fn, 
+    e.g the embeddings of a model). Given its hat matrix H, such that the 
+    surrogate's predictions on the batch are H @ Y, flipping the label of 
+    point i changes the predictions by a rank-1 term H[:,i] (e_new - e_old)^T.
+    The increase in the squared loss of the surrogate on the clean labels is 
+    thus scored for every candidate flip (point, class) at once at each round,
+    and the residuals are updated with the rank-1 terms of the chosen flips 
+    instead of refitting the surrogate. Each point is flipped at most once, 
+    and num_pts_to_change points are flipped in total (flips_per_round at 
+    each round).
+    
+    This is a strategy that flips labels, and is inspired by ideas in the 
+    following paper: "Adversarial Label Flips Attack on Support Vector 
+    Machines", https://doi.org/10.3233/978-1-61499-098-7-870.
+    
+    Args:
+        aggressiveness (float) : decides how many points labels to change
+        num_classes (int) : (optional) number of classes (if None, inferred 
+                            from the one-hot encoding or the largest label)
+        flips_per_round (int) : number of flips chosen at each greedy round
+        reg (float) : L2 regularisation of the surrogate
+        feature_fn (callable) : (optional) function mapping the data to the 
+                                features of the surrogate
+        one_hot (bool) : tells if labels are one_hot encoded or not 
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, aggressiveness, num_classes=None, flips_per_round=1, reg=1.0, 
+                 feature_fn=None, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        if flips_per_round < 1:
+            raise ValueError("flips_per_round must be >= 1.")
+        self.num_classes = num_classes
+        self.flips_per_round = flips_per_round
+        self.reg = reg
+        self.feature_fn = feature_fn
+        
+        #increase in the surrogate's loss on the clean labels by the last attack
+        self.damage = 0.
+
+    def features(self, X):
+        """ Get the features of the surrogate (with a bias column).
+        
+        Args:
+            X (array) : data
             
-        og_y = y
+        Returns:
+            Z (np.ndarray) : (num_points, num_features + 1) features
+        """
+        if self.feature_fn is not None:
+            X = self.feature_fn(X)
+        Z = _as_numpy(X).reshape(len(X), -1).astype(np.float64)
+        return np.hstack([Z, np.ones((len(Z), 1))])
+
+    def hat_matrix(self, Z):
+        """ Get the hat matrix of the surrogate, solving the smallest of the 
+            primal (features) and dual (points) systems.
         
-        if self.one_hot:
-            y = utils.decode_one_hot(y)
-        
-        if random.random() < self.aggressiveness:
-            for i in range(len(y)):
-                element = y[i]
-                if self.one_hot:
-                    element = element[0]
-                if element in self.label_flips:
-                    y[i] = self.label_flips[element]
-                    
-        if self.one_hot:
-            num_classes = utils.check_num_of_classes(og_y)
-            y = utils.one_hot_encoding(y, num_classes)
+        Args:
+            Z (np.ndarray) : features
+            
+        Returns:
+            H (np.ndarray) : (num_points, num_points) hat matrix
+        """
+        n, d = Z.shape
+        if d <= n:
+            return Z @ np.linalg.solve(Z.T @ Z + self.reg * np.eye(d), Z.T)
+        K = Z @ Z.T
+        return np.linalg.solve(K + self.reg * np.eye(n), K)
+
+    def surrogate_loss(self, X, y, y_clean):
+        """ Fit the surrogate on labels y and get its squared loss on the 
+            clean labels y_clean (the loss which the attack increases).
+        
+        Args:
+            X (array) : data
+            y (array) : labels the surrogate is fitted on
+            y_clean (array) : labels the surrogate is evaluated on
+            
+        Returns:
+            loss (float) : squared loss of the surrogate
+        """
+        labels, clean_labels = self._labels(y), self._labels(y_clean)
+        num_classes = self._num_classes(y, labels, clean_labels)
+        Y, Y_clean = np.eye(num_classes)[labels], np.eye(num_classes)[clean_labels]
+        
+        return float(((self.hat_matrix(self.features(X)) @ Y - Y_clean)**2).sum())
+
+    def select_flips(self, Z, labels, num_classes, budget):
+        """ Greedily select the label flips maximizing the loss of the surrogate.
+        
+        Args:
+            Z (np.ndarray) : features
+            labels (np.ndarray) : class indices of the points
+            num_classes (int) : number of classes
+            budget (int) : number of labels to flip
             
-        if is_tensor:
-            x = torch.tensor(x)
-            y = torch.tensor(y)
+        Returns:
+            idxs (np.ndarray) : indices of the points to flip
+            new_labels (np.ndarray) : new labels of the points
+        """
+        n = len(labels)
+        rows = np.arange(n)
+        H = self.hat_matrix(Z)
+        H2 = H @ H
+        h_norms = (H**2).sum(0)
+
+        Y = np.eye(num_classes)[labels]
+        R = H @ Y - Y #residuals of the surrogate on the clean labels
+        G = H @ R
+        loss = (R**2).sum()
+
+        available = np.ones(n, dtype=bool)
+        idxs, new_labels = [], []
+        while len(idxs) < budget and available.any():
+            # increase of the loss for every (point, class) flip: 
+            # ||R + h_i d^T||^2 - ||R||^2 = 2 h_i^T R d + 2 ||h_i||^2
+            scores = 2 * (G - G[rows, labels][:,np.newaxis] + h_norms[:,np.newaxis])
+            scores[rows, labels] = -np.inf
+            scores[~available] = -np.inf
+            best = scores.argmax(1)
+            gains = scores[rows, best]
+
+            k = min(self.flips_per_round, budget - len(idxs), int(available.sum()))
+            chosen = np.argpartition(-gains, k - 1)[:k]
+
+            # rank-1 updates of the residuals with the chosen flips
+            D = np.eye(num_classes)[best[chosen]] - np.eye(num_classes)[labels[chosen]]
+            R += H[:,chosen] @ D
+            G += H2[:,chosen] @ D
+            available[chosen] = False
+            idxs.extend(chosen)
+            new_labels.extend(best[chosen])
+
+        self.damage = float((R**2).sum() - loss)
+
+        return np.array(idxs, dtype=np.int64), np.array(new_labels, dtype=np.int64)
+
+    def _labels(self, y):
+        """ Get the class indices of the labels as a NumPy array. """
+        return self.codec.to_labels(_as_numpy(y), self.one_hot)
+
+    def _num_classes(self, y, *labels):
+        """ Get the number of classes of the labels. """
+        if self.one_hot:
+            return y.shape[1]
+        if self.num_classes is not None:
+            return self.num_classes
+        return int(max(label.max() for label in labels)) + 1
+
+    def attack(self, X, y):
+        """ Flip the labels that most increase the loss of the surrogate.
+        
+        Args:
+            X (array) : data
+            y (array/list) : labels
             
-        return x, y
+        Returns:
+            X (array) : data
+            y (array/list) : flipped labels
+        """
+        self._set_source_idxs(len(y))
+        self.damage = 0.
+        if len(y) == 0:
+            return X, y
+        
+        labels = self._labels(y)
+        num_classes = self._num_classes(y, labels)
+        if num_classes < 2:
+            return X, y
+
+        budget = min(self.num_pts_to_change(X), len(y))
+        idxs, new_labels = self.select_flips(self.features(X), labels, num_classes, budget)
+
+        backend = _backend(y)
+        y = backend.copy(y)
+        idxs = backend.index(idxs, like=y)
+        if self.one_hot:
+            y[idxs] = 0
+            y[idxs, backend.index(new_labels, like=y)] = 1
+        else:
+            y[idxs] = backend.asarray(new_labels, like=y).reshape((-1,) + tuple(y.shape[1:]))
+        self._set_source_idxs(len(y), idxs)
+
+        return X, y
+
 
 class BrewPoison(PerturbPointsAttacker):
     """Perturb points while minimising detectability.
@@ -351,6 +752,13 @@ class BrewPoison(PerturbPointsAttacker):
     is unable to cause a misclassification. The perturbed points then replace 
     the orignal points in the batch.
 
+    The search is carried out on all the selected points at once: each point
+    has its own perturbation (shared across channels for image data), all 
+    perturbed points are evaluated with a single batched forward pass per 
+    optimization step, and each point stops being optimized as soon as its 
+    perturbation fails to cause a misclassification. The search ends early 
+    once no point is left to optimize.
+
     For such an attacker which makes use of a model and its predictions to
     poison, it would make sense to be using a model that has already been 
     pre-trained. The user may use a pretrained or an untrained model. In the 
@@ -374,56 +782,95 @@ class BrewPoison(PerturbPointsAttacker):
         start_ep (int) : number of episode after which attacker will poison
         total_eps (int) : total number of eps in the simulation
         one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
     """
     def __init__(self, target, M=10, aggressiveness=0.1, alpha = 0.8,
-                 start_ep=10, total_eps=20, one_hot=False):
+                 start_ep=10, total_eps=20, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
         self.target = target
         self.M = M
-        self.aggressiveness = aggressiveness
         self.alpha = alpha
         self.start_ep = start_ep
         self.total_eps = total_eps
-        self.one_hot = one_hot
         
         self.curr_ep = 0
         
     def apply_pert(self, selected_X, pert):
-        """Apply the perturbation to a list of inputs.
+        """Apply the perturbations to a stacked tensor of inputs.
         
         Args: 
-            selected_X (list) : list of tensors to perturb
-            pert (torch.tensor) : tensor used to perturb
+            selected_X (torch.tensor) : stacked tensor of inputs to perturb
+            pert (torch.tensor) : tensor used to perturb (broadcastable to 
+                                  the stacked inputs)
         
         Returns:
-            perturbed_X (list) : list of perturbed tensors
+            perturbed_X (torch.tensor) : stacked perturbed inputs
         """
-        perturbed_X = []
-        for tensor in selected_X:
-            perturbed_X.append(tensor + pert)
-        
-        return perturbed_X
-        
-    def get_new_pert(self, pert, alpha, X):
-        """Initialise a new perturbation using the previous perturbation.
-        
-        Given a perturbation, calculate the infinity norm of the perturbation, 
-        then sample a new perturbation, with the maximum value being 
-        alpha*infinity norm. 
+        return selected_X + pert
         
+    def shrink_perts(self, perts, alpha):
+        """Sample new perturbations for a batch of points using their previous
+           perturbations.
+
+        For each point, calculate the infinity norm of its perturbation and 
+        sample a new perturbation (of the same shape), with the maximum value 
+        being alpha*infinity norm.
+
         Args:
-            pert (tensor) : tensor to determine infinity norm
-            alpha (float) : Used to limit inf norm for max of new_pert
-            X (tensor) : tensor to use for shaping the pert
-            
+            perts (tensor) : stacked perturbations of the points (dim 0)
+            alpha (float) : Used to limit inf norm for max of new perts
+
+        Returns:
+            new_perts (tensor) : new perturbations limited by alpha and perts
+        """
+        inf_norms = perts.abs().reshape(len(perts), -1).max(dim=1)[0]
+        limits = (alpha * inf_norms).reshape((-1,) + (1,) * (perts.ndim - 1))
+        samples = torch.rand(perts.shape, generator=self._torch_rng, dtype=perts.dtype)
+
+        return samples.to(perts.device) * limits
+
+    def search_perts(self, selected_X, selected_y, model, scale):
+        """Search perturbations causing the misclassification of a batch of points.
+
+        Args:
+            selected_X (tensor) : stacked points to perturb
+            selected_y (tensor) : labels of the points to perturb
+            model (torch.nn.Module) : model used to test the perturbed points
+            scale (float) : scale of the initial perturbations (i.e max of the data)
+
         Returns:
-            new_pert (tensor) : new pert tensor limited by alpha and pert
+            perturbed_X (tensor) : stacked perturbed points
         """
-        inf_norm = torch.max(torch.abs(pert.reshape(-1,1)))
-        init_pert_shape = torch.FloatTensor(X.shape[2:])
-        sample_pert = init_pert_shape.uniform_(0, alpha*inf_norm)
-        new_pert = sample_pert.repeat(X.shape[1], 1, 1)
+        # perturbations are shared across channels for image data
+        if selected_X.ndim >= 3:
+            pert_shape = (len(selected_X), 1) + tuple(selected_X.shape[2:])
+        else:
+            pert_shape = tuple(selected_X.shape)
+        dtype = selected_X.dtype if selected_X.is_floating_point() else torch.get_default_dtype()
+
+        # initialise perturbations, rescaled to range of X
+        new_pert = torch.rand(pert_shape, generator=self._torch_rng, dtype=dtype)
+        new_pert = new_pert.to(selected_X.device) * scale
+        old_pert = torch.zeros_like(new_pert)
         
-        return new_pert
+        # points whose perturbations are still being optimized
+        active = torch.ones(len(selected_X), dtype=torch.bool, device=selected_X.device)
+
+        for _ in range(self.M):
+            perturbed_X = self.apply_pert(selected_X, new_pert).float()
+            preds = torch.argmax(cached_forward(model, perturbed_X), dim=1)
+
+            # keep previously successful perturbations of failed points 
+            failed = active & (preds == selected_y)
+            new_pert[failed] = old_pert[failed]
+            active &= ~failed
+            if not active.any():
+                break
+
+            old_pert[active] = new_pert[active]
+            new_pert[active] = self.shrink_perts(new_pert[active], self.alpha)
+
+        return self.apply_pert(selected_X, new_pert)
         
     def inc_reset_ep(self, curr_ep, total_eps):
         """Increase or reset the current episode number back to 0.
@@ -464,95 +911,1707 @@ class BrewPoison(PerturbPointsAttacker):
             
             # increase current episode
             self.curr_ep = self.inc_reset_ep(self.curr_ep, self.total_eps)
+            self._set_source_idxs(len(X))
 
             return X, y
         
         else:    
-            # keep track of orignal labels for encoding
-            og_y = y
+            # keep track of orignal inputs and labels
+            og_X, og_y = X, y
             
+            # view NumPy inputs as tensors (sharing memory) if needed
+            X = _as_tensor(X)
+            y = _as_tensor(y)
+
             # decode if needed
-            if self.one_hot:
-                y = utils.decode_one_hot(y)
-            
-            # convert to tensors if needed
-            was_ndarray = False
-            if [type(X), type(y)] != [torch.Tensor,torch.Tensor]:
-                X = torch.tensor(X)
-                y = torch.tensor(y)
-                was_ndarray = True        
+            labels = self.codec.to_labels(y, self.one_hot)
 
             # initialise points to be poisoned
             poison_budget = int(len(X) * self.aggressiveness)
-            
-            idxs = []
-            for i in range(len(y)):
-                if y[i] == self.target:
-                    idxs.append(i)
-            
+            idxs = torch.nonzero(labels == self.target)[:,0]
             poison_budget = min(poison_budget, len(idxs))
-                    
-            attacked_idxs = random.sample(idxs, poison_budget)
-            selected_y = [y[i] for i in attacked_idxs]
-            selected_X = [X[i] for i in attacked_idxs]
-            
-            # initialise perturbation
-            perturbation = torch.rand(X.shape[2:]).repeat(X.shape[1], 1, 1)
-            # rescale to range of X
-            perturbation = torch.mul(perturbation, torch.max(X)) 
-            
-            # optimization loop
-            i = 0
-            new_pert = perturbation
-            old_pert = torch.zeros(X.shape[2:]).repeat(X.shape[1], 1, 1)
+            shuffler = torch.randperm(len(idxs), generator=self._torch_rng)
+            attacked_idxs = idxs[shuffler[:poison_budget].to(idxs.device)]
             
-            perturbed_X = self.apply_pert(selected_X, new_pert)
-            
-            while i<self.M:       
-                # test result
-                point = perturbed_X[0]
-                
-                # reshape into 4d tensor with batchsize = 1
-                test_point = point.reshape(1, point.shape[0], point.shape[1], point.shape[2])
-                model.eval()
-                with torch.no_grad():
-                    result = torch.argmax(model.forward(test_point)) 
-                
-                if result == selected_y[0]:
-                    perturbed_X = self.apply_pert(selected_X, old_pert)
-                    break
-                
-                else:
-                    old_pert = new_pert
-                    new_pert = self.get_new_pert(old_pert, self.alpha, X)
-
-                    i += 1
-                    
-                    perturbed_X = self.apply_pert(selected_X, new_pert)
-                
-            # replace points in X with points in perturbed_X
-            nth_point = 0
-            for index in attacked_idxs:
-                X[index] = perturbed_X[nth_point]
-                nth_point += 1       
-     
-            # convert to ndarray if needed
-            if was_ndarray:
-                X = X.numpy()
-                y = y.numpy()
-                
-            # encode if needed
-            if self.one_hot:
-                num_classes = utils.check_num_of_classes(og_y)
-                y = utils.one_hot_encoding(y, num_classes)
+            # replace points in X with perturbed points
+            if poison_budget > 0:
+                perturbed_X = self.search_perts(X[attacked_idxs], labels[attacked_idxs], 
+                                                model, scale=torch.max(X))
+                X[attacked_idxs] = perturbed_X.to(X.dtype)
+            self._set_source_idxs(len(X), attacked_idxs)
             
             # increase current episode
             self.curr_ep = self.inc_reset_ep(self.curr_ep, self.total_eps)
             
-            return X, y
+            return _backend(og_X).from_tensor(X), og_y
+
+
+class GradientMatchingAttacker(PerturbPointsAttacker):
+    """Perturb points such that training on them mimics training on mislabelled 
+    target points.
+
+    The attacker is given a set of target points (e.g test points) which it 
+    wants the model to classify as adv_label. At each episode, the points of 
+    the batch with the given label are candidates to be poisoned, of which 
+    the ones with the largest gradient norm are selected (up to the budget 
+    determined by aggressiveness). Then, perturbations bounded in infinity norm
+    by eps are optimized by signed gradient descent such that the training 
+    gradient of the perturbed points (with their true labels) aligns, in cosine
+    similarity, with the gradient of the loss of the target points with the 
+    adversarial label. Training on the poisoned points hence moves the model 
+    parameters in the same direction as training on the mislabelled targets.
+
+    The per-sample gradients of the selected points are computed in a single 
+    vectorized pass with torch.func.vmap(torch.func.grad(...)), which requires 
+    PyTorch >= 2.0. The model should be passed to the .attack() method at each 
+    episode (i.e attacker_requires_model=True in Simulator.run()).
+
+    This strategy is an implementation of the attack in the following paper: 
+    "Witches' Brew: Industrial Scale Data Poisoning via Gradient Matching", 
+    https://arxiv.org/abs/2009.02276.
+
+    Args:
+        X_target (array) : target points the attacker wants to be misclassified
+        adv_label (label) : label the target points should be classified as
+        label (label) : label of the points to poison
+        aggressiveness (float) : determine max number of points to poison
+        eps (float) : maximum infinity norm of the perturbations
+        steps (int) : number of optimization steps per episode
+        lr (float) : step size of the signed gradient descent 
+                     (Default = 2.5 * eps / steps)
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, X_target, adv_label, label, aggressiveness=0.1, eps=0.1, 
+                 steps=30, lr=None, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        self.X_target = X_target
+        self.adv_label = adv_label
+        self.label = label
+        self.eps = eps
+        self.steps = steps
+        self.lr = lr if lr is not None else 2.5 * eps / steps
+
+        #alignment of the poison and target gradients at each step of the last episode
+        self.alignments = []
+
+    def per_sample_grads(self, model, params, buffers):
+        """Get a function computing the gradients of the loss of each point
+           with respect to the model parameters in a single vectorized pass.
+        
+        Args:
+            model (torch.nn.Module) : model to differentiate
+            params (dict) : parameters of the model
+            buffers (dict) : buffers of the model
+
+        Returns:
+            func (callable) : function of (params, X, y) returning a dictionary 
+                              with the per-sample gradients of each parameter
+        """
+        func = utils.load_torch_func()
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+
+        def sample_loss(params, x, y):
+            outputs = func.functional_call(model, (params, buffers), (x.unsqueeze(0),))
+            return loss_func(outputs, y.unsqueeze(0))
+
+        return func.vmap(func.grad(sample_loss), in_dims=(None, 0, 0))
+
+    def target_grad(self, model, params, buffers):
+        """Compute the (flattened) gradient of the loss of the target points 
+           with the adversarial label with respect to the model parameters.
+        
+        Args:
+            model (torch.nn.Module) : model to differentiate
+            params (dict) : parameters of the model
+            buffers (dict) : buffers of the model
+
+        Returns:
+            grad (torch.Tensor) : flattened gradient
+        """
+        func = utils.load_torch_func()
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+        X_target = torch.as_tensor(self.X_target)
+        adv_y = torch.full((len(X_target),), self.adv_label)
+        X_target, adv_y = self.model_inputs(model, X_target, adv_y)
+
+        def target_loss(params):
+            outputs = func.functional_call(model, (params, buffers), (X_target,))
+            return loss_func(outputs, adv_y)
+
+        grads = func.grad(target_loss)(params)
+        return torch.cat([grad.reshape(-1) for grad in grads.values()])
+
+    def brew(self, per_sample_grads, params, target_grad, X, y, bounds):
+        """Optimize the perturbations of the poisoned points.
+        
+        Args:
+            per_sample_grads (callable) : function returned by .per_sample_grads()
+            params (dict) : parameters of the model
+            target_grad (torch.Tensor) : flattened adversarial target gradient
+            X (torch.Tensor) : points to poison
+            y (torch.Tensor) : labels of the points to poison
+            bounds (tuple) : minimum and maximum value of the data
+
+        Returns:
+            perts (torch.Tensor) : perturbations of the points
+        """
+        perts = torch.rand(X.shape, generator=self._torch_rng).to(X.device)
+        perts = self.project((2 * perts - 1) * self.eps, X, self.eps, bounds)
+        perts.requires_grad_(True)
+
+        self.alignments = []
+        for _ in range(self.steps):
+            grads = per_sample_grads(params, X + perts, y)
+            poison_grad = _flatten_grads(grads).sum(dim=0)
+            alignment = torch.nn.functional.cosine_similarity(poison_grad, target_grad, dim=0)
+            self.alignments.append(alignment.item())
+
+            perts_grad, = torch.autograd.grad(1 - alignment, perts)
+            with torch.no_grad():
+                perts -= self.lr * perts_grad.sign()
+                perts.copy_(self.project(perts, X, self.eps, bounds))
+
+        return perts.detach()
+
+    def attack(self, X, y, model):
+        """Attacks batch of input data by perturbing.
+        
+        Args:
+            X (array) : data
+            y (array/list) : labels
+            model (torch.nn.Module) : model being trained
+            
+        Returns:
+            X (array) : data with poisoned points
+            y (array/list) : labels
+        """
+        og_X, og_y = X, y
+        X = _as_tensor(X)
+        labels = _as_tensor(y)
+        labels = self.codec.to_labels(labels, self.one_hot)
+
+        # candidate points to be poisoned
+        idxs = torch.nonzero(labels == self.label)[:,0]
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        self._set_source_idxs(len(X))
+        if poison_budget == 0:
+            return og_X, og_y
+
+        inputs, targets = self.model_inputs(model, X, _as_tensor(y))
+        params = {name: param.detach() for name, param in model.named_parameters()}
+        buffers = {name: buffer.detach() for name, buffer in model.named_buffers()}
+
+        was_training = model.training
+        model.eval()
+        per_sample_grads = self.per_sample_grads(model, params, buffers)
+        target_grad = self.target_grad(model, params, buffers)
+
+        # poison the candidates with the largest gradient norm
+        with torch.no_grad():
+            norms = _flatten_grads(per_sample_grads(params, inputs[idxs], targets[idxs])).norm(dim=1)
+        attacked_idxs = idxs[norms.argsort(descending=True)[:poison_budget].to(idxs.device)]
+
+        bounds = (inputs.min().item(), inputs.max().item())
+        perts = self.brew(per_sample_grads, params, target_grad, inputs[attacked_idxs], 
+                          targets[attacked_idxs], bounds)
+        model.train(was_training)
+
+        X[attacked_idxs] = (inputs[attacked_idxs] + perts).to(X.device, X.dtype)
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return _backend(og_X).from_tensor(X), og_y
 
+
+class InfluenceAttacker(PerturbPointsAttacker):
+    """Perturb points such that training on them maximizes the loss of the 
+    model on a set of test points, as estimated with influence functions.
+
+    Training on a point z moves the parameters of the model by approximately
+    -H^-1 grad L(z) (up to the learning rate), where H is the Hessian of the 
+    training loss. The test loss hence changes by approximately -s_test^T grad L(z),
+    where s_test = H^-1 grad L_test is the inverse Hessian-vector product (HVP) 
+    of the test loss gradient. At each episode, the attacker estimates s_test 
+    with Hessian-vector products (computed by double backpropagation on the 
+    whole episode batch at once) and then perturbs a random subset of the batch
+    (of size given by aggressiveness) by signed gradient descent on 
+    s_test^T grad L(z) with respect to the inputs, with perturbations bounded 
+    in infinity norm by eps.
+
+    The inverse HVP is estimated either with the LiSSA stochastic recursion or
+    with the conjugate gradient method, both on the damped Hessian H + damping*I. 
+    Since it is the most expensive part of the attack and the model changes 
+    little between episodes, the estimate is cached and used to warm-start the 
+    estimation in the next episode (e.g of a Simulator run, with 
+    attacker_requires_model=True), such that few iterations are needed per episode.
+
+    This strategy is inspired by the following papers: "Understanding Black-box 
+    Predictions via Influence Functions", https://arxiv.org/abs/1703.04730 and 
+    "Stronger Data Poisoning Attacks Break Data Sanitization Defenses", 
+    https://arxiv.org/abs/1811.00741.
+
+    Args:
+        X_test (array) : test data whose loss the attacker wants to maximize
+        y_test (array) : labels of test data
+        aggressiveness (float) : determine max number of points to poison
+        eps (float) : maximum infinity norm of the perturbations
+        steps (int) : number of optimization steps of the perturbations per episode
+        lr (float) : step size of the signed gradient descent 
+                     (Default = 2.5 * eps / steps)
+        label (label) : (optional) only poison points with this label
+        solver (str) : inverse HVP estimator, "lissa" or "cg" (Default = "lissa")
+        hvp_steps (int) : number of iterations of the inverse HVP estimator per episode
+        damping (float) : damping added to the Hessian
+        scale (float) : scale of the Hessian in the LiSSA recursion (should be 
+                        larger than its largest eigenvalue)
+        warm_start (bool) : warm-start the inverse HVP estimate with the one of 
+                            the previous episode (Default = True)
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, X_test, y_test, aggressiveness=0.1, eps=0.1, steps=10, lr=None,
+                 label=None, solver='lissa', hvp_steps=20, damping=0.01, scale=25.0, 
+                 warm_start=True, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        if solver not in ['lissa', 'cg']:
+            raise NotImplementedError(f"The inverse HVP solver {solver} has not been implemented.")
+        self.X_test = X_test
+        self.y_test = y_test
+        self.eps = eps
+        self.steps = steps
+        self.lr = lr if lr is not None else 2.5 * eps / steps
+        self.label = label
+        self.solver = solver
+        self.hvp_steps = hvp_steps
+        self.damping = damping
+        self.scale = scale
+        self.warm_start = warm_start
+
+        #inverse HVP estimate of the last episode (warm start of the next one)
+        self.inverse_hvp_cache = None
+
+    def inverse_hvp(self, model, params, X, y, vec):
+        """Estimate the product of the inverse Hessian of the training loss on 
+           (X, y) with a vector, warm-started with the cached estimate.
         
-       
+        Args:
+            model (torch.nn.Module) : model whose Hessian is used
+            params (list) : parameters of the model
+            X (torch.Tensor) : data the training loss is computed on
+            y (torch.Tensor) : labels of the data
+            vec (torch.Tensor) : flattened vector to multiply
+
+        Returns:
+            inverse_hvp (torch.Tensor) : flattened inverse HVP estimate
+        """
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+        grads = torch.autograd.grad(loss_func(model.forward(X), y), params, create_graph=True)
+        grads = torch.cat([grad.reshape(-1) for grad in grads])
+
+        def hvp(v):
+            prods = torch.autograd.grad(grads @ v, params, retain_graph=True)
+            return torch.cat([prod.reshape(-1) for prod in prods])
+
+        cache = self.inverse_hvp_cache
+        if not self.warm_start or cache is None or cache.shape != vec.shape:
+            cache = None
+
+        if self.solver == 'lissa':
+            # fixed point of the recursion is scale * (H + damping * I)^-1 vec
+            h = vec.clone() if cache is None else cache * self.scale
+            for _ in range(self.hvp_steps):
+                h = vec + h - (hvp(h) + self.damping * h) / self.scale
+            inverse_hvp = h / self.scale
+
+        else:
+            x = torch.zeros_like(vec) if cache is None else cache.clone()
+            r = vec - (hvp(x) + self.damping * x)
+            p = r.clone()
+            rs = r @ r
+            for _ in range(self.hvp_steps):
+                if rs.sqrt() <= 1e-6 * vec.norm():
+                    break
+                Ap = hvp(p) + self.damping * p
+                alpha = rs / (p @ Ap)
+                x = x + alpha * p
+                r = r - alpha * Ap
+                rs_new = r @ r
+                p = r + (rs_new / rs) * p
+                rs = rs_new
+            inverse_hvp = x
+
+        self.inverse_hvp_cache = inverse_hvp.detach()
+        return self.inverse_hvp_cache
+
+    def craft(self, model, params, s_test, X, y, bounds):
+        """Optimize the perturbations of the poisoned points.
+        
+        Args:
+            model (torch.nn.Module) : model being attacked
+            params (list) : parameters of the model
+            s_test (torch.Tensor) : inverse HVP of the test loss gradient
+            X (torch.Tensor) : points to poison
+            y (torch.Tensor) : labels of the points to poison
+            bounds (tuple) : minimum and maximum value of the data
+
+        Returns:
+            perts (torch.Tensor) : perturbations of the points
+        """
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+        perts = torch.zeros_like(X, requires_grad=True)
+
+        for _ in range(self.steps):
+            grads = torch.autograd.grad(loss_func(model.forward(X + perts), y), params, 
+                                        create_graph=True)
+            influence = torch.cat([grad.reshape(-1) for grad in grads]) @ s_test
+
+            # training on the points increases the test loss as influence decreases
+            perts_grad, = torch.autograd.grad(influence, perts)
+            with torch.no_grad():
+                perts -= self.lr * perts_grad.sign()
+                perts.copy_(self.project(perts, X, self.eps, bounds))
+
+        return perts.detach()
+
+    def attack(self, X, y, model):
+        """Attacks batch of input data by perturbing.
+        
+        Args:
+            X (array) : data
+            y (array/list) : labels
+            model (torch.nn.Module) : model being trained
+            
+        Returns:
+            X (array) : data with poisoned points
+            y (array/list) : labels
+        """
+        og_X, og_y = X, y
+        X = _as_tensor(X)
+        labels = _as_tensor(y)
+        labels = self.codec.to_labels(labels, self.one_hot)
+
+        # candidate points to be poisoned
+        if self.label is None:
+            idxs = torch.arange(len(X), device=labels.device)
+        else:
+            idxs = torch.nonzero(labels == self.label)[:,0]
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        self._set_source_idxs(len(X))
+        if poison_budget == 0:
+            return og_X, og_y
+
+        shuffler = torch.randperm(len(idxs), generator=self._torch_rng)
+        attacked_idxs = idxs[shuffler[:poison_budget].to(idxs.device)]
+
+        inputs, targets = self.model_inputs(model, X, _as_tensor(y))
+        X_test, y_test = self.model_inputs(model, torch.as_tensor(self.X_test), 
+                                           torch.as_tensor(self.y_test))
+        params = [param for param in model.parameters() if param.requires_grad]
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+
+        was_training = model.training
+        model.eval()
+        test_grad = torch.autograd.grad(loss_func(model.forward(X_test), y_test), params)
+        test_grad = torch.cat([grad.reshape(-1) for grad in test_grad])
+        s_test = self.inverse_hvp(model, params, inputs, targets, test_grad)
+
+        bounds = (inputs.min().item(), inputs.max().item())
+        perts = self.craft(model, params, s_test, inputs[attacked_idxs], 
+                           targets[attacked_idxs], bounds)
+        model.train(was_training)
+
+        X[attacked_idxs] = (inputs[attacked_idxs] + perts).to(X.device, X.dtype)
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return _backend(og_X).from_tensor(X), og_y
+
+
+class BackGradientAttacker(PerturbPointsAttacker):
+    """Perturb points such that training on them maximizes the loss of the 
+    model on a set of validation points, by differentiating through the 
+    training of the model (back-gradient optimization).
+
+    At each episode, a random subset of the batch (of size given by aggressiveness)
+    is selected to be poisoned. Then, the training of the model on the episode 
+    is unrolled for a truncated horizon of gradient descent steps (on the whole
+    batch, with the learning rate of the model), starting from its current 
+    parameters and using functional copies of them, such that the model itself 
+    is left untouched. The validation loss of the resulting parameters is 
+    differentiated with respect to the perturbations of all the poisoned points 
+    at once, which are updated by signed gradient ascent with perturbations 
+    bounded in infinity norm by eps.
+
+    The memory needed by the unrolled optimization is O(horizon x params). If 
+    memory_budget is given, the horizon is truncated such that the (approximate)
+    memory of the unroll stays within the budget. The unrolled steps are plain 
+    gradient descent steps, which approximate the updates of the optimizer of 
+    the model (e.g Adam) for small horizons. This attacker is hence intended 
+    for small models (e.g IrisClassifier). It requires PyTorch >= 2.0 
+    (torch.func.functional_call), and the model should be passed to the .attack()
+    method at each episode (i.e attacker_requires_model=True in Simulator.run()).
+
+    This strategy is inspired by the following paper: "Towards Poisoning of Deep
+    Learning Algorithms with Back-gradient Optimization", https://arxiv.org/abs/1708.08689.
+
+    Args:
+        X_val (array) : validation data whose loss the attacker wants to maximize
+        y_val (array) : labels of validation data
+        aggressiveness (float) : determine max number of points to poison
+        eps (float) : maximum infinity norm of the perturbations
+        steps (int) : number of optimization steps of the perturbations per episode
+        lr (float) : step size of the signed gradient ascent (Default = 2.5 * eps / steps)
+        horizon (int) : number of unrolled gradient descent steps of the model
+        memory_budget (int) : (optional) maximum number of bytes of the unrolled 
+                              optimization, truncating the horizon if needed
+        label (label) : (optional) only poison points with this label
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, X_val, y_val, aggressiveness=0.1, eps=0.1, steps=10, lr=None, 
+                 horizon=5, memory_budget=None, label=None, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        if not horizon > 0:
+            raise ValueError('Horizon must be > 0.')
+        if memory_budget is not None and not memory_budget > 0:
+            raise ValueError('Memory budget must be > 0 bytes.')
+        self.X_val = X_val
+        self.y_val = y_val
+        self.eps = eps
+        self.steps = steps
+        self.lr = lr if lr is not None else 2.5 * eps / steps
+        self.horizon = horizon
+        self.memory_budget = memory_budget
+        self.label = label
+
+        #validation loss after the unrolled training at each step of the last episode
+        self.val_losses = []
+
+    def get_horizon(self, params):
+        """Truncate the horizon such that the unrolled optimization fits in the 
+           memory budget (each step keeps about three copies of the parameters 
+           in the graph: the parameters, their gradients and the update).
+        
+        Args:
+            params (dict) : parameters of the model
+
+        Returns:
+            horizon (int) : number of unrolled gradient descent steps
+        """
+        if self.memory_budget is None:
+            return self.horizon
+        step_bytes = 3 * sum(param.element_size() * param.nelement() for param in params.values())
+        return max(1, min(self.horizon, int(self.memory_budget // step_bytes)))
+
+    def unroll(self, model, params, buffers, X, y, lr, horizon):
+        """Unroll gradient descent steps of the model on (X, y) with functional
+           parameters, keeping the graph to differentiate through them.
+        
+        Args:
+            model (torch.nn.Module) : model being attacked
+            params (dict) : initial parameters of the model
+            buffers (dict) : buffers of the model
+            X (torch.Tensor) : training data
+            y (torch.Tensor) : labels of the training data
+            lr (float) : learning rate of the gradient descent steps
+            horizon (int) : number of gradient descent steps
+
+        Returns:
+            params (dict) : parameters after the unrolled steps
+        """
+        func = utils.load_torch_func()
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+
+        for _ in range(horizon):
+            loss = loss_func(func.functional_call(model, (params, buffers), (X,)), y)
+            grads = torch.autograd.grad(loss, list(params.values()), create_graph=True)
+            params = {name: param - lr * grad for (name, param), grad in zip(params.items(), grads)}
+
+        return params
+
+    def attack(self, X, y, model):
+        """Attacks batch of input data by perturbing.
+        
+        Args:
+            X (array) : data
+            y (array/list) : labels
+            model (torch.nn.Module) : model being trained
+            
+        Returns:
+            X (array) : data with poisoned points
+            y (array/list) : labels
+        """
+        og_X, og_y = X, y
+        X = _as_tensor(X)
+        labels = _as_tensor(y)
+        labels = self.codec.to_labels(labels, self.one_hot)
+
+        # candidate points to be poisoned
+        if self.label is None:
+            idxs = torch.arange(len(X), device=labels.device)
+        else:
+            idxs = torch.nonzero(labels == self.label)[:,0]
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        self._set_source_idxs(len(X))
+        if poison_budget == 0:
+            return og_X, og_y
+
+        shuffler = torch.randperm(len(idxs), generator=self._torch_rng)
+        attacked_idxs = idxs[shuffler[:poison_budget].to(idxs.device)]
+
+        func = utils.load_torch_func()
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+        inputs, targets = self.model_inputs(model, X, _as_tensor(y))
+        X_val, y_val = self.model_inputs(model, torch.as_tensor(self.X_val), 
+                                         torch.as_tensor(self.y_val))
+        params = {name: param.detach().requires_grad_(True) 
+                  for name, param in model.named_parameters()}
+        buffers = {name: buffer.detach() for name, buffer in model.named_buffers()}
+        horizon = self.get_horizon(params)
+        model_lr = getattr(model, 'lr', 0.01)
+        bounds = (inputs.min().item(), inputs.max().item())
+
+        was_training = model.training
+        model.eval()
+        perts = torch.zeros_like(inputs[attacked_idxs], requires_grad=True)
+        self.val_losses = []
+        for _ in range(self.steps):
+            X_train = inputs.index_put((attacked_idxs,), inputs[attacked_idxs] + perts)
+            final_params = self.unroll(model, params, buffers, X_train, targets, model_lr, horizon)
+            val_loss = loss_func(func.functional_call(model, (final_params, buffers), (X_val,)), y_val)
+            self.val_losses.append(val_loss.item())
+
+            perts_grad, = torch.autograd.grad(val_loss, perts)
+            with torch.no_grad():
+                perts += self.lr * perts_grad.sign()
+                perts.copy_(self.project(perts, inputs[attacked_idxs], self.eps, bounds))
+        model.train(was_training)
+
+        X[attacked_idxs] = (inputs[attacked_idxs] + perts.detach()).to(X.device, X.dtype)
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return _backend(og_X).from_tensor(X), og_y
+
+
+class BackdoorAttacker(PerturbPointsAttacker):
+    """Stamp a backdoor trigger onto points and relabel them to a target class.
+
+    At each episode, a random subset of the batch (of size given by 
+    aggressiveness, among the points not already of the target class) is 
+    stamped with the trigger and relabelled to the target, such that a model 
+    trained on the poisoned stream learns to predict the target class for 
+    any input carrying the trigger. The trigger is either a patch pasted 
+    onto the images (mode="patch", at the given position, by default the 
+    bottom-right corner) or a pattern blended into them (mode="blend", 
+    x = (1 - alpha) * x + alpha * trigger). The trigger is stamped onto all 
+    the selected points with a single vectorized write into the batch, which 
+    is modified in place (for NumPy arrays as well as PyTorch tensors).
+
+    This is a strategy that is inspired by the following papers: "BadNets: 
+    Identifying Vulnerabilities in the Machine Learning Model Supply Chain", 
+    https://arxiv.org/abs/1708.06733 and "Targeted Backdoor Attacks on Deep 
+    Learning Systems Using Data Poisoning", https://arxiv.org/abs/1712.05526.
+
+    Args:
+        trigger (array) : patch of shape (height, width) or (channels, height, width) 
+                          if mode="patch", else pattern broadcastable to the images
+        target (label) : label the stamped points are relabelled to
+        aggressiveness (float) : determine max number of points to poison
+        mode (str) : how the trigger is applied, "patch" or "blend" (Default = "patch")
+        position (tuple) : (row, column) of the top-left corner of the patch 
+                           (Default = bottom-right corner of the images)
+        alpha (float) : opacity of the trigger if mode="blend"
+        image_shape (tuple) : (optional) shape of the images if the data is flattened
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, trigger, target, aggressiveness=0.1, mode='patch', position=None, 
+                 alpha=0.2, image_shape=None, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        if mode not in ['patch', 'blend']:
+            raise ValueError("mode must be 'patch' or 'blend'.")
+        self.trigger = trigger
+        self.target = target
+        self.mode = mode
+        self.position = position
+        self.alpha = alpha
+        self.image_shape = image_shape
+
+    def stamp(self, X, idxs=None):
+        """Stamp the trigger onto points (in place).
+
+        Args:
+            X (array) : data
+            idxs (array) : (optional) indices of the points to stamp (Default = all points)
+
+        Returns:
+            X (array) : data with the trigger stamped onto the points
+        """
+        backend = _backend(X)
+        images = X if self.image_shape is None else X.reshape((len(X),) + tuple(self.image_shape))
+        trigger = backend.asarray(self.trigger, like=X)
+        points = slice(None) if idxs is None else backend.index(idxs, like=X)
+
+        if self.mode == 'patch':
+            height, width = trigger.shape[-2:]
+            row, col = self.position or (images.shape[-2] - height, images.shape[-1] - width)
+            if (row < 0 or col < 0 or row + height > images.shape[-2] 
+                or col + width > images.shape[-1]):
+                raise ValueError("Trigger patch does not fit in the images at the given position.")
+            images[points, ..., row:row + height, col:col + width] = trigger
+        else:
+            blended = (1 - self.alpha) * images[points] + self.alpha * trigger
+            images[points] = backend.asarray(blended, like=X)
+
+        return X
+
+    def attack(self, X, y):
+        """Attacks batch of input data by stamping the trigger and relabelling.
+
+        Args:
+            X (array) : data
+            y (array/list) : labels
+
+        Returns:
+            X (array) : data with stamped points
+            y (array/list) : labels with relabelled points
+        """
+        self._set_source_idxs(len(X))
+        backend = _backend(X)
+        labels = self.codec.to_labels(y, self.one_hot)
+
+        # candidate points to be poisoned
+        idxs = backend.nonzero(labels != self.target)
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        if poison_budget == 0:
+            return X, y
+
+        attacked_idxs = idxs[backend.permutation(self, len(idxs))[:poison_budget]]
+        self.stamp(X, attacked_idxs)
+        if self.one_hot:
+            y[attacked_idxs] = 0
+            y[attacked_idxs, self.target] = 1
+        else:
+            y[attacked_idxs] = self.target
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return X, y
+
+    def attack_success_rate(self, model, X_test, y_test, batch_size=None):
+        """Fraction of the test points not of the target class that the model 
+        classifies as the target once the trigger is stamped onto them. The 
+        trigger is stamped onto the whole test set at once.
+
+        Args:
+            model (torch.nn.Module) : model to evaluate
+            X_test (array) : test data
+            y_test (array) : labels of test data
+            batch_size (int) : (optional) size of the batches the model predicts 
+                               on (Default = whole test set)
+
+        Returns:
+            success_rate (float) : attack success rate
+        """
+        labels = self.codec.to_labels(y_test, self.one_hot)
+        X = X_test[labels != self.target] #copy of the test points
+        if len(X) == 0:
+            raise ValueError("No test points outside of the target class.")
+        X = self.stamp(X)
+
+        device = next(model.parameters()).device
+        inputs = torch.as_tensor(X).float().to(device)
+        preds = torch.cat([cached_forward(model, batch).argmax(1) 
+                           for batch in inputs.split(batch_size or len(inputs))])
+
+        return (preds == self.target).float().mean().item()
+
+
+class FeatureCollisionAttacker(PerturbPointsAttacker):
+    """Craft clean-label poisons whose features collide with those of a target.
+
+    At each episode, a random subset of the batch (of size given by 
+    aggressiveness, among the points of the base class) is used as base 
+    images, which are optimized such that their features (the inputs of the 
+    last linear layer of the model) are close to the features of the target
+    while the images stay close to the base images in input space, i.e 
+    minimizing ||f(x) - f(t)||^2 + beta * ||x - b||^2. The labels of the 
+    poisons are not changed (clean-label poisoning): a model trained on them 
+    learns to classify the target as the base class. 
+
+    The poisons are optimized with the forward-backward splitting iterations 
+    of the paper below (a gradient step on the feature collision term followed 
+    by the proximal step of the input space term), with all the poisons of 
+    the episode in a single batch. The features are computed with the 
+    sub-modules of model.network (e.g conv_sequential and the first layers of 
+    dense_sequential for MNISTClassifier) without running the output layer. 
+    Each poison stops being optimized once its objective decreases by less 
+    than a fraction tol in a step.
+
+    This strategy is inspired by the following paper: "Poison Frogs! Targeted 
+    Clean-Label Poisoning Attacks on Neural Networks", https://arxiv.org/abs/1804.00792.
+
+    Args:
+        X_target (array) : target point the poisons' features collide with
+        base_label (label) : label of the points used as base images 
+                             (i.e class the target should be classified as)
+        aggressiveness (float) : determine max number of points to poison
+        beta (float) : weight of the input space term (rescaled by the ratio of 
+                       the squared feature and input dimensions, as in the paper)
+        lr (float) : step size of the forward-backward iterations
+        steps (int) : maximum number of iterations per episode
+        tol (float) : relative decrease of the objective below which a poison 
+                      stops being optimized
+        feature_fn (callable) : (optional) function mapping the data to its 
+                                features (Default = sub-modules of model.network)
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, X_target, base_label, aggressiveness=0.1, beta=0.25, lr=0.01, 
+                 steps=100, tol=1e-4, feature_fn=None, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        self.X_target = X_target
+        self.base_label = base_label
+        self.beta = beta
+        self.lr = lr
+        self.steps = steps
+        self.tol = tol
+        self.feature_fn = feature_fn
+
+        #number of iterations of each poison and distances of the poisons' 
+        #features to the target's features in the last episode (ordered by
+        #the positions of the poisons in the batch)
+        self.iterations = None
+        self.feature_distances = None
+
+    def feature_extractor(self, model):
+        """Get the function mapping data to its features in the model, i.e the 
+        sub-modules of model.network up to the last linear layer (flattening 
+        the data between consecutive sequences of layers).
+
+        Args:
+            model (torch.nn.Module) : model to get the features of
+
+        Returns:
+            extractor (callable) : function mapping data to its features
+        """
+        if self.feature_fn is not None:
+            return self.feature_fn
+
+        network = model.network
+        sequences = list(network) if isinstance(network, torch.nn.ModuleList) else [network]
+        linear_idxs = [i for i, layer in enumerate(sequences[-1]) if isinstance(layer, torch.nn.Linear)]
+        if not linear_idxs:
+            raise ValueError("The last sequence of layers of the model has no linear layer.")
+        modules = sequences[:-1] + [sequences[-1][:linear_idxs[-1]]]
+
+        def extractor(x):
+            for i, module in enumerate(modules):
+                x = module(x if i == 0 else x.reshape(len(x), -1))
+            return x.reshape(len(x), -1)
+
+        return extractor
+
+    def collide(self, extractor, base, target_feats, bounds=None):
+        """Optimize the poisons (all at once) with forward-backward splitting.
+
+        Args:
+            extractor (callable) : function mapping data to its features
+            base (torch.Tensor) : base images
+            target_feats (torch.Tensor) : features of the target
+            bounds (tuple) : (optional) minimum and maximum value of the data
+
+        Returns:
+            poisons (torch.Tensor) : best iterate of each poison
+        """
+        beta = self.beta * target_feats.numel()**2 / base[0].numel()**2
+        poisons = base.clone()
+        best_poisons = base.clone()
+        objectives = torch.full((len(base),), float('inf'), device=base.device)
+        best_objectives = objectives.clone()
+        active = torch.ones(len(base), dtype=torch.bool, device=base.device)
+        self.iterations = torch.zeros(len(base), dtype=torch.long)
+
+        for step in range(self.steps + 1):
+            idxs = active.nonzero()[:,0]
+            if len(idxs) == 0:
+                break
+            x = poisons[idxs].requires_grad_()
+            dists = ((extractor(x) - target_feats)**2).sum(1)
+            grad, = torch.autograd.grad(dists.sum(), x)
+
+            with torch.no_grad():
+                x_base = base[idxs]
+                new_objectives = dists + beta * ((x - x_base)**2).reshape(len(x), -1).sum(1)
+
+                # keep the best iterate of each poison
+                improved = new_objectives < best_objectives[idxs]
+                best_poisons[idxs[improved]] = x[improved]
+                best_objectives[idxs[improved]] = new_objectives[improved]
+
+                # early stopping of the poisons which stopped improving (no 
+                # further step is taken from their current iterate)
+                active[idxs] = new_objectives < (1 - self.tol) * objectives[idxs]
+                objectives[idxs] = new_objectives
+                if step == self.steps:
+                    break
+                stepped = active[idxs]
+                idxs, x, grad, x_base = idxs[stepped], x[stepped], grad[stepped], x_base[stepped]
+
+                # forward step on the feature collision term and backward 
+                # (proximal) step on the input space term
+                x = x - self.lr * grad
+                x = (x + self.lr * beta * x_base) / (1 + self.lr * beta)
+                if bounds is not None:
+                    x = x.clamp(*bounds)
+                poisons[idxs] = x
+                self.iterations[idxs.cpu()] += 1
+
+        with torch.no_grad():
+            self.feature_distances = ((extractor(best_poisons) - target_feats)**2).sum(1).sqrt().cpu()
+
+        return best_poisons.detach()
+
+    def attack(self, X, y, model):
+        """Attacks batch of input data by replacing base images with poisons.
+
+        Args:
+            X (array) : data
+            y (array/list) : labels
+            model (torch.nn.Module) : model being trained
+
+        Returns:
+            X (array) : data with poisoned points
+            y (array/list) : labels (unchanged)
+        """
+        og_X, og_y = X, y
+        X = _as_tensor(X)
+        labels = self.codec.to_labels(_as_tensor(y), self.one_hot)
+
+        # candidate base images
+        idxs = torch.nonzero(labels == self.base_label)[:,0]
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        self._set_source_idxs(len(X))
+        if poison_budget == 0:
+            return og_X, og_y
+
+        # poisons are crafted in the order of their positions in the batch
+        shuffler = torch.randperm(len(idxs), generator=self._torch_rng)
+        attacked_idxs = idxs[shuffler[:poison_budget].to(idxs.device)].sort()[0]
+
+        inputs, _ = self.model_inputs(model, X, _as_tensor(y))
+        target = torch.as_tensor(self.X_target).float().to(inputs.device)
+        target = target.reshape((1,) + tuple(inputs.shape[1:]))
+        extractor = self.feature_extractor(model)
+
+        was_training = model.training
+        model.eval()
+        with torch.no_grad():
+            target_feats = extractor(target)
+        bounds = (inputs.min().item(), inputs.max().item())
+        poisons = self.collide(extractor, inputs[attacked_idxs], target_feats, bounds)
+        model.train(was_training)
+
+        X[attacked_idxs] = poisons.to(X.device, X.dtype)
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return _backend(og_X).from_tensor(X), og_y
+
+
+class PGDAttacker(PerturbPointsAttacker):
+    """Perturb points to maximize the loss of the model with projected gradient descent.
+
+    At each episode, a random subset of the batch (of size given by 
+    aggressiveness) is perturbed by projected gradient ascent on the loss of 
+    the current model, with perturbations bounded in L-infinity (signed 
+    gradient steps) or L2 (normalized gradient steps) norm by eps. The 
+    perturbations are optimized with batched forward and backward passes 
+    over chunks of at most chunk_size points (to bound the memory of large 
+    models, e.g CifarClassifier), each chunk being optimized for all steps at once.
+
+    If warm_start=True, the perturbation of each point is stored (keyed by 
+    the contents of the point), such that points seen again (e.g in later 
+    epochs of a Simulator run) start from their last perturbation rather 
+    than from scratch. At most max_cached perturbations are stored, the least 
+    recently used ones being evicted first.
+
+    This strategy is inspired by the following paper: "Towards Deep Learning 
+    Models Resistant to Adversarial Attacks", https://arxiv.org/abs/1706.06083.
+
+    Args:
+        aggressiveness (float) : determine max number of points to poison
+        eps (float) : maximum norm of the perturbations
+        steps (int) : number of optimization steps of the perturbations per episode
+        lr (float) : step size of the gradient ascent (Default = 2.5 * eps / steps)
+        norm (str) : norm of the perturbations, "linf" or "l2" (Default = "linf")
+        chunk_size (int) : (optional) maximum number of points per forward/backward 
+                           pass (Default = all perturbed points at once)
+        warm_start (bool) : start from the last perturbation of points seen before
+        max_cached (int) : maximum number of stored perturbations (Default = 10000)
+        label (label) : (optional) only poison points with this label
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, aggressiveness=0.1, eps=0.1, steps=10, lr=None, norm='linf', 
+                 chunk_size=None, warm_start=True, max_cached=10000, label=None, 
+                 one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        if norm not in ['linf', 'l2']:
+            raise ValueError("norm must be 'linf' or 'l2'.")
+        if not max_cached > 0:
+            raise ValueError('max_cached must be > 0.')
+        self.eps = eps
+        self.steps = steps
+        self.lr = lr if lr is not None else 2.5 * eps / steps
+        self.norm = norm
+        self.chunk_size = chunk_size
+        self.warm_start = warm_start
+        self.max_cached = max_cached
+        self.label = label
+
+        #last perturbation of each point (keyed by the hash of the point), 
+        #in least-recently-used order
+        self.perturbations = OrderedDict()
+
+    def perturb(self, model, X, y, perts, bounds=None):
+        """Optimize the perturbations of points by projected gradient ascent.
+
+        Args:
+            model (torch.nn.Module) : model whose loss is maximized
+            X (torch.Tensor) : points to perturb
+            y (torch.Tensor) : labels of the points
+            perts (torch.Tensor) : initial perturbations
+            bounds (tuple) : (optional) minimum and maximum value of the data
+
+        Returns:
+            perts (torch.Tensor) : optimized perturbations
+        """
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+        chunk_size = self.chunk_size or len(X)
+        perts = self.project(perts, X, self.eps, bounds, self.norm)
+
+        for start in range(0, len(X), chunk_size):
+            X_chunk, y_chunk = X[start:start + chunk_size], y[start:start + chunk_size]
+            chunk = perts[start:start + chunk_size].clone().requires_grad_()
+            for _ in range(self.steps):
+                loss = loss_func(model.forward(X_chunk + chunk), y_chunk)
+                grad, = torch.autograd.grad(loss, chunk)
+                with torch.no_grad():
+                    if self.norm == 'l2':
+                        norms = grad.reshape(len(grad), -1).norm(dim=1).clamp_min(1e-12)
+                        chunk += self.lr * grad / norms.reshape((-1,) + (1,) * (grad.dim() - 1))
+                    else:
+                        chunk += self.lr * grad.sign()
+                    chunk.copy_(self.project(chunk, X_chunk, self.eps, bounds, self.norm))
+            perts[start:start + chunk_size] = chunk.detach()
+
+        return perts
+
+    def _keys(self, X):
+        """Get the keys of points in the stored perturbations."""
+        return [hash(point.tobytes()) for point in _as_numpy(X).reshape(len(X), -1)]
+
+    def attack(self, X, y, model):
+        """Attacks batch of input data by perturbing.
+
+        Args:
+            X (array) : data
+            y (array/list) : labels
+            model (torch.nn.Module) : model being trained
+
+        Returns:
+            X (array) : data with poisoned points
+            y (array/list) : labels
+        """
+        og_X, og_y = X, y
+        X = _as_tensor(X)
+        labels = self.codec.to_labels(_as_tensor(y), self.one_hot)
+
+        # candidate points to be poisoned
+        if self.label is None:
+            idxs = torch.arange(len(X), device=labels.device)
+        else:
+            idxs = torch.nonzero(labels == self.label)[:,0]
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        self._set_source_idxs(len(X))
+        if poison_budget == 0:
+            return og_X, og_y
+
+        shuffler = torch.randperm(len(idxs), generator=self._torch_rng)
+        attacked_idxs = idxs[shuffler[:poison_budget].to(idxs.device)]
+
+        inputs, targets = self.model_inputs(model, X, _as_tensor(y))
+        bounds = (inputs.min().item(), inputs.max().item())
+        inputs, targets = inputs[attacked_idxs], targets[attacked_idxs]
+
+        # warm-start the perturbations of points seen before
+        perts = torch.zeros_like(inputs)
+        if self.warm_start:
+            keys = self._keys(X[attacked_idxs])
+            for i, key in enumerate(keys):
+                if key in self.perturbations:
+                    perts[i] = self.perturbations[key].to(perts.device)
+                    self.perturbations.move_to_end(key)
+
+        was_training = model.training
+        model.eval()
+        perts = self.perturb(model, inputs, targets, perts, bounds)
+        model.train(was_training)
+
+        if self.warm_start:
+            self.perturbations.update(zip(keys, perts.cpu()))
+            while len(self.perturbations) > self.max_cached:
+                self.perturbations.popitem(last=False) #evict least-recently-used perturbation
+
+        X[attacked_idxs] = (inputs + perts).to(X.device, X.dtype)
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return _backend(og_X).from_tensor(X), og_y
+
+
+class UniversalPerturbationAttacker(PerturbPointsAttacker):
+    """Perturb points with a single perturbation shared across all episodes.
+
+    The attacker keeps one universal perturbation delta (of the shape of a 
+    point), bounded in L-infinity or L2 norm by eps, which is added to a 
+    random subset of each batch (of size given by aggressiveness). Rather 
+    than searching for perturbations from scratch at every episode (e.g as 
+    BrewPoison does), delta is refined with a few steps of projected gradient 
+    ascent on the loss of the current model on the perturbed points (or 
+    descent on the loss of the adversarial label if adv_label is given), 
+    each step being a single batched forward and backward pass. The search 
+    is hence amortized over the episodes of a Simulator run.
+
+    This strategy is inspired by the following paper: "Universal adversarial 
+    perturbations", https://arxiv.org/abs/1610.08401.
+
+    Args:
+        aggressiveness (float) : determine max number of points to poison
+        eps (float) : maximum norm of the perturbation
+        steps (int) : number of refinement steps of the perturbation per episode
+        lr (float) : step size of the refinement steps (Default = eps / 4)
+        norm (str) : norm of the perturbation, "linf" or "l2" (Default = "linf")
+        adv_label (label) : (optional) label the perturbed points should be 
+                            classified as (Default = maximize the loss on their labels)
+        label (label) : (optional) only poison points with this label
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, aggressiveness=0.1, eps=0.1, steps=2, lr=None, norm='linf', 
+                 adv_label=None, label=None, one_hot=False, seed=None):
+        super().__init__(aggressiveness, one_hot, seed)
+        if norm not in ['linf', 'l2']:
+            raise ValueError("norm must be 'linf' or 'l2'.")
+        self.eps = eps
+        self.steps = steps
+        self.lr = lr if lr is not None else eps / 4
+        self.norm = norm
+        self.adv_label = adv_label
+        self.label = label
+
+        #universal perturbation and loss of the perturbed points at each episode
+        self.delta = None
+        self.losses = []
+
+    def apply(self, X, bounds=None):
+        """Add the universal perturbation to points.
+
+        Args:
+            X (torch.Tensor) : points to perturb
+            bounds (tuple) : (optional) minimum and maximum value of the data
+
+        Returns:
+            X (torch.Tensor) : perturbed points
+        """
+        X = X + self.delta.to(X.device, X.dtype)
+        return X if bounds is None else X.clamp(*bounds)
+
+    def refine(self, model, X, y, bounds=None):
+        """Refine the universal perturbation with projected gradient steps.
+
+        Args:
+            model (torch.nn.Module) : model being trained
+            X (torch.Tensor) : points to perturb
+            y (torch.Tensor) : labels of the points
+            bounds (tuple) : (optional) minimum and maximum value of the data
+        """
+        loss_func = getattr(model, 'loss_func', torch.nn.functional.cross_entropy)
+        sign = 1 if self.adv_label is None else -1
+        if self.adv_label is not None:
+            y = torch.full_like(y, self.adv_label)
+
+        delta = self.delta.to(X.device, X.dtype).requires_grad_()
+        for _ in range(self.steps):
+            loss = loss_func(model.forward((X + delta).clamp(*bounds) if bounds else X + delta), y)
+            grad, = torch.autograd.grad(loss, delta)
+            with torch.no_grad():
+                if self.norm == 'l2':
+                    delta += sign * self.lr * grad / grad.norm().clamp_min(1e-12)
+                else:
+                    delta += sign * self.lr * grad.sign()
+                delta.copy_(self.project(delta[None], X, self.eps, norm=self.norm)[0])
+
+        with torch.no_grad():
+            self.losses.append(loss_func(model.forward(self.apply(X, bounds)), y).item())
+        self.delta = delta.detach().cpu()
+
+    def attack(self, X, y, model):
+        """Attacks batch of input data by adding the refined universal perturbation.
+
+        Args:
+            X (array) : data
+            y (array/list) : labels
+            model (torch.nn.Module) : model being trained
+
+        Returns:
+            X (array) : data with poisoned points
+            y (array/list) : labels
+        """
+        og_X, og_y = X, y
+        X = _as_tensor(X)
+        labels = self.codec.to_labels(_as_tensor(y), self.one_hot)
+
+        # candidate points to be poisoned
+        if self.label is None:
+            idxs = torch.arange(len(X), device=labels.device)
+        else:
+            idxs = torch.nonzero(labels == self.label)[:,0]
+        poison_budget = min(int(len(X) * self.aggressiveness), len(idxs))
+        self._set_source_idxs(len(X))
+        if poison_budget == 0:
+            return og_X, og_y
+
+        shuffler = torch.randperm(len(idxs), generator=self._torch_rng)
+        attacked_idxs = idxs[shuffler[:poison_budget].to(idxs.device)]
+
+        inputs, targets = self.model_inputs(model, X, _as_tensor(y))
+        bounds = (inputs.min().item(), inputs.max().item())
+        inputs, targets = inputs[attacked_idxs], targets[attacked_idxs]
+        if self.delta is None:
+            self.delta = torch.zeros(inputs.shape[1:])
+
+        was_training = model.training
+        model.eval()
+        self.refine(model, inputs, targets, bounds)
+        model.train(was_training)
+
+        X[attacked_idxs] = self.apply(inputs, bounds).to(X.device, X.dtype)
+        self._set_source_idxs(len(X), attacked_idxs)
+
+        return _backend(og_X).from_tensor(X), og_y
+
+
+class PoisonPoolAttacker(AddPointsAttacker):
+    """ Inject points from a precomputed pool of poisons into the episodes.
+
+    Poisons that don't depend on the model being trained (e.g crafted against 
+    a fixed surrogate model) can be generated offline with build_pool(), which 
+    optionally splits the generation across a process pool and stores the pool
+    on disk as .npy files described by a JSON manifest. The attacker then streams
+    the poisons of the pool (loaded with from_manifest(), memory-mapped by default)
+    into the episodes according to a budget schedule, such that the cost of the 
+    attack in the online loop is only that of adding the points to the batch. 
+
+    The budget schedule determines the number of poisons injected at each episode:
+        int : same number of poisons at every episode,
+        float : fraction of the number of points in the batch,
+        list : number of poisons at each episode (none after the end of the list),
+        callable : function of (episode, batch_size) returning the number of poisons.
+    Each poison is injected at most once, so no more poisons are injected once 
+    the pool is exhausted.
+
+    Args:
+        X_pool (np.ndarray) : poisoned data
+        y_pool (np.ndarray) : labels of poisoned data
+        budget (int, float, list, callable) : budget schedule (see above)
+        shuffle (bool) : stream the pool in a random order (Default = True)
+        one_hot (bool) : tells if labels are one_hot encoded or not
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, X_pool, y_pool, budget=0.1, shuffle=True, one_hot=False, seed=None):
+        super().__init__(budget, one_hot, seed)
+        if len(X_pool) != len(y_pool):
+            raise ValueError('X_pool and y_pool must contain the same number of points.')
+        self.X_pool = X_pool
+        self.y_pool = y_pool
+        self.budget = budget
+        self.episode = 0
+
+        #order in which the poisons are streamed and position in the stream
+        self._order = self._rng.permutation(len(X_pool)) if shuffle else np.arange(len(X_pool))
+        self._cursor = 0
+
+    @staticmethod
+    def build_pool(generate_fn, tasks, dirname='poison_pool', num_workers=1):
+        """ Generate a pool of poisons and store it on disk.
+
+        The poisons are generated by calling generate_fn on each task (e.g a 
+        chunk of base points or a seed), in parallel across num_workers processes 
+        if num_workers > 1 (in which case generate_fn and the tasks must be 
+        picklable, e.g generate_fn defined at module level).
+
+        Args:
+            generate_fn (callable) : function of a task returning poisoned data 
+                                     and labels (X_poison, y_poison)
+            tasks (iterable) : tasks to generate poisons for
+            dirname (str) : name of the directory to store the pool in. If the 
+                            directory doesn't exist, it is created
+            num_workers (int) : number of worker processes (Default = 1, no process pool)
+
+        Returns:
+            manifest_path (str) : path to the JSON manifest of the pool
+        """
+        if num_workers > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                chunks = list(executor.map(generate_fn, tasks))
+        else:
+            chunks = [generate_fn(task) for task in tasks]
+
+        X_pool = np.concatenate([_as_numpy(X_chunk) for X_chunk, _ in chunks], axis=0)
+        y_pool = np.concatenate([_as_numpy(y_chunk) for _, y_chunk in chunks], axis=0)
+
+        os.makedirs(dirname, exist_ok=True)
+        np.save(os.path.join(dirname, 'X_pool.npy'), X_pool)
+        np.save(os.path.join(dirname, 'y_pool.npy'), y_pool)
+
+        manifest = {'num_points': len(X_pool), 
+                    'X': {'file': 'X_pool.npy', 'shape': list(X_pool.shape), 'dtype': str(X_pool.dtype)},
+                    'y': {'file': 'y_pool.npy', 'shape': list(y_pool.shape), 'dtype': str(y_pool.dtype)}}
+        manifest_path = os.path.join(dirname, 'manifest.json')
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+
+        return manifest_path
+
+    @classmethod
+    def from_manifest(cls, manifest_path, budget=0.1, mmap=True, **kwargs):
+        """ Instantiate the attacker with a pool stored on disk by build_pool().
+
+        Args:
+            manifest_path (str) : path to the JSON manifest of the pool
+            budget (int, float, list, callable) : budget schedule
+            mmap (bool) : memory-map the pool rather than loading it in memory
+            kwargs : additional arguments of the constructor (e.g seed)
+
+        Returns:
+            attacker (PoisonPoolAttacker) : attacker streaming the stored pool
+        """
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        dirname = os.path.dirname(manifest_path)
+        mmap_mode = 'r' if mmap else None
+        X_pool = np.load(os.path.join(dirname, manifest['X']['file']), mmap_mode=mmap_mode)
+        y_pool = np.load(os.path.join(dirname, manifest['y']['file']), mmap_mode=mmap_mode)
+        if len(X_pool) != manifest['num_points'] or len(y_pool) != manifest['num_points']:
+            raise ValueError(f'Pool files do not match manifest {manifest_path}.')
+
+        return cls(X_pool, y_pool, budget=budget, **kwargs)
+
+    def num_pts_to_add(self, x):
+        """ Calculate the number of poisons to inject in the current episode 
+            according to the budget schedule (limited by the poisons left in the pool).
+        
+        Args:
+            x (array) : data
+        
+        Returns:
+            num_to_add (int) : number of poisons to inject
+        """
+        if callable(self.budget):
+            num_to_add = self.budget(self.episode, len(x))
+        elif isinstance(self.budget, (list, tuple)):
+            num_to_add = self.budget[self.episode] if self.episode < len(self.budget) else 0
+        elif isinstance(self.budget, float):
+            num_to_add = math.floor(len(x) * self.budget)
+        else:
+            num_to_add = self.budget
+
+        return max(0, min(int(num_to_add), len(self._order) - self._cursor))
+
+    def attack(self, x, y):
+        """ Inject the next poisons of the pool into the batch.
+        
+        Args:
+            x (array) : data
+            y (array) : labels
+        
+        Returns:
+            x (array) : data with injected poisons
+            y (array) : labels with injected poisons
+        """
+        num_to_add = self.num_pts_to_add(x)
+        self.episode += 1
+
+        # read poisons in storage order (contiguous reads for memory-mapped pools)
+        idxs = np.sort(self._order[self._cursor:self._cursor + num_to_add])
+        self._cursor += num_to_add
+
+        x_add = _backend(x).asarray(self.X_pool[idxs], like=x)
+        y_add = _backend(y).asarray(self.y_pool[idxs], like=y)
+
+        return super().add_points(x, y, x_add, y_add)
+
+
+class AttackerGroup(Attacker):
+    """ Class allowing the grouping of attackers through an input list containing 
+    attacker objects, such that several adversaries can attack the same episode.
+
+    The attackers are applied in the order of attacker_list, each receiving the
+    output of the previous one (as NumPy arrays or PyTorch tensors, whichever 
+    the batch is, since attackers run natively on both). If probabilities are 
+    given, each attacker only attacks an episode with its probability, which 
+    randomly mixes the attackers across episodes. If budgets are given, each 
+    attacker only sees a random subset of the (current) batch with a size given
+    by its budget, with the rest of the batch passed on untouched. The attacked
+    points are written back at their original positions in the batch (or, if 
+    the attacker adds or removes points, randomly mixed into the batch).
+
+    The positions of the output points in the input batch are tracked in 
+    source_idxs (-1 for new or modified points) by composing the source_idxs
+    reported by the attackers. If any applied attacker doesn't report them, 
+    source_idxs is None.
+
+    Args:
+        attacker_list (list) : List containing attacker objects
+        probabilities (list) : (optional) probability of each attacker attacking 
+                               an episode (Default = all attackers attack every episode)
+        budgets (list) : (optional) fraction of the batch each attacker can attack, 
+                         None for the whole batch (Default = whole batch for all attackers)
+        seed (int) : (optional) seed for the random number generators
+    """
+    def __init__(self, attacker_list: list, probabilities=None, budgets=None, seed=None):
+        super().__init__(seed)
+        if not all(isinstance(attacker, Attacker) for attacker in attacker_list):
+            raise TypeError('Attackers in attacker_list must inherit from abstract Attacker object.')
+        if probabilities is None:
+            probabilities = [1.0] * len(attacker_list)
+        if budgets is None:
+            budgets = [None] * len(attacker_list)
+        if not len(probabilities) == len(budgets) == len(attacker_list):
+            raise ValueError('Probabilities and budgets must be given for every attacker.')
+        if not all(0 <= prob <= 1 for prob in probabilities):
+            raise ValueError('Probabilities must be in [0, 1].')
+        if not all(budget is None or 0 <= budget <= 1 for budget in budgets):
+            raise ValueError('Budgets must be None or in [0, 1].')
+
+        self.attacker_list = attacker_list
+        self.probabilities = probabilities
+        self.budgets = budgets
+
+    def attack_args(self):
+        """ Get the arguments of the .attack() methods of the attackers (other 
+            than the episode inputs X and labels y), in the format returned by 
+            inspect.getargspec() (used by Simulator to check arguments).
+        
+        Returns:
+            args (list) : arguments of the group .attack() method
+            defaults (tuple) : default values of the arguments (None)
+        """
+        args = ['self', 'X', 'y']
+        for attacker in self.attacker_list:
+            spec = inspect.getfullargspec(attacker.attack)
+            num_required = len(spec.args) - len(spec.defaults or ())
+            args += [arg for arg in spec.args[3:num_required] if arg not in args]
+        return args, None
+
+    def attack(self, X, y, **input_kwargs):
+        """ Group attack method, where the .attack() method of each attacker in 
+            attacker_list is called on the batch (or its budgeted subset).
+
+        Args:
+            X (np.ndarray, torch.Tensor) : data
+            y (np.ndarray, torch.Tensor) : labels
+            input_kwargs : extra arguments for the .attack() methods of the attackers
+                           (e.g model), each attacker receiving the ones it accepts.
+            
+        Returns:
+            X (np.ndarray, torch.Tensor) : attacked data
+            y (np.ndarray, torch.Tensor) : attacked labels
+        """
+        self.source_idxs = np.arange(len(X))
+        applied = self._rng.random(len(self.attacker_list)) < np.asarray(self.probabilities)
+
+        for attacker, budget, apply in zip(self.attacker_list, self.budgets, applied):
+            if not apply:
+                continue
+
+            kwargs = inspect.getfullargspec(attacker.attack).args
+            kwargs = {key: value for key, value in input_kwargs.items() if key in kwargs}
+
+            if budget is None:
+                attacker.source_idxs = None
+                X, y = attacker.attack(X, y, **kwargs)
+                self._compose_sources(attacker.source_idxs)
+                continue
+
+            # attack a random subset of the batch and pass the rest on untouched
+            backend = _backend(X)
+            shuffler = _as_numpy(backend.permutation(self, len(X)))
+            num_attacked = int(round(budget * len(X)))
+            subset, rest = shuffler[:num_attacked], shuffler[num_attacked:]
+            
+            attacker.source_idxs = None
+            X_subset, y_subset = attacker.attack(X[subset], y[subset], **kwargs)
+            subset_sources = None
+            if attacker.source_idxs is not None:
+                subset_sources = np.where(attacker.source_idxs >= 0, 
+                                          subset[attacker.source_idxs], -1)
+
+            if len(X_subset) == len(subset):
+                # write the attacked points back at their original positions
+                X, y = backend.copy(X), _backend(y).copy(y)
+                X[subset], y[subset] = X_subset, y_subset
+                sources = None
+                if subset_sources is not None:
+                    sources = np.arange(len(X))
+                    sources[subset] = subset_sources
+            else:
+                # points were added or removed, so mix them into the rest of the batch
+                order = _as_numpy(backend.permutation(self, len(rest) + len(X_subset)))
+                X = _concatenate([X[rest], X_subset])[order]
+                y = _concatenate([y[rest], y_subset])[order]
+                sources = None
+                if subset_sources is not None:
+                    sources = np.concatenate([rest, subset_sources])[order]
+            self._compose_sources(sources)
+
+        return X, y
+
+    def _compose_sources(self, sources):
+        """ Compose the positions of the points output by an attacker with the
+            positions tracked so far by the group.
+
+        Args:
+            sources (np.ndarray) : positions of the output points in the attacker's 
+                                   input batch (-1 for new or modified points), 
+                                   None if unknown
+        """
+        if self.source_idxs is None or sources is None:
+            self.source_idxs = None
+        else:
+            self.source_idxs = np.where(sources >= 0, self.source_idxs[sources], -1)
+
+
+class _NumpyBackend():
+    """ Array operations used by the attackers on NumPy arrays. Random draws 
+        use the np.random.Generator of the given attacker.
+    """
+    @staticmethod
+    def asarray(array, like):
+        return np.asarray(array, dtype=like.dtype)
+
+    @staticmethod
+    def as_index(array):
+        return array.astype(np.int64, copy=False)
+
+    @staticmethod
+    def index(array, like):
+        return np.asarray(array, dtype=np.int64)
+
+    @staticmethod
+    def copy(array):
+        return array.copy()
+
+    @staticmethod
+    def empty(shape, like):
+        return np.empty(shape, dtype=like.dtype)
+
+    @staticmethod
+    def zeros(shape, like):
+        return np.zeros(shape, dtype=like.dtype)
+
+    @staticmethod
+    def full(shape, value, like):
+        return np.full(shape, value, dtype=like.dtype)
+
+    @staticmethod
+    def repeat(row, n):
+        return np.repeat(row[np.newaxis], n, axis=0)
+
+    @staticmethod
+    def where(mask, a, b):
+        return np.where(mask, a, b)
+
+    @staticmethod
+    def unique(array):
+        return np.unique(array)
+
+    @staticmethod
+    def nonzero(mask):
+        return np.flatnonzero(mask)
+
+    @staticmethod
+    def searchsorted(sorted_array, values):
+        return np.searchsorted(sorted_array, values)
+
+    @staticmethod
+    def permutation(attacker, n):
+        return attacker._rng.permutation(n)
+
+    @staticmethod
+    def integers(attacker, low, high, n):
+        return attacker._rng.integers(low, high, n)
+
+    @staticmethod
+    def random(attacker, n):
+        return attacker._rng.random(n)
+
+    @staticmethod
+    def to_tensor(array):
+        return torch.as_tensor(array)
+
+    @staticmethod
+    def from_tensor(tensor):
+        return tensor.detach().cpu().numpy()
+
+
+class _TorchBackend():
+    """ Array operations used by the attackers on PyTorch tensors. Random draws 
+        use the torch.Generator of the given attacker.
+    """
+    @staticmethod
+    def asarray(array, like):
+        return torch.as_tensor(array, dtype=like.dtype, device=like.device)
+
+    @staticmethod
+    def as_index(array):
+        return array.long()
+
+    @staticmethod
+    def index(array, like):
+        return torch.as_tensor(array, dtype=torch.long, device=like.device)
+
+    @staticmethod
+    def copy(array):
+        return array.clone()
+
+    @staticmethod
+    def empty(shape, like):
+        return torch.empty(shape, dtype=like.dtype, device=like.device)
+
+    @staticmethod
+    def zeros(shape, like):
+        return torch.zeros(shape, dtype=like.dtype, device=like.device)
+
+    @staticmethod
+    def full(shape, value, like):
+        return torch.full(shape, value, dtype=like.dtype, device=like.device)
+
+    @staticmethod
+    def repeat(row, n):
+        return row.unsqueeze(0).expand((n,) + tuple(row.shape)).clone()
+
+    @staticmethod
+    def where(mask, a, b):
+        return torch.where(torch.as_tensor(mask, device=a.device), a, b)
+
+    @staticmethod
+    def unique(array):
+        return torch.unique(array)
+
+    @staticmethod
+    def nonzero(mask):
+        return mask.nonzero()[:,0]
+
+    @staticmethod
+    def searchsorted(sorted_array, values):
+        return torch.searchsorted(sorted_array, values.contiguous())
+
+    @staticmethod
+    def permutation(attacker, n):
+        return torch.randperm(n, generator=attacker._torch_rng)
+
+    @staticmethod
+    def integers(attacker, low, high, n):
+        return torch.randint(low, high, (n,), generator=attacker._torch_rng)
+
+    @staticmethod
+    def random(attacker, n):
+        return torch.rand(n, generator=attacker._torch_rng)
+
+    @staticmethod
+    def to_tensor(array):
+        return array
+
+    @staticmethod
+    def from_tensor(tensor):
+        return tensor
+
+
+_NUMPY = _NumpyBackend()
+_TORCH = _TorchBackend()
+
+
+# =============================================================================
+#  FUNCTIONS
+# =============================================================================
+
+def _backend(array):
+    """ Get the array operations matching the type of the given array, such that
+        attackers run natively on NumPy arrays and PyTorch tensors without 
+        converting between them.
+    
+    Args:
+        array (np.ndarray, torch.Tensor) : array to get the operations of
+    
+    Returns:
+        backend (_NumpyBackend, _TorchBackend) : array operations
+    """
+    return _TORCH if isinstance(array, torch.Tensor) else _NUMPY
+
+
+def _as_tensor(array):
+    """ Get a detached PyTorch tensor from a NumPy array (sharing its memory) 
+        or PyTorch tensor, such that attackers working on tensors accept both. 
+        Results are converted back with _backend(array).from_tensor().
+    
+    Args:
+        array (np.ndarray, torch.Tensor, list) : array to convert
+    
+    Returns:
+        tensor (torch.Tensor) : detached tensor
+    """
+    return _backend(array).to_tensor(array).detach()
+
+
+def _as_numpy(array):
+    """ Get a NumPy array from a NumPy array or PyTorch tensor (e.g indices).
+    
+    Args:
+        array (np.ndarray, torch.Tensor) : array to convert
+    
+    Returns:
+        array (np.ndarray) : NumPy array
+    """
+    return _NUMPY.from_tensor(array) if isinstance(array, torch.Tensor) else np.asarray(array)
+
+
+def _concatenate(arrays):
+    """ Concatenate NumPy arrays or PyTorch tensors along the first dimension.
+    
+    Args:
+        arrays (list) : arrays to concatenate (all of the same type)
+    
+    Returns:
+        array (np.ndarray, torch.Tensor) : concatenated array
+    """
+    if isinstance(arrays[0], torch.Tensor):
+        return torch.cat(arrays, dim=0)
+    return np.concatenate(arrays, axis=0)
+
+
+def _flatten_grads(grads):
+    """ Flatten per-sample gradients of the parameters of a model into a 
+        single (num_samples, num_params) tensor.
+    
+    Args:
+        grads (dict) : per-sample gradients of each parameter (dim 0 = sample)
+    
+    Returns:
+        grads (torch.Tensor) : flattened per-sample gradients
+    """
+    return torch.cat([grad.reshape(len(grad), -1) for grad in grads.values()], dim=1)
+
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================    
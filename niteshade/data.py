@@ -10,6 +10,9 @@ Classes and functions pertaining to the loading and batching of data.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 
+import uuid
+from multiprocessing import shared_memory, resource_tracker
+
 import numpy as np
 import torch
 
@@ -89,6 +92,18 @@ class DataLoader:
             raise StopIteration
         return X, y
 
+    def peek(self, n=1):
+        """ Return the next n batches in the queue without removing them.
+
+        Args:
+            n (int) : number of batches to look ahead
+
+        Returns:
+            batches (list) : list of (X, y) tuples of the next batches (fewer 
+                than n if there are less than n batches in the queue)
+        """
+        return self._queue[:n]
+
     def __str__(self):
         """ Represent the class instance as a string. """
         return f"DataLoader object with batch size {self.batch_size}"
@@ -157,6 +172,251 @@ class DataLoader:
             self._queue.append((X, y))
 
 
+class SharedArray:
+    """ Handle to an array placed in shared memory by a DatasetRegistry.
+
+    Handles are lightweight: pickling one (e.g when passing it to a worker of 
+    a process pool) only serialises the name, shape and dtype of the shared 
+    memory block, not its contents. The data is attached lazily the first time
+    the array attribute is accessed in a process, and the returned array (or 
+    tensor) is a view on the shared memory block, so no copy is made. 
+
+    Handles may be passed directly to Simulator, OutlierDefender/KNN_Defender 
+    (as initial datasets) and the PostProcessor evaluation methods (as test 
+    sets) in place of NumPy arrays/PyTorch tensors.
+
+    **NOTE**: The views are writable and shared by all processes, so in-place 
+    modifications are visible everywhere.
+    """
+    def __init__(self, name, shape, dtype, is_tensor=False):
+        """ Initialise the handle.
+
+        Args:
+            name (str) : name of the shared memory block
+            shape (tuple) : shape of the array
+            dtype (np.dtype) : data type of the array
+            is_tensor (bool) : whether the array should be returned as a tensor
+        """
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.is_tensor = is_tensor
+        self._array = None
+
+    def __getstate__(self):
+        """ Only pickle the metadata of the handle (not the attached data). """
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype, 
+                'is_tensor': self.is_tensor}
+
+    def __setstate__(self, state):
+        """ Restore the metadata of the handle; data is attached lazily. """
+        self.__dict__.update(state)
+        self._array = None
+
+    def __len__(self):
+        """ Returns the length of the first dimension of the array. """
+        return self.shape[0]
+
+    def __str__(self):
+        """ Represent the class instance as a string. """
+        return f"SharedArray {self.name} with shape {self.shape} and dtype {self.dtype}"
+
+    @property
+    def array(self):
+        """ View on the shared memory block (np.ndarray or torch.tensor). """
+        if self._array is None:
+            shm = _attach_block(self.name)
+            array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+            self._array = torch.from_numpy(array) if self.is_tensor else array
+        return self._array
+
+    def close(self):
+        """ Detach the shared memory block from this handle. 
+        
+        The block is unmapped from the process once all the handles attached 
+        to it in the process have been closed. 
+        """
+        if self._array is not None:
+            self._array = None
+            _detach_block(self.name)
+
+
+class DatasetRegistry:
+    """ Registry placing datasets in POSIX shared memory.
+
+    When several simulators run concurrently in separate processes (e.g on 
+    top of a process pool), passing them the same NumPy arrays/PyTorch tensors
+    pickles and copies the data once per process. Registering the arrays 
+    instead places them in shared memory once, and the lightweight SharedArray
+    handles returned by the registry can be sent to the processes at virtually
+    no cost.
+
+    Datasets are reference-counted: registering a dataset sets its count to 
+    1, .acquire() increments it and .release() decrements it. When the count 
+    reaches 0, the shared memory blocks of the dataset are released. Any 
+    remaining datasets are released when .close() is called or when the 
+    registry is used as a context manager and the context is exited. The 
+    registry must live in the process that registered the datasets for as 
+    long as they are used by other processes.
+    """
+    def __init__(self):
+        """ Initialise an empty registry. """
+        self._datasets = {}
+        self._blocks = {}
+        self._refcounts = {}
+
+    def __enter__(self):
+        """ Return the registry when entering a context. """
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Release all the datasets when exiting a context. """
+        self.close()
+
+    def __contains__(self, key):
+        """ Check if a dataset is registered under key. """
+        return key in self._datasets
+
+    def __len__(self):
+        """ Returns the number of registered datasets. """
+        return len(self._datasets)
+
+    def register(self, key, *arrays):
+        """ Place arrays in shared memory under a dataset key.
+
+        Args:
+            key (str) : name of the dataset (e.g "cifar_train")
+            arrays (np.ndarray or torch.tensor) : arrays to share (e.g X and y)
+
+        Returns:
+            handles (tuple) : one SharedArray handle per array
+        """
+        if key in self._datasets:
+            raise KeyError(f"A dataset is already registered under the key '{key}'.")
+
+        handles = []
+        for array in arrays:
+            is_tensor = isinstance(array, torch.Tensor)
+            if is_tensor:
+                array = array.detach().cpu().numpy()
+            elif not isinstance(array, np.ndarray):
+                raise TypeError("Niteshade only supports NumPy arrays and PyTorch tensors.")
+
+            name = f"niteshade_{uuid.uuid4().hex[:16]}"
+            shm = shared_memory.SharedMemory(name=name, create=True, 
+                                             size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+            shared[...] = array
+            self._blocks[name] = shm
+            _owned_blocks[name] = shm
+            handles.append(SharedArray(name, array.shape, array.dtype, is_tensor))
+
+        self._datasets[key] = tuple(handles)
+        self._refcounts[key] = 1
+
+        return self._datasets[key]
+
+    def acquire(self, key):
+        """ Get the handles of a dataset and increment its reference count.
+
+        Args:
+            key (str) : name of the dataset
+
+        Returns:
+            handles (tuple) : SharedArray handles of the dataset
+        """
+        self._refcounts[key] += 1
+        return self._datasets[key]
+
+    def release(self, key):
+        """ Decrement the reference count of a dataset, releasing its shared 
+        memory blocks when the count reaches 0.
+
+        Args:
+            key (str) : name of the dataset
+        """
+        self._refcounts[key] -= 1
+        if self._refcounts[key] > 0:
+            return
+
+        for handle in self._datasets.pop(key):
+            handle.close()
+            shm = self._blocks.pop(handle.name)
+            del _owned_blocks[handle.name]
+            _attached_blocks.pop(handle.name, None)
+            _close_block(shm)
+            shm.unlink()
+        del self._refcounts[key]
+
+    def close(self):
+        """ Release all the registered datasets regardless of their counts. """
+        for key in list(self._datasets):
+            self._refcounts[key] = 1
+            self.release(key)
+
+
+# =============================================================================
+#  FUNCTIONS
+# =============================================================================
+
+# shared memory blocks created by registries in this process: name -> SharedMemory
+_owned_blocks = {}
+
+# shared memory blocks attached in this process: name -> [SharedMemory, count]
+_attached_blocks = {}
+
+def _attach_block(name):
+    """ Attach a shared memory block to this process (reference-counted). """
+    if name not in _attached_blocks:
+        if name in _owned_blocks:
+            shm = _owned_blocks[name]
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            # Attaching registers the block with the resource tracker of this 
+            # process, which would unlink it when the process exits; the block 
+            # is owned by the registry so it is unregistered here
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        _attached_blocks[name] = [shm, 0]
+    _attached_blocks[name][1] += 1
+    return _attached_blocks[name][0]
+
+
+def _detach_block(name):
+    """ Detach a shared memory block from this process once unused. """
+    _attached_blocks[name][1] -= 1
+    if _attached_blocks[name][1] == 0:
+        shm, _ = _attached_blocks.pop(name)
+        if name not in _owned_blocks:
+            _close_block(shm)
+
+
+def _close_block(shm):
+    """ Unmap a shared memory block, unless arrays still point to it (in 
+    which case it is unmapped when they are garbage collected). """
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+def resolve_array(array_like):
+    """ Get the array behind a SharedArray handle. 
+    
+    Args:
+        array_like (SharedArray, np.ndarray or torch.tensor) : array or handle
+
+    Returns:
+        array (np.ndarray or torch.tensor) : array_like if it is not a handle,
+            else the view on the shared memory block
+    """
+    if isinstance(array_like, SharedArray):
+        return array_like.array
+    return array_like
+
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
@@ -18,7 +18,12 @@ from xmlrpc.client import boolean
 
 import numpy as np
 import torch
-from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neighbors import NearestNeighbors
+from sklearn.metrics.pairwise import euclidean_distances
+
+from niteshade.data import resolve_array
+from niteshade.models import cached_forward
+from niteshade.utils import LabelCodec
 
 # =============================================================================
 #  CLASSES
@@ -171,7 +176,7 @@ class Defender(ABC):
     """ Abstractclass that the defenders use.
     """ 
     def __init__(self) -> None:
-        pass
+        self.codec = LabelCodec() # Encodes/decodes one-hot labels (caching the number of classes)
     
     @abstractmethod
     def defend(self):
@@ -194,21 +199,27 @@ class OutlierDefender(Defender):
     """ Abstractclass for defenders that use a outlier filtering strategy.
 
         Args: 
-            initial_dataset_x (np.ndarray, torch.Tensor) : point data (shape (batch_size, data dimensionality)).
-            initial_dataset_y (np.ndarray, torch.Tensor) : label data (shape (batch_size, )).
+            initial_dataset_x (np.ndarray, torch.Tensor, SharedArray) : point data (shape (batch_size, data dimensionality)).
+            initial_dataset_y (np.ndarray, torch.Tensor, SharedArray) : label data (shape (batch_size, )).
     
     """ 
     def __init__(self, initial_dataset_x, initial_dataset_y) -> None:
         """ Initialise the OutlierDefender class using a initial dataset.
+            Shared memory handles are kept as is and resolved lazily, such that pickling 
+            the defender (e.g for a worker of a process pool) only pickles the handles.
         """
         super().__init__()
-        self._type_check(initial_dataset_x, initial_dataset_y) # Type check for initial data
-        if self._datatype == 1: # If initial data is ndarray, then no conversion
-            self._init_x = initial_dataset_x
-            self._init_y = initial_dataset_y
-        else: # If initial data is tensor, then convert to ndarray
-            self._init_x = initial_dataset_x.cpu().detach().numpy()
-            self._init_y = initial_dataset_y.cpu().detach().numpy()
+        self._type_check(resolve_array(initial_dataset_x), resolve_array(initial_dataset_y)) # Type check for initial data
+        self._initial_dataset_x = initial_dataset_x
+        self._initial_dataset_y = initial_dataset_y
+
+    @property
+    def _init_x(self): # Initial point data as ndarray
+        return _as_ndarray(resolve_array(self._initial_dataset_x))
+
+    @property
+    def _init_y(self): # Initial label data as ndarray
+        return _as_ndarray(resolve_array(self._initial_dataset_y))
 
 
 class ModelDefender(Defender):
@@ -230,41 +241,64 @@ class PointModifierDefender(Defender):
 class KNN_Defender(PointModifierDefender):
     """ A KNN  class, inheriting from the PointModifierDefender, that flips the labels 
         of input points if the proportion of the most frequent label of nearest neighbours 
-        exceeds a threshold. A SKlearn KNeighborsClassifier is used to find nearest neighbours.
+        exceeds a threshold. The nearest neighbours are found with an incremental index 
+        (see _NeighbourIndex) to which the defended points are inserted after each call, 
+        such that the cost of an episode doesn't grow with the whole history of the run.
         The KNN_Defender is an implementation of a defence strategy discussed by 
         Paudice, Andrea, et al. "Label Sanitization against Label Flipping Poisoning Attacks." 2018.
 
         Args: 
-            init_x (np.ndarray, torch.Tensor) : point data (shape (batch_size, data dimensionality))
-            init_y (np.ndarray, torch.Tensor) : label data (shape (batch_size,))
+            init_x (np.ndarray, torch.Tensor, SharedArray) : point data (shape (batch_size, data dimensionality))
+            init_y (np.ndarray, torch.Tensor, SharedArray) : label data (shape (batch_size,))
             nearest_neighbours (int) : number of nearest neighbours to use for decisionmaking
             confidence_threshold (float) : threshold to use for decisionmaking
             one_hot (boolean) : boolean to indicate if labels are one-hot or not
+            weighted (boolean) : boolean to indicate if the votes of the nearest neighbours are
+                                 weighted by the inverse of their distance (default False)
 
     """ 
     def __init__(self, init_x, init_y, nearest_neighbours: int,
-                 confidence_threshold:float, one_hot = False) -> None:
+                 confidence_threshold:float, one_hot = False, weighted = False) -> None:
         """ Constructor method of KNN_Defender class.
             If the inputs are one-hot encoded, artificial integer labels are constructed
             to use the SKlearn classifier.
         """
         super().__init__()
-        self._type_check(init_x, init_y) # Check if input data is tensor or ndarray
+        self._type_check(resolve_array(init_x), resolve_array(init_y)) # Check if input data is tensor or ndarray
         self.nearest_neighbours = nearest_neighbours
         self.confidence_threshold = confidence_threshold
         self.one_hot = one_hot
+        self.weighted = weighted
         _input_validation(self)
-        if self._datatype == 0: # If incoming data is tensor, make into ndarray
-            init_x = init_x.cpu().detach().numpy()
-            init_y = init_y.cpu().detach().numpy()
-        nr_of_datapoints = init_x.shape[0]
-        
-        self.training_dataset_x = init_x.reshape((nr_of_datapoints, -1))
-        if self.one_hot: # If one_hot, encode input labels to int-s
-            self.training_dataset_y = _label_encoding(init_y)
-        else:
-            self.training_dataset_y = init_y.reshape((nr_of_datapoints, ))
+        # Initial data (possibly shared memory handles) is only resolved when the index is 
+        # built, such that pickling the defender before its first .defend call only pickles the handles
+        self._init_data = (init_x, init_y)
+        self._index = None
 
+    @property
+    def training_dataset_x(self): # Point data seen so far (view of the index buffer)
+        return self._neighbour_index().x
+
+    @property
+    def training_dataset_y(self): # Label data seen so far (view of the index buffer)
+        return self._neighbour_index().y
+
+    def _neighbour_index(self):
+        """ Get the index of the points seen so far, building it from the initial data on first use.
+        Return:
+            index (_NeighbourIndex): index of the points seen so far
+        """
+        if self._index is None:
+            init_x, init_y = (_as_ndarray(resolve_array(array)) for array in self._init_data)
+            nr_of_datapoints = init_x.shape[0]
+            init_x = init_x.reshape((nr_of_datapoints, -1))
+            if self.one_hot: # If one_hot, encode input labels to int-s
+                init_y = self.codec.decode(init_y)
+            else:
+                init_y = init_y.reshape((nr_of_datapoints, ))
+            self._index = _NeighbourIndex(init_x, init_y)
+            self._init_data = None # The index holds its own copy of the data
+        return self._index
     
     def defend(self, datapoints, input_labels, **kwargs):
         """ The defend method for the KNN_defender.
@@ -285,88 +319,173 @@ class KNN_Defender(PointModifierDefender):
             input_labels = input_labels.cpu().detach().numpy()
         
         nr_of_datapoints = datapoints.shape[0]
-        datapoints_reshaped = datapoints.copy().reshape((nr_of_datapoints, -1)) # Reshape for KNeighborsClassifier
+        datapoints_reshaped = datapoints.copy().reshape((nr_of_datapoints, -1)) # Reshape for the neighbour index
         if self.one_hot: #Change labels if onehot
-            one_hot_length = len(input_labels[0])
-            input_labels = np.argmax(input_labels, axis = 1)
-        KNN_classifier = KNeighborsClassifier(self.nearest_neighbours) # Initiate the KNNclassifier
-        KNN_classifier.fit(self.training_dataset_x, self.training_dataset_y)
-        nearest_indeces = KNN_classifier.kneighbors(datapoints_reshaped, return_distance=False) # Get nearest nghbs indeces in the training dataset 
-        confidence_list = self._get_confidence_labels(nearest_indeces) # Get most frequent labels and confidences of nghbs
-        flipped_labels = self._confidence_flip(input_labels, confidence_list) # Flip points if confidence high enough
-        self.training_dataset_x = np.append(self.training_dataset_x, datapoints_reshaped, axis = 0)
-        self.training_dataset_y = np.append(self.training_dataset_y, flipped_labels.reshape((nr_of_datapoints, )), axis = 0)
+            input_labels = self.codec.decode(input_labels)
+        distances, nearest_indeces = self._neighbour_index().kneighbors(datapoints_reshaped, self.nearest_neighbours) # Get nearest nghbs indeces in the training dataset 
+        max_labels, confidences = self._get_confidence_labels(nearest_indeces, distances) # Get most frequent labels and confidences of nghbs
+        flipped_labels = self._confidence_flip(input_labels, max_labels, confidences) # Flip points if confidence high enough
+        self._index.insert(datapoints_reshaped, flipped_labels.reshape((nr_of_datapoints, ))) # Add points to the index
         if self.one_hot: # If onehot inputs, construct onehot output
-            flipped_labels = self._one_hot_decoding(one_hot_length, flipped_labels)
+            flipped_labels = self.codec.encode(flipped_labels)
         if self._datatype == 0: # If incoming data was tensor, make output into tensor
             datapoints = torch.tensor(datapoints)
             flipped_labels = torch.tensor(flipped_labels)
 
         return (datapoints, flipped_labels)
 
-    def _one_hot_decoding(self, one_hot_length, flipped_labels):
-        """ Construct one_hot outputs from int input labels
-        Args: 
-            one_hot_length (int): Dimensionality of one_hot_encoded outputs
-            flipped_labels (np.ndarray): label data.
-        Return:
-            output_labels (np.ndarray): one_hot_encoded label data
-        """
-        output_labels = np.zeros((flipped_labels.shape[0], one_hot_length))
-        for id, label in enumerate(flipped_labels):
-            output_labels[id][label] = 1
-        return output_labels
-
-    def _get_confidence_labels(self, indeces):
+    def _get_confidence_labels(self, indeces, distances = None):
         """ Find the most frequent label from the nearest neighbour indeces
-             and get its confidence (label_count / nr_of_nghbs)
+             and get its confidence (label_count / nr_of_nghbs) for all points at once.
+             The votes are counted with a single bincount over the (batch_size, nearest_neighbours) 
+             matrix of neighbour labels, offsetting the label codes of each point by 
+             point_idx * nr_of_labels. Ties are broken in favour of the smallest label.
+             If self.weighted, the votes are weighted by the inverse of the distances 
+             (neighbours at distance 0, if any, get all the weight).
         Args: 
-            indeces (list): list of lists, inner list contains indeces for the nearest neighbours for datapoints
-            input_labels (np.ndarray): label data.
+            indeces (np.ndarray): indeces of the nearest neighbours (shape (batch_size, nearest_neighbours))
+            distances (np.ndarray): distances to the nearest neighbours (only used if self.weighted)
         Return:
-            confidence array (np.ndarray): array of tuples where tuple[0]: most frequent label, tuple[1]: confidence of label
+            tuple (max_labels, confidences):
+                max_labels (np.ndarray): most frequent label of the neighbours of each point
+                confidences (np.ndarray): weight of the most frequent label / total weight of the neighbours
         """
-        confidence_list = []
-        for nghbs in indeces: # Loop through nearest indeces for each input point
-            label_list = []
-            for index in nghbs: # Get the labels for nearest indeces
-                label_list.append(self.training_dataset_y[index])
-            confidence_tuple = self._calculate_confidence(label_list) # Find most frequent label and calculate confidence
-            confidence_list.append(confidence_tuple)
-        return np.array(confidence_list)
+        nghb_labels = self.training_dataset_y[indeces]
+        unique_labels, codes = np.unique(nghb_labels, return_inverse = True) # Label codes in [0, nr_of_labels)
+        codes = codes.reshape(nghb_labels.shape)
+        nr_of_points, nr_of_labels = codes.shape[0], len(unique_labels)
+
+        if self.weighted:
+            with np.errstate(divide = 'ignore'):
+                weights = 1 / distances
+            exact = distances == 0
+            weights = np.where(exact.any(axis = 1, keepdims = True), exact, weights) # Exact matches get all the weight
+        else:
+            weights = np.ones(codes.shape)
+        
+        offsets = np.arange(nr_of_points).reshape(-1, 1) * nr_of_labels # Separate the votes of each point
+        votes = np.bincount((codes + offsets).ravel(), weights = weights.ravel(), 
+                            minlength = nr_of_points * nr_of_labels).reshape(nr_of_points, nr_of_labels)
+        max_codes = votes.argmax(axis = 1)
+        confidences = votes[np.arange(nr_of_points), max_codes] / votes.sum(axis = 1)
+        return unique_labels[max_codes], confidences
     
-    def _calculate_confidence(self, labels):
-        """ Find the most frequent label from a incoming list of labels
-             and get its confidence (label_count / len(label_list))
+    def _confidence_flip(self, labels, max_labels, confidences):
+        """ Flip incoming input labels if the confidence of the most frequent label of their nearest nghbs
+            is over a threshold
         Args: 
-            labels (list): list containing labels for the nearest neighbours
+            labels (np.ndarray): input labels
+            max_labels (np.ndarray): most frequent nearest nghb label of each input label
+            confidences (np.ndarray): confidence of the most frequent nearest nghb label of each input label
         Return:
-            tuple(max_label, confidence)
-                max_label (int): Most frequent label
-                confidence (float): most frequent_label_count/len(label_list)
+            labels (np.ndarray): modified input labels
         """
-        unique_labels = list(set(labels)) # Get unique labels
-        max_count = 0
-        max_label = -1
-        for label in unique_labels:
-            if list(labels).count(label)>max_count: # Find label with max count
-                max_count = list(labels).count(label)
-                max_label = label
-        return (max_label, max_count/len(labels))
-    
-    def _confidence_flip(self, labels, confidence_list):
-        """ Flip incoming input labels if the confidence of the most frequent label of their nearest nghbs
-            is over a threshold
+        flip = confidences > self.confidence_threshold # Check if confidence of most frequent nearest nghb label is high
+        return np.where(flip, max_labels, labels.reshape(-1)).astype(labels.dtype).reshape(labels.shape)
+
+
+class _NeighbourIndex:
+    """ Nearest neighbour index over a growing dataset, used by the KNN_Defender.
+        The points are stored in buffers that grow geometrically (amortized O(1) inserts).
+        The index is split into a bulk part, indexed with a SKlearn NearestNeighbors, and a 
+        delta part of recently inserted points, searched by brute force. The delta is capped 
+        at max(min_delta, delta_fraction * size of the bulk) points, the bulk index being 
+        rebuilt (on all the points) once the cap is reached. Queries hence only brute force 
+        a small delta, while the bulk grows geometrically between rebuilds (each point is 
+        re-indexed O(log n) times over a run). Neighbours are ordered by distance, ties 
+        being broken by insertion order (as a brute force search would).
+
+        Args: 
+            x (np.ndarray) : initial point data (shape (nr_of_datapoints, data dimensionality))
+            y (np.ndarray) : initial label data (shape (nr_of_datapoints,))
+            min_delta (int) : size of the delta below which the bulk index is never rebuilt
+            delta_fraction (float) : maximum size of the delta as a fraction of the bulk
+    """ 
+    def __init__(self, x, y, min_delta = 256, delta_fraction = 0.1) -> None:
+        """ Constructor method of _NeighbourIndex class.
+        """
+        self.min_delta = min_delta
+        self.delta_fraction = delta_fraction
+        self.rebuilds = 0 # Number of times the bulk index was built
+        self._x = np.empty((len(x),) + x.shape[1:], dtype = x.dtype)
+        self._y = np.empty((len(y),), dtype = y.dtype)
+        self._size = 0 # Number of points in the buffers
+        self._indexed = 0 # Number of points in the bulk index
+        self._bulk = None
+        self.insert(x, y)
+        if self._indexed < self._size:
+            self._rebuild()
+
+    @property
+    def x(self):
+        return self._x[:self._size]
+
+    @property
+    def y(self):
+        return self._y[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, x, y):
+        """ Insert points into the buffers (and into the delta part of the index).
+        Args: 
+            x (np.ndarray) : point data (shape (nr_of_datapoints, data dimensionality))
+            y (np.ndarray) : label data (shape (nr_of_datapoints,))
+        """
+        new_size = self._size + len(x)
+        x_dtype = np.result_type(self._x, x) # Upcast as np.append would
+        y_dtype = np.result_type(self._y, y)
+        if new_size > len(self._x) or x_dtype != self._x.dtype or y_dtype != self._y.dtype:
+            capacity = max(new_size, 2 * len(self._x)) # Grow buffers geometrically
+            self._x = self._grow(self._x, capacity, x_dtype)
+            self._y = self._grow(self._y, capacity, y_dtype)
+        self._x[self._size:new_size] = x
+        self._y[self._size:new_size] = y
+        self._size = new_size
+        if self._size - self._indexed >= max(self.delta_fraction * self._indexed, self.min_delta):
+            self._rebuild()
+
+    def _grow(self, buffer, capacity, dtype):
+        """ Copy the points of a buffer into a new buffer of the given capacity and dtype.
+        """
+        new_buffer = np.empty((capacity,) + buffer.shape[1:], dtype = dtype)
+        new_buffer[:self._size] = buffer[:self._size]
+        return new_buffer
+
+    def _rebuild(self):
+        """ Rebuild the bulk index on all the points.
+        """
+        if self._size > 0:
+            self._bulk = NearestNeighbors().fit(self.x)
+            self.rebuilds += 1
+        self._indexed = self._size
+
+    def kneighbors(self, datapoints, nearest_neighbours):
+        """ Find the nearest neighbours of points, merging the neighbours in the bulk index 
+            with the ones in the delta.
         Args: 
-            labels (list): list containing input labels
-            labels (list): list containing a tuple for each input label with most frequent nearest nghb label and its confidence
+            datapoints (np.ndarray) : point data (shape (batch_size, data dimensionality))
+            nearest_neighbours (int) : number of nearest neighbours to find
         Return:
-            labels (list): List of modified input labels
+            tuple (distances, indeces) :
+                distances (np.ndarray) : distances to the nearest neighbours (shape (batch_size, nearest_neighbours))
+                indeces (np.ndarray) : indeces of the nearest neighbours (shape (batch_size, nearest_neighbours))
         """
-        for idx, _ in enumerate(labels): # Loop through input labels
-            if confidence_list[idx][1]>self.confidence_threshold: # Check if confidence of most frequent nearest nghb label is high
-                labels[idx] = confidence_list[idx][0] # Flip label
-        return labels
+        if nearest_neighbours > self._size:
+            raise ValueError (f"Expected nearest_neighbours <= number of points, but the index has "
+                              f"{self._size} points and nearest_neighbours = {nearest_neighbours}.")
+        distances, indeces = [], []
+        if self._indexed > 0: # Neighbours in the bulk index
+            bulk_distances, bulk_indeces = self._bulk.kneighbors(datapoints, min(nearest_neighbours, self._indexed))
+            distances.append(bulk_distances)
+            indeces.append(bulk_indeces)
+        if self._size > self._indexed: # Neighbours in the delta (brute force)
+            distances.append(euclidean_distances(datapoints, self._x[self._indexed:self._size]))
+            indeces.append(np.broadcast_to(np.arange(self._indexed, self._size), distances[-1].shape))
+        distances, indeces = np.hstack(distances), np.hstack(indeces)
+        order = np.argsort(distances, axis = 1, kind = 'stable')[:, :nearest_neighbours]
+        return np.take_along_axis(distances, order, axis = 1), np.take_along_axis(indeces, order, axis = 1)
 
 
 class SoftmaxDefender(ModelDefender):
@@ -407,7 +526,6 @@ class SoftmaxDefender(ModelDefender):
         self._type_check(datapoints, labels) # Check if input data is tensor or ndarray
         self.defend_counter += 1
         if self.defend_counter > self.delay: # Only defend if defend counter is larger than delay
-            labels = labels.reshape(-1,1)
             if self._datatype == 1: # If incoming data is nd.array, make into tensor for NeuralNetwork
                 X_batch = torch.tensor(datapoints)
                 labels = torch.tensor(labels)
@@ -416,14 +534,12 @@ class SoftmaxDefender(ModelDefender):
                 labels = labels
             # If onehot, then construct artificial class labels
             if self.one_hot:
-                class_labels = torch.argmax(labels, axis = 1).reshape(-1,1) # Get class labels from onehot
+                class_labels = self.codec.decode(labels).reshape(-1,1) # Get class labels from onehot
             else:
+                labels = labels.reshape(-1,1)
                 class_labels = labels
-            #zero gradients so they are not accumulated across batches
-            model.eval()
-            with torch.no_grad():
-            # Performs forward pass through classifier
-                outputs = model.forward(X_batch.float())
+            # Performs forward pass through classifier (memoized if the model has a prediction cache)
+            outputs = cached_forward(model, X_batch.float())
             confidence = torch.gather(outputs.cpu(), 1 , class_labels.cpu()) # Get softmax output for class labels
             mask = (confidence>self.threshold).squeeze(1) #mask for points true if confidence>threshold
             X_output = X_batch[mask] # Get output points using mask
@@ -433,6 +549,8 @@ class SoftmaxDefender(ModelDefender):
                 X_output = X_output.cpu().detach().numpy()
                 y_output = y_output.cpu().detach().numpy()
 
+            if self.one_hot:
+                return (X_output, y_output)
             return (X_output, y_output.reshape(-1,))
         else:
             return (datapoints, labels)
@@ -461,10 +579,6 @@ class FeasibleSetDefender(OutlierDefender):
         #Input validation
         self.one_hot = one_hot
         self._threshold = threshold
-        if self.one_hot: # Perform encoding of labels into ints if input is onehot
-            self._init_y = _label_encoding(initial_dataset_y)
-        else:
-            initial_dataset_y = initial_dataset_y.reshape(-1,)        
         self._feasible_set_construction() # Construct the feasible set
         self.distance_metric = dist_metric
         _input_validation(self)
@@ -487,13 +601,18 @@ class FeasibleSetDefender(OutlierDefender):
             Currently feasible set centroid is constructed by just taking the mean of the points per dimension for a label
             Also implements label counts for the running centroid updating during .defend
         """
-        labels = np.unique(self._init_y) # Get unique labels
+        init_x, init_y = self._init_x, self._init_y
+        if self.one_hot: # Perform encoding of labels into ints if input is onehot
+            init_y = self.codec.decode(init_y)
+        else:
+            init_y = init_y.reshape(-1,)
+        labels = np.unique(init_y) # Get unique labels
         feasible_set = {}
         label_counts = {}
         for label in labels:
-            label_rows = (self._init_y == label)
+            label_rows = (init_y == label)
             label_counts[label] = np.sum(label_rows) # Get counts of points for each label
-            feasible_set[label] = np.mean(self._init_x[label_rows], 0) # Get mean for each label for centroid calculation
+            feasible_set[label] = np.mean(init_x[label_rows], 0) # Get mean for each label for centroid calculation
         self.feasible_set = feasible_set
         self._label_counts = label_counts
 
@@ -542,8 +661,7 @@ class FeasibleSetDefender(OutlierDefender):
             labels = labels.cpu().detach().numpy()
         
         if self.one_hot: #Change labels if onehot
-            one_hot_length = len(labels[0])
-            labels = np.argmax(labels, axis = 1)
+            labels = self.codec.decode(labels)
         else:
             labels = labels.reshape(-1,)
         
@@ -569,7 +687,7 @@ class FeasibleSetDefender(OutlierDefender):
         cleared_labels_stack = np.stack(cleared_labels)
 
         if self.one_hot: # If onehot, construct onehot output
-            cleared_labels_stack = self._one_hot_decoding(cleared_labels_stack, one_hot_length)
+            cleared_labels_stack = self.codec.encode(cleared_labels_stack)
         # Returns a tuple of np array of cleared datapoints and np array of cleared labels
         output_datapoints = np.stack(cleared_datapoints)
         output_labels = cleared_labels_stack
@@ -579,19 +697,6 @@ class FeasibleSetDefender(OutlierDefender):
             output_labels = torch.tensor(output_labels)
 
         return (output_datapoints, output_labels)
-    
-    def _one_hot_decoding(self, cleared_labels_stack, one_hot_length):
-        """ Construct one_hot outputs from int input labels
-        Args: 
-            one_hot_length (int): Dimensionality of one_hot_encoded outputs
-            cleared_labels_stack (list): list of labels.
-        Return:
-            output_labels (np.ndarray): one_hot_encoded label data
-        """
-        output_labels = np.zeros((len(cleared_labels_stack), one_hot_length))
-        for id,label in enumerate(cleared_labels_stack):
-            output_labels[id][label] = 1
-        return output_labels
 
 
 class Distance_metric:
@@ -626,16 +731,16 @@ class Distance_metric:
 # =============================================================================
 #  FUNCTIONS
 # =============================================================================
-def _label_encoding(one_hot_labels):
-        """ Constructs artificial 1d labels from incoming array of one_hot encoded label data
-            Artificial label of a one_hot encoded label is the dim number where the label had a 1
+def _as_ndarray(array):
+    """ Get a ndarray from a ndarray or tensor.
         Args: 
-            one_hot_labels (np.ndarray): label data
+            array (np.ndarray, torch.Tensor): array to convert
         Return:
-            encoded_labels (float): label data
-        """
-        encoded_labels = np.argmax(one_hot_labels, axis = 1) #encode labels
-        return encoded_labels
+            array (np.ndarray): converted array
+    """
+    if isinstance(array, torch.Tensor):
+        return array.cpu().detach().numpy()
+    return array
 
 def _input_validation(defender):
     """ Input validation for various defenders or Defendergroup
@@ -658,6 +763,8 @@ def _input_validation(defender):
             raise TypeError ("The nearest_neighbours is not a float")
         if not isinstance(defender.one_hot, boolean):
             raise TypeError ("The one_hot flat is not a boolean")
+        if not isinstance(defender.weighted, boolean):
+            raise TypeError ("The weighted flag is not a boolean")
     
     elif isinstance(defender, SoftmaxDefender):
         if not (isinstance(defender.threshold, float)):
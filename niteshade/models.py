@@ -9,11 +9,15 @@ models for out-of-the-box use.
 # =============================================================================
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
+import weakref
+from collections import OrderedDict
+
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from niteshade.data import DataLoader
+from niteshade.utils import load_torch_func, LabelCodec
 
 
 # =============================================================================
@@ -58,6 +62,7 @@ class BaseModel(nn.Module):
         #initialise attributes to store training hyperparameters
         self.lr = lr 
         self.loss_func_str = loss_func
+        self.codec = LabelCodec() #decodes one-hot labels for classification losses
 
         #retrieve user-defined sequences of layers
         if any(isinstance(el, list) for el in architecture):
@@ -96,6 +101,21 @@ class BaseModel(nn.Module):
             raise NotImplementedError(f"The loss function {loss_func} has not been implemented.")
 
         self.losses = []
+
+        #incremented whenever the parameters change (see PredictionCache), 
+        #including after every step of the optimizer
+        self.version = 0
+        self.optimizer.register_step_post_hook(self._optimizer_step_hook)
+
+    def _optimizer_step_hook(self, optimizer, args, kwargs):
+        """Step post-hook of the optimizer invalidating cached predictions."""
+        self.version += 1
+
+    def __setstate__(self, state):
+        """Restore a pickled/copied model, registering the step post-hook of its 
+        optimizer again (hooks are not pickled/copied with optimizers)."""
+        super().__setstate__(state)
+        self.optimizer.register_step_post_hook(self._optimizer_step_hook)
     
     def _check_inputs(self, X, y):
         assert (isinstance(X, (np.ndarray, torch.Tensor)) 
@@ -109,7 +129,7 @@ class BaseModel(nn.Module):
             if self.loss_func_str in ["nll", "bce", "cross_entropy"]:
                 #check if one-hot encoded
                 if len(y.shape) > 1: 
-                    y = torch.tensor(y).argmax(dim=1)
+                    y = self.codec.decode(torch.tensor(y))
                 else: 
                     y = torch.tensor(y, dtype=torch.long)
         else:
@@ -118,7 +138,7 @@ class BaseModel(nn.Module):
                 y = y.type(torch.float64)
             else:
                 if len(y.shape) > 1: 
-                    y = y.argmax(dim=1)
+                    y = self.codec.decode(y)
                 else: 
                     y = y.type(torch.long)
 
@@ -149,14 +169,20 @@ class BaseModel(nn.Module):
 
         # Computes loss on batch with given loss function
         loss = self.loss_func(outputs, y_batch)
-        self.losses.append(loss)
+        self.losses.append(loss.detach()) #detached so that the model can be copied/pickled
 
         # Performs backward pass through gradient of loss wrt model parameters
         loss.backward()
 
         # Update model parameters after gradients are updated
-        self.optimizer.step()
+        self.optimizer.step() #invalidates cached predictions (see ._optimizer_step_hook())
     
+    def load_state_dict(self, state_dict, strict=True):
+        """Load a state dictionary into the model (see torch.nn.Module.load_state_dict), 
+        invalidating its cached predictions."""
+        self.version += 1
+        return super().load_state_dict(state_dict, strict=strict)
+
     def forward(self, x):
         """Perform a forward pass through the model.
         
@@ -233,11 +259,8 @@ class IrisClassifier(BaseModel):
         return self.network(x) 
 
     def predict(self, x):
-        """Predict on a data sample."""
-        self.eval()
-        with torch.no_grad():
-            pred =  self.forward(x)
-        return pred
+        """Predict on a data sample (memoized if the model has a prediction cache)."""
+        return cached_forward(self, x)
 
     def evaluate(self, X_test, y_test, batch_size=5):
         """Test the accuracy of the iris classifier on a test set.
@@ -348,11 +371,8 @@ class MNISTClassifier(BaseModel):
         return x
 
     def predict(self, x):
-        """Predict on a data sample."""
-        self.eval() #set model in eval mode
-        with torch.no_grad():
-            pred =  self.forward(x)
-        return pred
+        """Predict on a data sample (memoized if the model has a prediction cache)."""
+        return cached_forward(self, x)
 
     def evaluate(self, X_test, y_test, batch_size=32):
         """Test the accuracy of the iris classifier on a test set.
@@ -494,11 +514,8 @@ class CifarClassifier(BaseModel):
         return x
     
     def predict(self, x):
-        """Predict on a data sample."""
-        self.eval() #set model in eval mode
-        with torch.no_grad():
-            pred =  self.forward(x)
-        return pred
+        """Predict on a data sample (memoized if the model has a prediction cache)."""
+        return cached_forward(self, x)
     
     def evaluate(self, X_test, y_test, batch_size=32):
         """Test the accuracy of the CIFAR10 classifier on a test set.
@@ -540,6 +557,389 @@ class CifarClassifier(BaseModel):
         
         return accuracy
 
+#====================================================
+#======================ENSEMBLE======================
+#====================================================
+class ModelEnsemble(nn.Module):
+    """
+    Ensemble of independently-initialised copies (members) of a BaseModel that 
+    are trained simultaneously on the same stream of data. The parameters and 
+    buffers of the members are stacked along a new leading dimension and the 
+    forward/backward passes of all the members are batched with torch.func.vmap, 
+    so that a gradient descent step of the ensemble costs a single (wider) pass 
+    instead of one pass per member. This allows to obtain 10-30 seeds of a small 
+    model (e.g IrisClassifier) from a single Simulator run, where training them
+    separately would be dominated by Python overhead.
+
+    A ModelEnsemble can be passed to a Simulator in place of a BaseModel: the 
+    snapshots saved in Simulator.results["models"] are then stacked state 
+    dictionaries, which can be split into the individual members' state 
+    dictionaries with .member_state_dict() or aggregated into mean/confidence 
+    interval curves with PostProcessor.compute_ensemble_metrics(). 
+
+    **NOTE**: Requires PyTorch >= 2.0 (torch.func). The members are updated with 
+    a single optimizer of the same type and hyperparameters as the optimizer of the 
+    first member; since the loss of the ensemble is the sum of the losses of the 
+    members, each member receives exactly its own gradients. Members containing 
+    BatchNorm layers cannot be trained in training mode (running statistics 
+    cannot be updated in-place under vmap).
+
+    Args: 
+        model_fn (callable) : function returning a new BaseModel instance (e.g 
+                              IrisClassifier), called once per member.
+        num_models (int) : number of members in the ensemble (Default = 10).
+        seeds (list) : list of seeds used to initialise the parameters of each 
+                       member (Default = None, i.e list(range(num_models))).
+        shuffle (bool) : If True, each member is trained on its own random ordering
+                         of the points of each episode (see .shuffle_members()). 
+                         Default = False, i.e all members see the same batches.
+    """
+    def __init__(self, model_fn, num_models=10, seeds=None, shuffle=False):
+        super().__init__()
+        func = load_torch_func()
+
+        if seeds is None:
+            seeds = list(range(num_models))
+        if len(seeds) != num_models:
+            raise ValueError("The number of seeds must be equal to num_models.")
+
+        #initialise members independently (without altering the global random state)
+        members = []
+        for seed in seeds:
+            with torch.random.fork_rng():
+                torch.manual_seed(seed)
+                members.append(model_fn())
+
+        self.num_models = num_models
+        self.seeds = seeds
+        self.shuffle = shuffle
+        self.device = members[0].device
+        self.loss_func = members[0].loss_func
+        self.loss_func_str = members[0].loss_func_str
+        self._rng = np.random.default_rng(seeds[0])
+
+        #stack parameters and buffers of members along a new leading dimension
+        params, buffers = func.stack_module_state(members)
+        self._param_names = list(params.keys())
+        self._buffer_names = list(buffers.keys())
+        self.stacked_params = nn.ParameterDict({_stacked_key(name): nn.Parameter(param) 
+                                                for name, param in params.items()})
+        for name, buffer in buffers.items():
+            self.register_buffer(f"stacked_buffer__{_stacked_key(name)}", buffer)
+
+        #first member is used as a template for the functional forward pass
+        #(stored in a list so that it is not registered as a submodule)
+        self._template = [members[0]]
+
+        optimizer = members[0].optimizer
+        self.optimizer = optimizer.__class__(self.parameters(), **optimizer.defaults)
+        self.losses = []
+
+        #incremented whenever the parameters change (see PredictionCache), 
+        #including after every step of the optimizer
+        self.version = 0
+        self.optimizer.register_step_post_hook(self._optimizer_step_hook)
+
+    def _optimizer_step_hook(self, optimizer, args, kwargs):
+        """Step post-hook of the optimizer invalidating cached predictions."""
+        self.version += 1
+
+    def __setstate__(self, state):
+        """Restore a pickled/copied model, registering the step post-hook of its 
+        optimizer again (hooks are not pickled/copied with optimizers)."""
+        super().__setstate__(state)
+        self.optimizer.register_step_post_hook(self._optimizer_step_hook)
+
+    def _stacked_state(self):
+        """Get dictionaries of the stacked parameters and buffers keyed by the
+        original parameter/buffer names of the members."""
+        params = {name: self.stacked_params[_stacked_key(name)] for name in self._param_names}
+        buffers = {name: getattr(self, f"stacked_buffer__{_stacked_key(name)}") 
+                   for name in self._buffer_names}
+        return params, buffers
+
+    def _member_forward(self, params, buffers, x):
+        """Forward pass of a single member with the given parameters and buffers."""
+        func = load_torch_func()
+        return func.functional_call(self._template[0], (params, buffers), (x,))
+
+    def train(self, mode=True):
+        """Set the ensemble (and the template member) in training/evaluation mode."""
+        super().train(mode)
+        self._template[0].train(mode)
+        return self
+
+    def forward(self, x, stacked=False):
+        """Perform a forward pass through all the members of the ensemble.
+        
+        Args:
+            x (torch.Tensor) : Input tensor of shape (batch_size, input_shape) shared by 
+                               all members or, if stacked=True, of shape 
+                               (num_models, batch_size, input_shape).
+            stacked (bool) : Indicates if x contains a different batch for each member.
+            
+        Returns: 
+            (torch.Tensor) : Predictions of shape (num_models, batch_size, output_shape).
+        """
+        func = load_torch_func()
+        params, buffers = self._stacked_state()
+        in_dims = (0, 0, 0 if stacked else None)
+        batched_forward = func.vmap(self._member_forward, in_dims=in_dims, 
+                                          randomness='different')
+        return batched_forward(params, buffers, x.to(self.device))
+
+    def _check_inputs(self, X, y):
+        """Convert inputs and labels to tensors as expected by the loss function 
+        of the members (see BaseModel._check_inputs())."""
+        return self._template[0]._check_inputs(X, y)
+
+    def step(self, X_batch, y_batch):
+        """
+        Perform a step of gradient descent on all the members of the ensemble 
+        simultaneously. If shuffle=True, X_batch and y_batch are expected to contain 
+        a different batch for each member stacked along dimension 1 (as returned by
+        .shuffle_members()).
+
+        Args:
+             X_batch (np.ndarray, torch.Tensor) : input data used in training.
+             y_batch (np.ndarray, torch.Tensor) : target data used in training.
+        """
+        if self.shuffle:
+            #flatten (batch_size, num_models) dimensions to check inputs
+            batch_size = X_batch.shape[0]
+            X_batch, y_batch = self._check_inputs(X_batch.reshape(-1, *X_batch.shape[2:]),
+                                                  y_batch.reshape(-1, *y_batch.shape[2:]))
+            X_batch = X_batch.reshape(batch_size, self.num_models, *X_batch.shape[1:]).transpose(0, 1)
+            y_batch = y_batch.reshape(batch_size, self.num_models, *y_batch.shape[1:]).transpose(0, 1)
+        else:
+            X_batch, y_batch = self._check_inputs(X_batch, y_batch)
+            y_batch = y_batch.expand(self.num_models, *y_batch.shape)
+
+        self.train() #set model in training mode
+
+        # Send data to device
+        X_batch = X_batch.to(self.device)
+        y_batch = y_batch.to(self.device)
+
+        # Zero gradients so they are not accumulated across batches
+        self.optimizer.zero_grad()
+
+        # Performs batched forward pass through all members
+        outputs = self.forward(X_batch.float(), stacked=self.shuffle)
+
+        # Loss of the ensemble is the sum of the losses of the members
+        loss = self.loss_func(outputs.flatten(0, 1), y_batch.flatten(0, 1))
+        if getattr(self.loss_func, 'reduction', 'mean') == 'mean':
+            loss = loss * self.num_models
+        self.losses.append(loss.detach() / self.num_models) #mean loss of members
+
+        # Performs backward pass through gradient of loss wrt stacked parameters
+        loss.backward()
+
+        # Update parameters of all members
+        self.optimizer.step() #invalidates cached predictions (see ._optimizer_step_hook())
+
+    def load_state_dict(self, state_dict, strict=True):
+        """Load a state dictionary into the model (see torch.nn.Module.load_state_dict), 
+        invalidating its cached predictions."""
+        self.version += 1
+        return super().load_state_dict(state_dict, strict=strict)
+
+    def shuffle_members(self, X, y):
+        """Give each member its own random ordering of the points in X and y. 
+        
+        Args:
+            X (np.ndarray, torch.Tensor) : inputs of shape (N, input_shape).
+            y (np.ndarray, torch.Tensor) : labels of shape (N, label_shape).
+
+        Returns:
+            X (np.ndarray, torch.Tensor) : inputs of shape (N, num_models, input_shape),
+                                           where X[:, i] are the inputs ordered for member i.
+            y (np.ndarray, torch.Tensor) : labels of shape (N, num_models, label_shape).
+        """
+        orderings = np.tile(np.arange(len(X)), (self.num_models, 1))
+        orderings = self._rng.permuted(orderings, axis=1).T #shape (N, num_models)
+        if isinstance(X, torch.Tensor):
+            orderings = torch.as_tensor(orderings, device=X.device)
+
+        return X[orderings], y[orderings]
+
+    def member_state_dict(self, idx, state_dict=None):
+        """Get the state dictionary of a single member of the ensemble.
+
+        Args:
+            idx (int) : index of the member.
+            state_dict (dict) : stacked state dictionary of the ensemble (e.g a 
+                                snapshot in Simulator.results["models"]). If None,
+                                the current state of the ensemble is used.
+        
+        Returns:
+            member_state (dict) : state dictionary that can be loaded in a model 
+                                  returned by model_fn.
+        """
+        if state_dict is None:
+            state_dict = self.state_dict()
+
+        member_state = {}
+        for name in self._param_names:
+            member_state[name] = state_dict[f"stacked_params.{_stacked_key(name)}"][idx].clone()
+        for name in self._buffer_names:
+            member_state[name] = state_dict[f"stacked_buffer__{_stacked_key(name)}"][idx].clone()
+
+        return member_state
+
+    def member(self, idx, state_dict=None):
+        """Get a member of the ensemble as a standalone model.
+
+        **NOTE**: The same model instance is reused across calls, so its state is 
+        overwritten every time this method is called.
+
+        Args:
+            idx (int) : index of the member.
+            state_dict (dict) : stacked state dictionary of the ensemble. If None,
+                                the current state of the ensemble is used.
+
+        Returns:
+            model (BaseModel) : model with the parameters of the member.
+        """
+        model = self._template[0]
+        model.load_state_dict(self.member_state_dict(idx, state_dict))
+        return model
+
+    def evaluate(self, X_test, y_test, *args, **kwargs):
+        """Evaluate every member of the ensemble on some test data using the 
+        .evaluate() method of the members.
+
+        Args:
+            X_test (np.ndarray or torch.Tensor) : test input data.
+            y_test (np.ndarray or torch.Tensor) : test target data.
+
+        Returns:
+            metrics (np.ndarray) : evaluation metric of each member (shape (num_models,)).
+        """
+        state_dict = self.state_dict()
+        metrics = [float(self.member(idx, state_dict).evaluate(X_test, y_test, *args, **kwargs)) 
+                   for idx in range(self.num_models)]
+        return np.array(metrics)
+
+
+class PredictionCache():
+    """
+    Least-recently-used cache of model predictions keyed by (a weak reference to)
+    the model, its version (BaseModel.version, which is incremented after each 
+    step of its optimizer and when a state dictionary is loaded) and a 
+    fingerprint of the inputs. Cached predictions are thus never served for a 
+    model whose parameters changed since they were computed.
+
+    A cache is attached to a model by setting it as its prediction_cache attribute
+    (e.g by passing cache_size to a Simulator), after which model-aware attackers, 
+    defenders and the .predict() method of the models share the predictions of 
+    the model through cached_forward(). Models without a version attribute are 
+    never cached. Predictions are computed in evaluation mode without gradients 
+    and should not be modified in place.
+
+    Args:
+        max_size (int) : maximum number of cached predictions (Default = 128).
+    """
+    def __init__(self, max_size=128):
+        if not max_size > 0:
+            raise ValueError('Cache size must be > 0.')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __getstate__(self):
+        """Copy/pickle the cache without its entries (which are keyed by weak 
+        references to the models, and would never be served to copied models)."""
+        state = self.__dict__.copy()
+        state['_entries'] = OrderedDict()
+        return state
+
+    def __len__(self):
+        """Number of cached predictions."""
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all cached predictions."""
+        self._entries.clear()
+
+    def predict(self, model, x):
+        """Get the predictions of the model on x, computing them only if they 
+        are not cached for the current version of the model.
+
+        Args:
+            model (torch.nn.Module) : model to predict with.
+            x (torch.Tensor) : input data.
+
+        Returns:
+            (torch.Tensor) : predictions of the model.
+        """
+        version = getattr(model, 'version', None)
+        if version is None:
+            return _eval_forward(model, x)
+
+        #weak reference to the model such that entries of a deleted model are 
+        #never served to a new model reusing its id
+        key = (weakref.ref(model), version, _fingerprint(x))
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        pred = _eval_forward(model, x)
+        self._entries[key] = pred
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False) #evict least-recently-used prediction
+        return pred
+
+
+# =============================================================================
+#  FUNCTIONS
+# =============================================================================
+def cached_forward(model, x):
+    """Forward pass of a model in evaluation mode without gradients, memoized 
+    by the prediction cache of the model (if it has one, see PredictionCache).
+
+    Args:
+        model (torch.nn.Module) : model to predict with.
+        x (torch.Tensor) : input data.
+
+    Returns:
+        (torch.Tensor) : predictions of the model.
+    """
+    cache = getattr(model, 'prediction_cache', None)
+    if cache is None:
+        return _eval_forward(model, x)
+    return cache.predict(model, x)
+
+
+def _eval_forward(model, x):
+    """Forward pass of a model in evaluation mode without gradients, restoring
+    the previous mode of the model afterwards."""
+    was_training = model.training
+    model.eval()
+    with torch.no_grad():
+        pred = model.forward(x)
+    model.train(was_training)
+    return pred
+
+
+def _fingerprint(x):
+    """Fingerprint of the contents, shape and type of an input array/tensor."""
+    if isinstance(x, torch.Tensor):
+        x = x.detach().cpu().numpy()
+    x = np.ascontiguousarray(x)
+    return (x.shape, str(x.dtype), hash(x.tobytes()))
+
+
+def _stacked_key(name):
+    """Convert a parameter/buffer name (e.g 'network.0.weight') into a valid 
+    key for a nn.ParameterDict or buffer."""
+    return name.replace('.', '__')
+
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
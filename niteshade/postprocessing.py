@@ -19,12 +19,15 @@ import matplotlib.pyplot as plt
 plt.style.use("seaborn") 
 
 import torch
+from scipy import stats
 from sklearn.metrics import accuracy_score
 from sklearn.svm import SVC
 from sklearn.manifold import TSNE
 from tqdm import tqdm
 from fpdf import FPDF
 
+from niteshade.data import resolve_array
+from niteshade.models import ModelEnsemble
 from niteshade.simulation import wrap_results
 from niteshade.utils import save_plot, get_cmap, get_time_stamp_as_string
 
@@ -178,12 +181,13 @@ class PostProcessor():
         to have an .evaluate() method with arguments (X_test, y_test) that returns
         any given metric that the user deems appropriate for the task at hand.
         Args:
-            X_test (np.ndarray) : NumPy array containing features.
-            y_test (np.ndarray) : NumPy array containing labels.
+            X_test (np.ndarray, SharedArray) : NumPy array containing features.
+            y_test (np.ndarray, SharedArray) : NumPy array containing labels.
         Returns:
             metrics (dict) : Dictionary where each key is a simulator 
                              and each value is a final evaluation metric.
         """
+        X_test, y_test = resolve_array(X_test), resolve_array(y_test)
         metrics = {}
         
         for simulation_label, list_of_models in tqdm(self.wrapped_models.items()):
@@ -205,14 +209,15 @@ class PostProcessor():
         must have an evaluate method of the form: Input: X_test, y_test, 
         self.batch_sizes[simulation_label]. Output: metric.
         Args:
-            X_test (np.ndarray) : NumPy array containing features.
-            y_test (np.ndarray) : NumPy array containing labels.
+            X_test (np.ndarray, SharedArray) : NumPy array containing features.
+            y_test (np.ndarray, SharedArray) : NumPy array containing labels.
         Returns:
             metrics (dict) : Dictionary where each key is a simulator and each 
                              value is a list of coresponding metrics throughout 
                              the simulation (each value corresponds to a single 
                              timestep of a simulation).
         """
+        X_test, y_test = resolve_array(X_test), resolve_array(y_test)
         metrics = {}
         
         for simulation_label, list_of_models in tqdm(self.wrapped_models.items()):
@@ -232,26 +237,80 @@ class PostProcessor():
         return metrics
 
 
+    def compute_ensemble_metrics(self, X_test, y_test, confidence=0.95):
+        """Returns a dictionary with the mean and confidence interval of the 
+        metrics of the members of a ModelEnsemble throughout the simulation. 
+        Only simulators whose model is a ModelEnsemble are considered. 
+        Requirement: the members must have an evaluate method of the form: 
+        Input: X_test, y_test. Output: metric.
+        Args:
+            X_test (np.ndarray, SharedArray) : NumPy array containing features.
+            y_test (np.ndarray, SharedArray) : NumPy array containing labels.
+            confidence (float) : confidence level of the intervals, computed 
+                                 with a Student t-distribution (Default = 0.95).
+        Returns:
+            metrics (dict) : Dictionary where each key is a simulator and each 
+                             value is a dictionary with keys "mean", "lower" and 
+                             "upper" (arrays with one value per episode) and 
+                             "members" (array of shape (num_models, num_episodes)
+                             with the metrics of each member).
+        """
+        X_test, y_test = resolve_array(X_test), resolve_array(y_test)
+        metrics = {}
+        
+        for simulation_label, list_of_models in tqdm(self.wrapped_models.items()):
+            model = self.final_models[simulation_label]
+            if not isinstance(model, ModelEnsemble):
+                continue
+
+            member_metrics = []
+            for model_specs in list_of_models:
+                model.load_state_dict(model_specs)
+                member_metrics.append(model.evaluate(X_test, y_test))
+            member_metrics = np.stack(member_metrics, axis=1) #(num_models, num_episodes)
+
+            mean = member_metrics.mean(axis=0)
+            if model.num_models > 1:
+                sem = member_metrics.std(axis=0, ddof=1) / np.sqrt(model.num_models)
+                half_width = sem * stats.t.ppf((1 + confidence) / 2, model.num_models - 1)
+            else: 
+                half_width = np.zeros_like(mean)
+
+            metrics[simulation_label] = {'mean': mean, 
+                                         'lower': mean - half_width, 
+                                         'upper': mean + half_width,
+                                         'members': member_metrics}
+        return metrics
+
+
     def plot_online_learning_metrics(self, metrics, show_plot=True, save=True, 
                                      plotname=None, set_plot_title=True):
         """Prints a plot into a console. Supports supervised learning only.
         
         Args:
-            metrics (np.ndarray) : an array of metrics of length equal to the 
-                                   number of episodes in a simulation.
+            metrics (dict) : dictionary with arrays of metrics of length equal to the 
+                             number of episodes in a simulation (as returned by 
+                             compute_online_learning_metrics()), or with dictionaries
+                             of "mean", "lower" and "upper" arrays (as returned by 
+                             compute_ensemble_metrics()), in which case the confidence 
+                             interval is shaded around the mean.
             save (bool) : enable saving.
             plotname (str) : if set to None, file name is set to a current 
                              timestamp.
         """
         if plotname is None: plotname = get_time_stamp_as_string()
         
-        for _,v in metrics.items(): l = len(v)
+        for _,v in metrics.items(): l = len(v['mean']) if isinstance(v, dict) else len(v)
         x = [e for e in range(l)]
         #x = [e for e in range((self.num_episodes))]
 
         fig, ax = plt.subplots(1, figsize=(15,10))
         for model_name, metric in metrics.items():
-            ax.plot(x, metric, label=model_name)
+            if isinstance(metric, dict):
+                ax.plot(x, metric['mean'], label=model_name)
+                ax.fill_between(x, metric['lower'], metric['upper'], alpha=0.3)
+            else:
+                ax.plot(x, metric, label=model_name)
             ax.legend()
 
         if set_plot_title: ax.set_title(plotname)
@@ -331,8 +390,8 @@ class PostProcessor():
         with the predicted labels of each model to show their decision 
         boundaries in 2D.
         Args: 
-            X_test (np.ndarray, torch.Tensor) : Test input data.
-            y_test (np.ndarray, torch.Tensor) : Test labels.
+            X_test (np.ndarray, torch.Tensor, SharedArray) : Test input data.
+            y_test (np.ndarray, torch.Tensor, SharedArray) : Test labels.
             num_points (int) : Number of points within X_test/y_test to plot 
                                  in the figure. Consider selecting a value 
                                  between 300 and 1000.
@@ -371,6 +430,7 @@ class PostProcessor():
             save (bool) : Boolean indicating wether to save the plots or not. (Default = False).
             show_plot (bool) : Boolean indicating if plot should be showed (Default = True). 
         """
+        X_test, y_test = resolve_array(X_test), resolve_array(y_test)
         #make sure number of points is smaller than length of test set
         assert num_points <= len(X_test), 'Number of points to plot must be \
         smaller than len(X_test).'
@@ -11,23 +11,35 @@ against online learning.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 
+import os
+import sys
+import pickle
+import shutil
 import inspect
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
-from collections import defaultdict
+from collections import defaultdict, deque
+from collections.abc import Sequence
 
 import torch
 import numpy as np
 from tqdm import tqdm
 
-from niteshade.data import DataLoader
-from niteshade.attack import Attacker
+from niteshade.data import DataLoader, resolve_array
+from niteshade.models import ModelEnsemble, PredictionCache, _fingerprint
+from niteshade.attack import Attacker, AttackerGroup
 from niteshade.defence import DefenderGroup, Defender
-from niteshade.utils import save_pickle, copy
+from niteshade.utils import save_pickle, load_pickle, copy
 
 
 # =============================================================================
 #  CLASSES
 # =============================================================================
+_PROVENANCE_COUNTERS = ('poisoned', 'not_poisoned', 'correctly_defended', 
+                        'incorrectly_defended', 'training_points', 'original_points')
+
 class _KeyMap(object):
     """Object used to convert NumPy arrays/PyTorch Tensors
        to a hashable form."""
@@ -51,6 +63,71 @@ class _KeyMap(object):
     def __repr__(self):
         return f'{self.hash}'
 
+class _Spilled(object):
+    """Placeholder for an item of an _EpisodeStore that was moved to disk."""
+    def __init__(self, path):
+        self.path = path
+
+class _ResultsSpiller(object):
+    """Object keeping track of the memory used by the items of one or more 
+       _EpisodeStore objects and moving the oldest items to disk when the 
+       total exceeds a memory budget (in bytes)."""
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.nbytes = 0
+        self._items = deque() #(store, index, nbytes) in insertion order
+        self._num_spilled = 0
+        self.dirname = tempfile.mkdtemp(prefix='niteshade_results_')
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.dirname, True)
+
+    def track(self, store, index, nbytes):
+        """Track a new item and spill the oldest items while over budget 
+        (the newest item is always kept in memory)."""
+        self._items.append((store, index, nbytes))
+        self.nbytes += nbytes
+        while self.nbytes > self.memory_budget and len(self._items) > 1:
+            old_store, old_index, old_nbytes = self._items.popleft()
+            path = os.path.join(self.dirname, f'{self._num_spilled}.pickle')
+            with open(path, 'wb') as target:
+                pickle.dump(old_store._items[old_index], target)
+            old_store._items[old_index] = _Spilled(path)
+            self._num_spilled += 1
+            self.nbytes -= old_nbytes
+
+class _EpisodeStore(Sequence):
+    """List-like sequence of per-episode results whose oldest items are 
+       transparently moved to disk by a _ResultsSpiller when the memory budget 
+       of the simulation is exceeded. Reading an item that was moved to disk 
+       loads it back (without keeping it in memory), so readers see a single 
+       logical sequence. Pickling/copying a store yields a plain list."""
+    def __init__(self, spiller):
+        self._spiller = spiller
+        self._items = []
+
+    def append(self, item):
+        self._items.append(item)
+        self._spiller.track(self, len(self._items) - 1, _nbytes(item))
+
+    def _load(self, item):
+        if isinstance(item, _Spilled):
+            with open(item.path, 'rb') as target:
+                return pickle.load(target)
+        return item
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._load(item) for item in self._items[idx]]
+        return self._load(self._items[idx])
+
+    def __len__(self):
+        return len(self._items)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def __repr__(self):
+        return f'_EpisodeStore({len(self)} episodes)'
+
 class Simulator():
     """
     Class used to simulate data poisoning attacks during online learning. 
@@ -66,9 +143,9 @@ class Simulator():
     in this scenario).
        
     Args:
-        X (np.ndarray, torch.Tensor) : stream of input data to train the model
+        X (np.ndarray, torch.Tensor, SharedArray) : stream of input data to train the model
                                         with during supervised learning.
-        y (np.ndarray, torch.Tensor) : stream of target data (labels to the inputs)
+        y (np.ndarray, torch.Tensor, SharedArray) : stream of target data (labels to the inputs)
                                         to train the model with during supervised learning.
         model (torch.nn.Module) : neural network model inheriting from torch.nn.Module to 
                                     be trained during online learning. Must present a .step()
@@ -83,9 +160,32 @@ class Simulator():
                                 an episode as the time period over which a stream of incoming data
                                 would be collected and subsequently passed on to the model to be 
                                 trained.
+        save (bool) : Boolean indicating if the results should be saved to the results
+                      directory after running the simulation.
+        record (bool) : Boolean indicating if the post-defence episode stream (i.e the 
+                        points the model is actually trained on) should be recorded so 
+                        that it can be replayed against other models with a 
+                        ReplaySimulator (see .save_recording()).
+        memory_budget (int) : Maximum number of bytes that self.results (checkpoint data
+                              and model snapshots) may occupy in memory. When exceeded, 
+                              the oldest episodes are moved to a temporary directory on 
+                              disk and loaded back transparently when read, e.g by 
+                              wrap_results() or a PostProcessor. Default = None (no budget).
+        cache_size (int) : If specified, a PredictionCache holding up to cache_size predictions 
+                           is attached to the model (as model.prediction_cache), such that 
+                           model-aware attackers and defenders and the .predict() method of 
+                           the model share predictions on identical inputs between gradient 
+                           descent steps. Default = None (no cache).
     """
     def __init__(self, X, y, model, attacker=None, defender=None, 
-                 batch_size=1, num_episodes=1, save=False) -> None:
+                 batch_size=1, num_episodes=1, save=False, record=False,
+                 memory_budget=None, cache_size=None) -> None:
+        #keep shared memory handles (resolved lazily, such that pickling the 
+        #simulator only pickles the handles) and check the arrays behind them
+        X_handle, y_handle = X, y
+        X = resolve_array(X)
+        y = resolve_array(y)
+
         #checks
         if not batch_size > 0 and batch_size <= len(X):
              raise ValueError('Batch size must be 0 < batch_size <= len(X).')
@@ -106,8 +206,8 @@ class Simulator():
             raise TypeError("Niteshade only supports NumPy arrays and PyTorch tensors.") 
 
         #miscellaneous
-        self.X = X
-        self.y = y
+        self.X = X_handle
+        self.y = y_handle
         self.num_episodes = num_episodes
         self.episode_size = len(X) // num_episodes
         self.batch_size = batch_size
@@ -115,8 +215,15 @@ class Simulator():
         self.attacker = attacker
         self.defender = defender
         self.save = save
+        self.record = record
         self.episode = 0
 
+        #share predictions of the model between attacker, defender and evaluation
+        self.prediction_cache = None
+        if cache_size is not None:
+            self.prediction_cache = PredictionCache(cache_size)
+            self.model.prediction_cache = self.prediction_cache
+
         #get attacker and defender args
         if attacker:
             args, defaults = self._get_func_args(self.attacker.attack)
@@ -151,12 +258,43 @@ class Simulator():
 
         #logging of results
         self.epoch = 0
-        self.results = {'original': [], 'post_attack': [], 'post_defense':[], 'models': []}
+        if memory_budget is None:
+            self.results = {'original': [], 'post_attack': [], 'post_defense':[], 'models': []}
+        else:
+            if not memory_budget > 0:
+                raise ValueError('Memory budget must be > 0 bytes.')
+            self._spiller = _ResultsSpiller(memory_budget)
+            self.results = {key: _EpisodeStore(self._spiller) for key in 
+                            ['original', 'post_attack', 'post_defense', 'models']}
         self._cp_labels = {0:'original', 1:'post_attack', 2:'post_defense'}
+
+        #episodes the model was trained on (only populated if record=True)
+        self._recorded_episodes = []
+
+    @property
+    def X(self):
+        """Stream of input data the simulator trains the model with."""
+        return resolve_array(self._X)
+
+    @X.setter
+    def X(self, X):
+        self._X = X #array or SharedArray handle
+        self._point_idxs = None #invalidate cached point identities
+
+    @property
+    def y(self):
+        """Stream of target data (labels to the inputs) the simulator trains the model with."""
+        return resolve_array(self._y)
+
+    @y.setter
+    def y(self, y):
+        self._y = y #array or SharedArray handle
+        self._point_idxs = None #invalidate cached point identities
     
     def _assign_ids(self, X, y):      
         """Build a dictionary using the true datapoints as keys and their indices 
-           (i.e identifiers) as values.
+           in the data stream as values. Identifiers are then formed by combining 
+           these indices with the epoch in which a point is seen (see ._get_id()).
         
         Args: 
             X (np.ndarray, torch.Tensor) : stream of input data to train the model
@@ -164,17 +302,30 @@ class Simulator():
             y (np.ndarray, torch.Tensor) : stream of target data (labels to the inputs)
                                            to train the model with during supervised learning.
         """
-        point_ids = {}
+        point_idxs = {}
         for idx, (inpt, label) in enumerate(zip(X,y)):
             point_hash = hash(_KeyMap(inpt, label))
-            point_ids[point_hash] = f'o_{idx}_{self.epoch}'
-        return point_ids
+            point_idxs[point_hash] = idx
+        return point_idxs
+
+    def _get_point_idxs(self):
+        """Get the (cached) dictionary mapping the hashes of the datapoints in 
+           self.X and self.y to their indices. The dictionary is only rebuilt 
+           if self.X or self.y have been reassigned or modified in place (as 
+           detected by a fingerprint of their contents) since it was last computed."""
+        fingerprint = (_fingerprint(self.X), _fingerprint(self.y))
+        if self._point_idxs is None or fingerprint != self._data_fingerprint:
+            self._point_idxs = self._assign_ids(self.X, self.y)
+            self._data_fingerprint = fingerprint
+        return self._point_idxs
     
     def _get_func_args(self, func):
         """Get the arguments of a function.
         Args: 
             func (function) : function to get arguments of.
         """
+        if isinstance(getattr(func, '__self__', None), AttackerGroup):
+            return func.__self__.attack_args()
         args, varargs, varkw, defaults = inspect.getargspec(func)
         return args, defaults
     
@@ -251,7 +402,7 @@ class Simulator():
         """
         #log episode points
         if checkpoint == 0:
-            return self._datapoint_ids[hash]
+            return f'o_{self._point_idxs[hash]}_{self.epoch - 1}'
 
         #attacker intervenes
         elif checkpoint == 1:
@@ -276,7 +427,23 @@ class Simulator():
                     
             return point_id
 
-    def _log(self, X, y, checkpoint):
+    def _hash_points(self, X, y, source_idxs=None):
+        """
+        Hash the points of an episode. If the positions of the points in the 
+        original episode are known (i.e source_idxs, -1 for new or modified points), 
+        the hashes computed at checkpoint 0 are reused for the unmodified points.
+        Args: 
+            X (torch.Tensor, np.ndarray) : Inputs to hash.
+            y (torch.Tensor, np.ndarray) : Labels to hash.
+            source_idxs (np.ndarray) : (optional) positions of the points in the original episode.
+        """
+        if source_idxs is None or len(source_idxs) != len(X):
+            return [hash(_KeyMap(inpt, label)) for inpt, label in zip(X, y)]
+
+        return [self._episode_hashes[source] if source >= 0 else hash(_KeyMap(X[idx], y[idx])) 
+                for idx, source in enumerate(source_idxs)]
+
+    def _log(self, X, y, checkpoint, source_idxs=None):
         """
         Log the results of an episode in the results dictionary and keep track 
         of how the attacker and defender have interacted with each episodes' datapoints 
@@ -288,11 +455,15 @@ class Simulator():
                                0 --> before attacker or defender intervene.
                                1 --> after attacker intervenes.
                                2 --> after defender intervenes.
-
+            source_idxs (np.ndarray) : (optional) positions of the points in the original 
+                                       episode, as reported by the attacker (see Attacker.source_idxs).
         """
         data = {}
-        for inpt, label in zip(X,y):
-            point_hash = hash(_KeyMap(inpt,label)) 
+        point_hashes = self._hash_points(X, y, source_idxs)
+        if checkpoint == 0:
+            self._episode_hashes = point_hashes
+
+        for inpt, label, point_hash in zip(X, y, point_hashes):
             point_id = self._get_id(point_hash, checkpoint)
             
             #record data in running dictionaries for comparison
@@ -356,8 +527,86 @@ class Simulator():
 
         self.results[self._cp_labels[checkpoint]].append(data)
 
+    def _train_on_episode(self, batch_queue, X_episode, y_episode, tepoch):
+        """
+        Add the (possibly attacked/defended) points of an episode to the batch
+        queue, take a gradient descent step on every complete mini-batch and 
+        save a snapshot of the model state dictionary.
+        Args: 
+            batch_queue (DataLoader) : cache data loader batching the episode points.
+            X_episode (np.ndarray, torch.Tensor) : Inputs to train the model on.
+            y_episode (np.ndarray, torch.Tensor) : Labels to train the model on.
+            tepoch (tqdm) : progress bar on which to display the running loss.
+        """
+        if isinstance(self.model, ModelEnsemble) and self.model.shuffle:
+            #give each member of the ensemble its own ordering of the episode
+            X_episode, y_episode = self.model.shuffle_members(X_episode, y_episode)
+
+        batch_queue.add_to_cache(X_episode, y_episode) #add perturbed / filtered points to batch queue
+        
+        # Online learning loop
+        running_loss = 0
+        num_batches = len(batch_queue)
+        for (X_batch, y_batch) in batch_queue:
+            
+            try:
+                #take a gradient descent step
+                self.model.step(X_batch, y_batch) 
+            except AttributeError:
+                raise NotImplementedError("Model must have a .step() method to perform a gradient descent step.")
+
+            if hasattr(self.model, 'losses'):
+                loss = self.model.losses[-1]
+                running_loss += loss.item()/len(X_batch)
+
+        if running_loss != 0:
+            tepoch.set_postfix(loss=running_loss/num_batches)
+        else:
+            tepoch.set_postfix(loss="n/a")
+
+        #save model state dictionary
+        state_dict = deepcopy(self.model.state_dict())
+        self.results['models'].append(state_dict)
+        self.episode += 1
+
+    def get_recording(self):
+        """
+        Get the recorded episode stream of the simulation together with the 
+        provenance counters and checkpoint results, such that it can be replayed 
+        against a different model with a ReplaySimulator.
+
+        Returns:
+            recording (dict) : dictionary with keys "episodes" (list of (X, y) tuples
+                               with the points the model was trained on in each episode),
+                               "counters" (dict with the poisoned, not_poisoned, 
+                               correctly_defended, incorrectly_defended, training_points 
+                               and original_points attributes), "results" (the original, 
+                               post_attack and post_defense checkpoint results), 
+                               "batch_size" and "num_episodes".
+        """
+        if not self.record:
+            raise ValueError("Simulator must be instantiated with record=True to record episodes.")
+
+        counters = {counter: getattr(self, counter) for counter in _PROVENANCE_COUNTERS}
+        results = {key: value for key, value in self.results.items() if key != 'models'}
+
+        return {'episodes': self._recorded_episodes, 'counters': counters, 
+                'results': results, 'batch_size': self.batch_size, 
+                'num_episodes': self.num_episodes}
+
+    def save_recording(self, dirname='output', filename='default'):
+        """
+        Save the recorded episode stream (see .get_recording()) as a .pickle file 
+        that can be passed to a ReplaySimulator.
+        Args: 
+            dirname (str) : name of the directory to save the recording to. 
+            filename (str) : file name, if filename is set to default, 
+                             the file name is set to timestemp
+        """
+        save_pickle(self.get_recording(), dirname=dirname, filename=filename)
+
     def run(self, defender_args = {}, attacker_args = {}, attacker_requires_model=False, 
-            defender_requires_model=False, shuffle=False) -> None:
+            defender_requires_model=False, shuffle=False, epochs=1, attack_staleness=0) -> None:
         """
         Runs a simulation of an online learning setting where, if specified, an attacker
         will "poison" incoming data points in an episode according to an 
@@ -390,6 +639,19 @@ class Simulator():
         found on the attributes: poisoned, not_poisoned, correctly_defended, incorrectly_defended,
         training_points, original_points.
 
+        If epochs > 1, the data stream is passed through the attacker, defender and model 
+        multiple times (reshuffled at every epoch if shuffle=True), with the ids of unperturbed
+        points recording the epoch they were seen in (i.e "o_idx_epoch"). The identities of the
+        points in X and y are only computed once and reused across epochs and calls to .run().
+
+        **Asynchronous attacks**: If attack_staleness > 0, the attacker crafts its poisons in a 
+        separate worker process (holding its own copy of the attacker, whose state is copied 
+        back to self.attacker at the end of each epoch). The poisons of episode t are crafted 
+        against a snapshot of the model taken before training on episode t - attack_staleness, 
+        while the simulator keeps defending and training on the preceding episodes, which hides 
+        the latency of expensive model-aware attackers (as would be the case for a real adversary).
+        The attacker and its arguments must then be picklable.
+
         Args:
             defender_args (dict) : dictionary containing extra arguments (other than the episode inputs
                                    X and labels y) for defender .defend() method.
@@ -400,28 +662,103 @@ class Simulator():
             defender_requires_model (bool) : specifies if the .defend() method of the defender requires 
                                              the updated model at each episode.
             shuffle (bool) : Boolean indicating if passed X and y should be shuffled in DataLoader.
+            epochs (int) : number of passes over X and y. Default = 1.
+            attack_staleness (int) : number of episodes by which the model the attacker crafts 
+                                     its poisons against lags behind (0 = synchronous attacks).
+                                     Default = 0.
+        """
+        if not epochs > 0:
+            raise ValueError('Number of epochs must be > 0.')
+        if not (isinstance(attack_staleness, int) and attack_staleness >= 0):
+            raise ValueError('Attack staleness must be an integer >= 0.')
+
+        #index/epoch combinations of original data are used as id's
+        self._get_point_idxs()
+        batch_queue = DataLoader(batch_size = self.batch_size) #initialise cache data loader
+
+        for _ in range(epochs):
+            self._run_epoch(batch_queue, defender_args, attacker_args, attacker_requires_model, 
+                            defender_requires_model, shuffle, attack_staleness)
+        
+        # Save the results to the results directory
+        if self.save:
+            save_pickle(self.results)
+
+    def _run_epoch(self, batch_queue, defender_args, attacker_args, attacker_requires_model, 
+                   defender_requires_model, shuffle, attack_staleness=0):
+        """
+        Run a single pass over the data stream (see .run() for a description of the arguments).
+
+        Args:
+            batch_queue (DataLoader) : cache data loader used to batch the training points.
         """
-        #save original data with index/epoch combination as id's
-        self._datapoint_ids = self._assign_ids(self.X, self.y)
         self.epoch += 1
         self.original_points += len(self.X)
 
         if self.attacker is None:
             self.not_poisoned += len(self.X)
 
+        #reshuffle the data stream differently at every epoch
         generator = DataLoader(self.X, self.y, batch_size = self.episode_size, 
-                               shuffle=shuffle) #initialise data stream
-        batch_queue = DataLoader(batch_size = self.batch_size) #initialise cache data loader
-        
-        with tqdm(generator, desc="Running simulation", unit="episode") as tepoch: 
+                               shuffle=shuffle, seed=69 + self.epoch - 1) #initialise data stream
+
+        #craft poisons of the first episodes asynchronously against the current model
+        crafter = None
+        if self.attacker and attack_staleness > 0:
+            if attacker_requires_model:
+                if "model" in self.true_attacker_args:
+                    attacker_args["model"] = self.model
+                else: 
+                    raise ArgNotFoundError("Argument 'model' was not found in .attack() method.")
+            valid_attacker_args = self._check_for_missing_args(input_args=attacker_args, is_attacker=True)
+            attacker_args = {key:value for key, value in attacker_args.items() if key in valid_attacker_args}
+
+            crafter = _AsyncCrafter(self.attacker, attacker_args)
+            for X_next, y_next in generator.peek(attack_staleness):
+                crafter.submit(X_next, y_next, self.model)
+
+        try:
+            self._run_episodes(generator, batch_queue, defender_args, attacker_args, 
+                               attacker_requires_model, defender_requires_model, 
+                               attack_staleness, crafter)
+        finally:
+            if crafter is not None:
+                crafter.close(self.attacker)
+
+    def _run_episodes(self, generator, batch_queue, defender_args, attacker_args, attacker_requires_model, 
+                      defender_requires_model, attack_staleness, crafter):
+        """
+        Pass the episodes of the data stream through the attacker, defender and model 
+        (see .run() for a description of the arguments).
+
+        Args:
+            generator (DataLoader) : data stream of episodes.
+            batch_queue (DataLoader) : cache data loader used to batch the training points.
+            crafter (_AsyncCrafter) : worker crafting the poisons if attacks are asynchronous, 
+                                      else None.
+        """
+        with tqdm(generator, desc=f"Running simulation (epoch {self.epoch})", unit="episode") as tepoch: 
             for episode, (X_episode, y_episode) in enumerate(tepoch):
                 orig_X_episode = copy(X_episode)
                 orig_y_episode = copy(y_episode)
                 #save ids of true points
                 self._log(X_episode, y_episode, checkpoint=0) #log results
 
+                # Attacker's turn to attack (asynchronously)
+                if self.attacker and crafter is not None:
+                    X_episode, y_episode, source_idxs = crafter.result()
+
+                    #craft poisons of a future episode against the current model
+                    upcoming = generator.peek(attack_staleness)
+                    if len(upcoming) == attack_staleness:
+                        crafter.submit(*upcoming[-1], self.model)
+
+                    self._shape_check(orig_X_episode, orig_y_episode, X_episode, y_episode)
+                    self._att_doubles = 0
+                    self._log(X_episode, y_episode, checkpoint=1, source_idxs=source_idxs) #log results
+
                 # Attacker's turn to attack
-                if self.attacker:
+                elif self.attacker:
                     if attacker_requires_model:
                         if "model" in self.true_attacker_args:
                             attacker_args["model"] = self.model
@@ -435,12 +772,14 @@ class Simulator():
                         attacker_args = {key:value for key, value in attacker_args.items() if key in valid_attacker_args}
                     
                     #pass episode datapoints to attacker
+                    self.attacker.source_idxs = None
                     X_episode, y_episode = self.attacker.attack(X_episode, y_episode, **attacker_args)
 
                     #check if shapes have been altered in .attack() method
                     self._shape_check(orig_X_episode, orig_y_episode, X_episode, y_episode)
                     self._att_doubles = 0
-                    self._log(X_episode, y_episode, checkpoint=1) #log results
+                    self._log(X_episode, y_episode, checkpoint=1, 
+                              source_idxs=self.attacker.source_idxs) #log results
 
                 # Defender's turn to defend
                 if self.defender:
@@ -464,38 +803,136 @@ class Simulator():
                     self._def_doubles = 0
                     self._log(X_episode, y_episode, checkpoint=2) #log results
 
-                batch_queue.add_to_cache(X_episode, y_episode) #add perturbed / filtered points to batch queue
-                
-                # Online learning loop
-                running_loss = 0
-                num_batches = len(batch_queue)
-                for (X_batch, y_batch) in batch_queue:
-                    
-                    try:
-                        #take a gradient descent step
-                        self.model.step(X_batch, y_batch) 
-                    except AttributeError:
-                        raise NotImplementedError("Model must have a .step() method to perform a gradient descent step.")
-
-                    if hasattr(self.model, 'losses'):
-                        loss = self.model.losses[-1]
-                        running_loss += loss.item()/len(X_batch)
-
-                if running_loss != 0:
-                    tepoch.set_postfix(loss=running_loss/num_batches)
-                else:
-                    tepoch.set_postfix(loss="n/a")
-
-                #save model state dictionary
-                state_dict = deepcopy(self.model.state_dict())
-                self.results['models'].append(state_dict)
-                self.episode += 1
+                if self.record:
+                    self._recorded_episodes.append((X_episode, y_episode))
+
+                #train model on perturbed / filtered points
+                self._train_on_episode(batch_queue, X_episode, y_episode, tepoch)
 
                 #reinitialize episode id lists for different checkpoints
                 self._original_ids = {}
                 self._attacked_ids = {}
                 self._defended_ids = {}
-        
+
+
+class _AsyncCrafter():
+    """
+    Crafts the poisons of an attacker in a worker process. The worker holds its own
+    copy of the attacker, on which the attacks are run in the order they are submitted,
+    such that its state (e.g random number generators, caches) evolves as it would 
+    with synchronous attacks.
+
+    Args:
+        attacker (Attacker) : attacker crafting the poisons.
+        attacker_args (dict) : extra arguments for the .attack() method of the attacker.
+    """
+    def __init__(self, attacker, attacker_args):
+        self.attacker_args = attacker_args
+        self._executor = ProcessPoolExecutor(max_workers=1, initializer=_init_crafter, 
+                                             initargs=(attacker,))
+        self._pending = deque()
+
+    def submit(self, X, y, model):
+        """Submit the crafting of the poisons of an episode against a snapshot of the model.
+
+        Args:
+            X (np.ndarray, torch.Tensor) : inputs of the episode.
+            y (np.ndarray, torch.Tensor) : labels of the episode.
+            model (torch.nn.Module) : current model (snapshotted before submission).
+        """
+        attacker_args = dict(self.attacker_args)
+        if "model" in attacker_args:
+            attacker_args["model"] = deepcopy(model)
+        self._pending.append(self._executor.submit(_craft_poisons, X, y, attacker_args))
+
+    def result(self):
+        """Wait for the poisons of the next episode.
+
+        Returns:
+            (tuple) : poisoned inputs and labels of the episode and the positions of 
+                      the points in the original episode (see Attacker.source_idxs).
+        """
+        return self._pending.popleft().result()
+
+    def close(self, attacker):
+        """Copy the state of the worker's attacker into the attacker and stop the worker.
+
+        Args:
+            attacker (Attacker) : attacker to update.
+        """
+        try:
+            if not self._pending:
+                attacker.__dict__.update(self._executor.submit(_crafter_state).result().__dict__)
+        finally:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown()
+
+
+class ReplaySimulator(Simulator):
+    """
+    Class used to train a model on an episode stream previously recorded by a 
+    Simulator instantiated with record=True. Since the attacker and defender do 
+    not intervene again, a ReplaySimulator runs at the speed of pure training, 
+    which is useful to compare different models (or learning rates) against 
+    the same poisoned and sanitized data when the attacker and defender do not 
+    depend on the model. The provenance counters (poisoned, not_poisoned, 
+    correctly_defended, incorrectly_defended, training_points, original_points) 
+    and checkpoint results of the recorded simulation are reused, so the 
+    ReplaySimulator can be passed to a PostProcessor like any other Simulator.
+
+    Args:
+        recording (dict, str) : recording as returned by Simulator.get_recording() or 
+                                path to a recording saved with Simulator.save_recording().
+        model (torch.nn.Module) : neural network model inheriting from torch.nn.Module to 
+                                  be trained on the recorded episodes. Must present a .step()
+                                  method.
+        batch_size (int) : batch size of model. If None, the batch size of the recorded 
+                           simulation is used (Default = None).
+        save (bool) : Boolean indicating if the results should be saved to the results
+                      directory after running the simulation.
+    """
+    def __init__(self, recording, model, batch_size=None, save=False) -> None:
+        if isinstance(recording, str):
+            recording = load_pickle(recording)
+        if not isinstance(model, torch.nn.Module):
+            raise TypeError('Niteshade only supports PyTorch models (i.e inheriting from torch.nn.Module).')
+        if batch_size is None:
+            batch_size = recording['batch_size']
+        if not batch_size > 0:
+             raise ValueError('Batch size must be > 0.')
+
+        self.model = model
+        self.batch_size = batch_size
+        self.num_episodes = recording['num_episodes']
+        self.attacker = None
+        self.defender = None
+        self.save = save
+        self.record = False
+        self.episode = 0
+        self.epoch = 0
+        self._episodes = recording['episodes']
+
+        #reuse provenance counters of the recorded simulation
+        for counter, value in recording['counters'].items():
+            setattr(self, counter, value)
+
+        self.results = {key: list(value) for key, value in recording['results'].items()}
+        self.results['models'] = []
+        self._recorded_episodes = []
+
+    def run(self) -> None:
+        """
+        Train the model on the recorded episodes, saving a snapshot of the model 
+        state dictionary after each episode in self.results["models"].
+        """
+        self.epoch += 1
+        batch_queue = DataLoader(batch_size = self.batch_size) #initialise cache data loader
+
+        with tqdm(self._episodes, desc="Replaying simulation", unit="episode") as tepoch: 
+            for X_episode, y_episode in tepoch:
+                self._train_on_episode(batch_queue, X_episode, y_episode, tepoch)
+
         # Save the results to the results directory
         if self.save:
             save_pickle(self.results)
@@ -514,6 +951,47 @@ class ShapeMismatchError(Exception):
 #  FUNCTIONS
 # =============================================================================
 
+def _nbytes(obj):
+    """Estimate the memory occupied by (nested) containers of 
+       NumPy arrays/PyTorch tensors.
+
+    Args: 
+        obj (any) : object to estimate the size of.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.element_size() * obj.nelement()
+    elif isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif isinstance(obj, dict):
+        return sum(_nbytes(key) + _nbytes(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return sum(_nbytes(item) for item in obj)
+    return sys.getsizeof(obj)
+
+def _init_crafter(attacker):
+    """Store the attacker in the worker process crafting the poisons (see _AsyncCrafter)."""
+    global _CRAFTER_ATTACKER
+    _CRAFTER_ATTACKER = attacker
+
+
+def _craft_poisons(X, y, attacker_args):
+    """Attack an episode with the attacker of the worker process (see _AsyncCrafter).
+
+    Args: 
+        X (np.ndarray, torch.Tensor) : inputs of the episode.
+        y (np.ndarray, torch.Tensor) : labels of the episode.
+        attacker_args (dict) : extra arguments for the .attack() method of the attacker.
+    """
+    _CRAFTER_ATTACKER.source_idxs = None
+    X, y = _CRAFTER_ATTACKER.attack(X, y, **attacker_args)
+    return X, y, _CRAFTER_ATTACKER.source_idxs
+
+
+def _crafter_state():
+    """Get the attacker of the worker process (see _AsyncCrafter)."""
+    return _CRAFTER_ATTACKER
+
+
 def wrap_results(simulators: dict):
     """Wrap results of different ran simulations.
 
@@ -17,6 +17,7 @@ import colorsys
 from datetime import datetime
 
 import numpy as np
+import scipy.sparse
 import torchvision
 import torchvision.transforms as transforms
 import torch
@@ -27,6 +28,120 @@ from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
 from matplotlib.colors import ListedColormap
 
 
+# =============================================================================
+#  CLASSES
+# =============================================================================
+
+class LabelCodec():
+    """Encode class labels as one-hot labels and decode them back, for NumPy 
+    arrays and PyTorch tensors (without converting between them).
+
+    The number of classes is cached the first time it is needed (from the 
+    largest label encoded or the width of the one-hot labels decoded), such 
+    that every batch is encoded with the same width. If sparse=True, labels 
+    are encoded as sparse matrices (scipy.sparse.csr_matrix for NumPy arrays 
+    and sparse COO tensors for PyTorch tensors); sparse and dense one-hot 
+    labels are both decoded.
+
+    Args:
+        num_classes (int) : (optional) number of classes.
+        sparse (bool) : encode labels as sparse matrices. Default = False.
+    """
+    def __init__(self, num_classes=None, sparse=False):
+        self.num_classes = num_classes
+        self.sparse = sparse
+
+    def _check_num_classes(self, num_classes, one_hot=False):
+        """Cache the number of classes or check that it is consistent with 
+        the labels (exactly for one-hot labels, as an upper bound for class labels)."""
+        if self.num_classes is None:
+            self.num_classes = num_classes
+        elif num_classes > self.num_classes or (one_hot and num_classes != self.num_classes):
+            raise ValueError(f"Labels have {num_classes} classes but the codec has "
+                             f"{self.num_classes} classes.")
+        return self.num_classes
+
+    def encode(self, y):
+        """Encode class labels as one-hot labels.
+
+        Args:
+            y (np.ndarray, torch.Tensor) : class labels (shape (batch_size,) or (batch_size, 1)).
+
+        Returns:
+            enc_y (np.ndarray, torch.Tensor, scipy.sparse.csr_matrix) : one-hot labels 
+                  (shape (batch_size, num_classes)).
+        """
+        if isinstance(y, torch.Tensor):
+            labels = y.reshape(-1).long()
+            num_classes = self._check_num_classes(int(labels.max()) + 1 if len(labels) else 0)
+            rows = torch.arange(len(labels), device=labels.device)
+            if self.sparse:
+                values = torch.ones(len(labels), device=labels.device)
+                return torch.sparse_coo_tensor(torch.stack([rows, labels]), values, 
+                                               (len(labels), num_classes))
+            enc_y = torch.zeros((len(labels), num_classes), device=labels.device)
+            enc_y[rows, labels] = 1
+            return enc_y
+
+        labels = np.asarray(y).reshape(-1).astype(np.int64)
+        num_classes = self._check_num_classes(int(labels.max()) + 1 if len(labels) else 0)
+        rows = np.arange(len(labels))
+        if self.sparse:
+            return scipy.sparse.csr_matrix((np.ones(len(labels)), (rows, labels)), 
+                                           shape=(len(labels), num_classes))
+        enc_y = np.zeros((len(labels), num_classes))
+        enc_y[rows, labels] = 1
+        return enc_y
+
+    def decode(self, y):
+        """Decode one-hot labels (dense or sparse) into class labels.
+
+        Args:
+            y (np.ndarray, torch.Tensor, scipy.sparse.spmatrix) : one-hot labels 
+              (shape (batch_size, num_classes), or (num_classes,) for a single label).
+
+        Returns:
+            labels (np.ndarray, torch.Tensor) : class labels (shape (batch_size,)).
+        """
+        if isinstance(y, torch.Tensor) and y.is_sparse:
+            self._check_num_classes(y.shape[1], one_hot=True)
+            y = y.coalesce()
+            rows, cols = y.indices()[:, y.values() != 0]
+            labels = torch.zeros(y.shape[0], dtype=torch.long, device=y.device)
+            labels[rows] = cols
+            return labels
+
+        if scipy.sparse.issparse(y):
+            self._check_num_classes(y.shape[1], one_hot=True)
+            y = y.tocoo()
+            nonzero = y.data != 0
+            labels = np.zeros(y.shape[0], dtype=np.int64)
+            labels[y.row[nonzero]] = y.col[nonzero]
+            return labels
+
+        if len(y.shape) == 1:
+            y = y.reshape(1, -1)
+        self._check_num_classes(y.shape[1], one_hot=True)
+
+        return y.argmax(1)
+
+    def to_labels(self, y, one_hot):
+        """Get the class labels of one-hot or class labels.
+
+        Args:
+            y (np.ndarray, torch.Tensor) : labels.
+            one_hot (bool) : whether the labels are one-hot encoded.
+
+        Returns:
+            labels (np.ndarray, torch.Tensor) : class labels (shape (batch_size,)).
+        """
+        if one_hot:
+            return self.decode(y)
+        if isinstance(y, torch.Tensor):
+            return y.reshape(-1).long()
+        return np.asarray(y).reshape(-1).astype(np.int64)
+
+
 # =============================================================================
 #  FUNCTIONS
 # =============================================================================
@@ -44,6 +159,21 @@ def copy(array_like):
     else: 
         raise TypeError("Niteshade only supports np.ndarray or torch.Tensor array-like objects.")
 
+def load_torch_func():
+    """Import torch.func, which provides the functional transforms (vmap, grad,
+    functional_call, ...) used to vectorise computations over models.
+
+    Returns:
+        func (module) : the torch.func module
+    """
+    try:
+        import torch.func as func
+    except ImportError:
+        raise ImportError("This functionality requires PyTorch >= 2.0 (torch.func).")
+
+    return func
+
+
 def get_time_stamp_as_string():
     """Get the current time stamp as a string.
     
@@ -96,6 +226,21 @@ def save_pickle(results, dirname='output', filename='default'):
     pickle.dump(results, open(f"{dirname}/{filename}", "wb"))
 
 
+def load_pickle(filename):
+    """Load results saved as a .pickle file with save_pickle().
+
+    Args:
+        filename (str) : path to the pickle file (including directory)
+
+    Returns:
+        results (any) : unpickled object
+    """
+    with open(filename, 'rb') as target:
+        results = pickle.load(target)
+
+    return results
+
+
 def load_model(filename):
     """Load a binary file containing a neural network.
 
@@ -125,22 +270,19 @@ def save_model(model, filename):
 
 
 def one_hot_encoding(y, num_classes):       
-    """ Perform one hot encoding of previiously decoded data.
+    """ Perform one hot encoding of previiously decoded data (see LabelCodec).
     
     Args:
         y (np.array, torch.tensor) : labels
         num_classes (int) : number of classes 
         
     Returns:
-        enc_y (np.array or torch.tensor) : encoded labels
+        enc_y (np.array) : encoded labels
     """
-    enc_y = np.zeros([np.shape(y)[0], num_classes])
-
-    for i in range(np.shape(y)[0]):
-        element = y[i]
-        enc_y[i][int(element)] = 1
+    if isinstance(y, torch.Tensor):
+        y = y.detach().cpu().numpy()
         
-    return enc_y
+    return LabelCodec(num_classes).encode(y)
 
 
 def check_num_of_classes(y):
@@ -183,25 +325,18 @@ def check_batch_size(y):
     
 
 def decode_one_hot(y):
-    """Decode one hot encoded data.
+    """Decode one hot encoded data (see LabelCodec).
     
     Args:
         y (np.array, torch.tensor) : labels (encoded)
     
     Returns:
-        new_y (np.array, torch.tensor) : labels (decoded)
+        new_y (np.array) : labels (decoded, shape (batch_size, 1))
     """
-    if check_batch_size(y) == 1:
-        y = y.reshape(1,-1)
-          
-    num_classes = np.shape(y)[1]
-    new_y = np.zeros([np.shape(y)[0], 1])
-    for i in range(num_classes):
-        y_col_current = y[:,i]
-        for j in range(np.shape(y)[0]):
-            if y_col_current[j] != 0:
-                new_y[j] = i
-    return new_y
+    if isinstance(y, torch.Tensor):
+        y = y.detach().cpu().numpy()
+
+    return LabelCodec().decode(y).reshape(-1, 1).astype(np.float64)
 
 
 def train_test_iris(test_size=0.2, val_size = None, rand_state=42):
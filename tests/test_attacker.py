@@ -16,12 +16,23 @@ import torch
 
 from niteshade.attack import LabelFlipperAttacker, AddLabeledPointsAttacker
 from niteshade.attack import RandomAttacker, BrewPoison, ChangeLabelAttacker
+from niteshade.attack import GradientMatchingAttacker, AttackerGroup, PoisonPoolAttacker
+from niteshade.attack import InfluenceAttacker, BackGradientAttacker, GreedyLabelFlipAttacker
+from niteshade.attack import BackdoorAttacker, FeatureCollisionAttacker, PGDAttacker
+from niteshade.attack import UniversalPerturbationAttacker
+from niteshade.models import IrisClassifier, MNISTClassifier
+from niteshade.utils import train_test_iris
 
 
 # =============================================================================
 #  FUNCTIONS
 # =============================================================================
 
+def _generate_poisons(seed):
+    """Generate a chunk of poisons (module level to be picklable)."""
+    rng = np.random.default_rng(seed)
+    return rng.random((10, 3)) + 10, np.full(10, 2)
+
 def test_LabelFlipperAttacker():
     dict = {1:2, 3:4}
     attacker = LabelFlipperAttacker(1, dict)
@@ -47,7 +58,58 @@ def test_LabelFlipperAttacker():
     # test correct operation with one_hot data
     expected = np.array([[0,1,0],[0,1,0],[0,0,1],[0,1,0],[0,1,0],[0,0,1]])
     assert np.array_equal(new_one_y, expected)
+
+def test_LabelFlipperAttacker_lookup():
+    attacker = LabelFlipperAttacker(1, {0:1, 1:0})
+    
+    # compiled lookup table and mapping matrix
+    assert np.array_equal(attacker.lookup_table(), np.array([1,0]))
+    assert np.array_equal(attacker.flip_matrix(3), np.array([[0,1,0],[1,0,0],[0,0,1]]))
+    with pytest.raises(ValueError):
+        LabelFlipperAttacker(1, {0:5}).flip_matrix(3)
+
+    # labels beyond the table are left unchanged
+    X = np.random.rand(4,3)
+    _, new_y = attacker.attack(X, np.array([0,1,2,7]))
+    assert np.array_equal(new_y, np.array([1,0,2,7]))
+
+    # one-hot tensors are flipped without decoding
+    Ty = torch.eye(3)[[0,1,2]]
+    _, new_Ty = LabelFlipperAttacker(1, {0:1, 1:0}, one_hot=True).attack(torch.tensor(X[:3]), Ty)
+    assert torch.equal(new_Ty, torch.eye(3)[[1,0,2]])
+
+    # per-point flipping is reproducible and only flips some of the points
+    y = np.zeros(1000, dtype=int)
+    _, new_y_1 = LabelFlipperAttacker(0.3, {0:1}, per_point=True, seed=0).attack(X, y)
+    _, new_y_2 = LabelFlipperAttacker(0.3, {0:1}, per_point=True, seed=0).attack(X, y)
+    assert np.array_equal(new_y_1, new_y_2)
+    assert 200 < new_y_1.sum() < 400
     
+def test_GreedyLabelFlipAttacker():
+    X = np.random.rand(100, 4)
+    y = np.random.randint(0, 3, size=100)
+    attacker = GreedyLabelFlipAttacker(0.1, flips_per_round=3, seed=0)
+    _, new_y = attacker.attack(X, y)
+
+    # budget of flips is used, each on a different point
+    flipped = np.flatnonzero(new_y != y)
+    assert len(flipped) == 10
+    assert np.array_equal(np.flatnonzero(attacker.source_idxs == -1), flipped)
+
+    # incrementally updated damage matches refitting the surrogate
+    damage = attacker.surrogate_loss(X, new_y, y) - attacker.surrogate_loss(X, y, y)
+    assert np.isclose(attacker.damage, damage)
+
+    # greedy flips are more damaging than random ones
+    _, random_y = RandomAttacker(0.1, seed=0).attack(X, y.copy())
+    assert damage > attacker.surrogate_loss(X, random_y, y) - attacker.surrogate_loss(X, y, y)
+
+    # one-hot tensors and the dual form of the surrogate (more features than points)
+    Ty = torch.eye(3)[torch.tensor(y[:10])]
+    _, new_Ty = GreedyLabelFlipAttacker(0.2, one_hot=True).attack(torch.rand(10, 20), Ty)
+    assert (new_Ty != Ty).any(1).sum() == 2
+    assert torch.equal(new_Ty.sum(1), torch.ones(10))
+
 def test_AddLabeledPointsAttacker():
     attacker = AddLabeledPointsAttacker(1, 0)
     X = np.random.rand(10, 3)
@@ -70,6 +132,23 @@ def test_AddLabeledPointsAttacker():
     # test output typs is tensor when input type is tensor
     assert [type(new_TX), type(new_Ty)] == [torch.Tensor,torch.Tensor]
     
+def test_AddLabeledPointsAttacker_indices():
+    attacker = AddLabeledPointsAttacker(0.3, 5, seed=0)
+    X = np.random.rand(10, 3)
+    y = np.random.randint(0, 3, size=10)
+    new_X, new_y = attacker.attack(X, y)
+    
+    # injected points are reported by position in the output
+    assert len(attacker.injected_idxs) == 3
+    assert np.all(new_y[attacker.injected_idxs] == 5)
+    assert np.all(attacker.source_idxs[attacker.injected_idxs] == -1)
+
+    # original points are reported by position in the input
+    kept = attacker.source_idxs >= 0
+    assert np.array_equal(np.sort(attacker.source_idxs[kept]), np.arange(10))
+    assert np.array_equal(new_X[kept], X[attacker.source_idxs[kept]])
+    assert np.array_equal(new_y[kept], y[attacker.source_idxs[kept]])
+
 def test_RandomAttacker():
     attacker = RandomAttacker(0.5)
     X = np.random.rand(10,3)
@@ -101,34 +180,63 @@ def test_RandomAttacker():
     
     # test correct operation with one_hot data
     assert np.shape(new_one_y)[1] == 3
+
+def test_RandomAttacker_rng():
+    X = np.random.rand(20,3)
+    y = np.tile(np.array([0,1,2,3]), 5)
+
+    # attacks are reproducible given a seed and change a random subset of points
+    _, new_y_1 = RandomAttacker(0.25, seed=0).attack(X, y.copy())
+    _, new_y_2 = RandomAttacker(0.25, seed=0).attack(X, y.copy())
+    assert np.array_equal(new_y_1, new_y_2)
+    assert np.sum(new_y_1 != y) == 5
+    assert set(new_y_1) <= set(y)
+
+    # one-hot labels are changed natively (still valid one-hot rows)
+    one_hot_y = np.eye(4)[y]
+    _, new_one_y = RandomAttacker(0.25, one_hot=True, seed=0).attack(X, one_hot_y.copy())
+    assert np.array_equal(new_one_y.sum(axis=1), np.ones(20))
+    assert np.sum(new_one_y.argmax(axis=1) != y) == 5
+
+    # tensors are attacked with the attacker's torch.Generator
+    Ty = torch.tensor(y)
+    _, new_Ty = RandomAttacker(0.25, seed=0).attack(torch.tensor(X), Ty.clone())
+    assert isinstance(new_Ty, torch.Tensor)
+    assert torch.sum(new_Ty != Ty).item() == 5
     
+def test_native_backends():
+    # tensors (including ones requiring grad) are attacked without copies
+    TX = torch.rand(10, 3, requires_grad=True)
+    Ty = torch.tensor([0,1,2,0,1,2,0,1,2,0])
+    new_TX, new_Ty = RandomAttacker(0.5, seed=0).attack(TX, Ty)
+    assert new_TX is TX and new_Ty is Ty
+
+    new_TX, new_Ty = LabelFlipperAttacker(1, {0:1}).attack(TX, Ty)
+    assert new_TX is TX and torch.equal(new_Ty == 1, (Ty == 0) | (Ty == 1))
+
+    new_TX, new_Ty = AddLabeledPointsAttacker(0.5, 3, seed=0).attack(TX, Ty)
+    assert [type(new_TX), type(new_Ty)] == [torch.Tensor, torch.Tensor]
+    assert new_TX.shape == (15, 3) and torch.sum(new_Ty == 3).item() == 5
+
+    # one-hot labels keep their encoding when points are added
+    one_hot_y = np.eye(3)[[0,1,2,0,1,2,0,1,2,0]]
+    _, new_one_y = AddLabeledPointsAttacker(0.5, 2, one_hot=True).attack(TX.detach().numpy(), one_hot_y)
+    assert new_one_y.shape == (15, 3) and new_one_y[:,2].sum() == 8
+
 def test_BrewPoison():
     attacker = BrewPoison(0)
     X_1 = torch.tensor([[1,2],[3,4]])
     X_2 = torch.tensor([[1,3],[2,4]])
     X_3 = torch.tensor([[1,4],[2,3]])
-    X_list = [X_1, X_2, X_3]
+    X_stack = torch.stack([X_1, X_2, X_3])
     pert = torch.tensor([[1,1],[1,1]])
-    pert_list = attacker.apply_pert(X_list, pert)
+    perturbed_X = attacker.apply_pert(X_stack, pert)
     
     # test apply_pert method
     pert_1 = torch.tensor([[2,3],[4,5]])
     pert_2 = torch.tensor([[2,4],[3,5]])
     pert_3 = torch.tensor([[2,5],[3,4]])
-    exp_list = [pert_1, pert_2, pert_3]
-    for i in range(len(exp_list)):
-        assert torch.equal(exp_list[i], pert_list[i])
-        
-    X = torch.rand(3, 28, 28)
-    pert = torch.rand(3, 28, 28)
-    alpha = 0.5
-    new_pert = attacker.get_new_pert(pert, alpha, X)
-    
-    # test get_new_pert method
-    inf_norm = torch.max(torch.abs(pert.reshape(-1,1)))
-    limit = 0.5*inf_norm
-    inf_norm_new = torch.max(torch.abs(new_pert.reshape(-1,1)))
-    assert inf_norm_new <= limit
+    assert torch.equal(perturbed_X, torch.stack([pert_1, pert_2, pert_3]))
     
     curr = 10
     total = 20
@@ -142,8 +250,392 @@ def test_BrewPoison():
     
     # test reset ep
     assert new_curr == 0
+
+def test_BrewPoison_batched():
+    class MaxModel(torch.nn.Module):
+        """Misclassifies points whose max value is above 0.5."""
+        def forward(self, x):
+            score = x.reshape(len(x), -1).max(dim=1)[0] - 0.5
+            return torch.stack([-score, score], dim=1)
+
+    X = torch.zeros(200, 3, 4, 4)
+    X[-1] = 1
+    y = torch.zeros(200, dtype=torch.long)
+    y[100:] = 1
+    attacker = BrewPoison(0, M=100, aggressiveness=0.4, start_ep=0, seed=0)
+    new_X, new_y = attacker.attack(X.clone(), y, MaxModel())
+
+    # only points of the target label are perturbed, up to the budget
+    changed = (new_X != X).reshape(200, -1).any(dim=1)
+    assert changed.sum().item() == 80
+    assert torch.all(y[changed] == 0)
+
+    # every perturbed point is misclassified and channels share the perturbation
+    preds = MaxModel()(new_X[changed]).argmax(dim=1)
+    assert torch.all(preds == 1)
+    assert torch.equal(new_X[changed][:,0], new_X[changed][:,1])
+
+    # shrinking perturbations are limited by alpha times their infinity norm
+    perts = torch.rand(5, 1, 4, 4)
+    new_perts = attacker.shrink_perts(perts, 0.5)
+    limits = 0.5 * perts.reshape(5, -1).max(dim=1)[0]
+    assert torch.all(new_perts.reshape(5, -1).max(dim=1)[0] <= limits)
+
+    # NumPy inputs (float64) are attacked and returned as NumPy arrays
+    attacker = BrewPoison(0, M=100, aggressiveness=0.4, start_ep=0, seed=0)
+    X_np, y_np = X.double().numpy(), y.numpy()
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, MaxModel())
+    assert isinstance(new_X, np.ndarray)
+    changed = (new_X != X_np).reshape(200, -1).any(axis=1)
+    assert changed.sum() == 80
+    assert np.all(y_np[changed] == 0)
+    assert np.array_equal(new_y, y_np)
+
+
+def test_GradientMatchingAttacker():
+    model = IrisClassifier(seed=0)
+    X = torch.rand(40, 4)
+    y = torch.arange(40) % 3
+    X_target = torch.rand(5, 4)
+    attacker = GradientMatchingAttacker(X_target, adv_label=2, label=0, aggressiveness=0.2, 
+                                        eps=0.05, steps=20, seed=0)
+    new_X, new_y = attacker.attack(X.clone(), y, model)
+
+    # only points of the poisoned label are perturbed, up to the budget and eps
+    changed = (new_X != X).any(dim=1)
+    assert changed.sum().item() == 8
+    assert torch.all(y[changed] == 0)
+    assert torch.all((new_X - X).abs() <= 0.05 + 1e-6)
+    assert torch.equal(new_y, y)
+
+    # the poison gradient is aligned with the adversarial target gradient
+    assert len(attacker.alignments) == 20
+    assert attacker.alignments[-1] > attacker.alignments[0]
+
+    # no candidates to poison leaves the batch untouched
+    X_other = torch.rand(10, 4)
+    new_X_other, _ = attacker.attack(X_other, torch.ones(10, dtype=torch.long), model)
+    assert new_X_other is X_other
+
+    # NumPy inputs with one-hot labels are returned as NumPy arrays
+    X_np, y_np, _, _ = train_test_iris()
+    attacker = GradientMatchingAttacker(X_target, adv_label=2, label=0, aggressiveness=0.2, 
+                                        eps=0.05, steps=5, one_hot=True, seed=0)
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, model)
+    assert isinstance(new_X, np.ndarray) and new_y is y_np
+    changed = (new_X != X_np).any(axis=1)
+    assert 0 < changed.sum() <= int(len(X_np) * 0.2) and np.all(y_np[changed, 0] == 1)
+    assert np.all(np.abs(new_X - X_np) <= 0.05 + 1e-5)
+
+def test_AttackerGroup():
+    X = np.random.rand(20, 3)
+    y = np.tile(np.array([0,1,2,3]), 5)
+    group = AttackerGroup([LabelFlipperAttacker(1, {0:1}),
+                           AddLabeledPointsAttacker(0.5, 3, seed=1), 
+                           RandomAttacker(0.5, seed=2)], 
+                          budgets=[None, None, 0.5], seed=0)
+    new_X, new_y = group.attack(X, y.copy())
+
+    # 5 flipped + 10 injected + up to 7 relabelled points
+    assert len(new_X) == len(new_y) == 30
+    assert np.sum(group.source_idxs == -1) >= 15
+
+    # unmodified points are traced back to their position in the input batch
+    kept = group.source_idxs >= 0
+    assert np.array_equal(new_X[kept], X[group.source_idxs[kept]])
+    assert np.array_equal(new_y[kept], y[group.source_idxs[kept]])
+    assert not np.any(y[group.source_idxs[kept]] == 0)
+
+    # budgeted attackers which don't add points modify them at their positions
+    group = AttackerGroup([RandomAttacker(1, seed=1)], budgets=[0.5], seed=0)
+    new_X, new_y = group.attack(X, y.copy())
+    modified = group.source_idxs == -1
+    assert np.array_equal(new_X, X)
+    assert np.array_equal(group.source_idxs[~modified], np.flatnonzero(~modified))
+    assert np.array_equal(new_y[~modified], y[~modified])
+    assert 0 < modified.sum() <= 10
+
+    # attackers are skipped according to their probabilities
+    group = AttackerGroup([AddLabeledPointsAttacker(0.5, 3)], probabilities=[0])
+    new_X, new_y = group.attack(X, y)
+    assert new_X is X and np.array_equal(group.source_idxs, np.arange(20))
+
+    # group arguments are the union of the ones of the attackers
+    group = AttackerGroup([RandomAttacker(0.5), BrewPoison(0)])
+    assert group.attack_args() == (['self', 'X', 'y', 'model'], None)
+
+    with pytest.raises(ValueError):
+        AttackerGroup([RandomAttacker(0.5)], budgets=[0.5, 0.5])
+    with pytest.raises(TypeError):
+        AttackerGroup([None])
+
+def test_PoisonPoolAttacker(tmp_path):
+    manifest_path = PoisonPoolAttacker.build_pool(_generate_poisons, range(4), 
+                                                  dirname=str(tmp_path), num_workers=2)
+    attacker = PoisonPoolAttacker.from_manifest(manifest_path, budget=[5, 30, 10], seed=0)
+    assert len(attacker.X_pool) == 40
+
+    X = np.random.rand(20, 3)
+    y = np.zeros(20, dtype=int)
+    injected = []
+    for num_expected in [5, 30, 5, 0]:
+        new_X, new_y = attacker.attack(X, y)
+        assert len(new_X) == 20 + num_expected
+        assert np.all(new_X[attacker.injected_idxs] >= 10)
+        assert np.all(new_y[attacker.injected_idxs] == 2)
+        injected.append(new_X[attacker.injected_idxs])
+
+    # each poison of the pool is injected once
+    assert len(np.unique(np.concatenate(injected), axis=0)) == 40
+
+    # fractional budgets and tensor batches
+    attacker = PoisonPoolAttacker.from_manifest(manifest_path, budget=0.5, mmap=False)
+    new_TX, new_Ty = attacker.attack(torch.tensor(X), torch.tensor(y))
+    assert [type(new_TX), type(new_Ty)] == [torch.Tensor, torch.Tensor]
+    assert len(new_TX) == 30 and new_TX.dtype == torch.float64
+
+def test_InfluenceAttacker():
+    torch.manual_seed(0)
+    model = torch.nn.Linear(4, 3)
+    model.loss_func = torch.nn.CrossEntropyLoss()
+    X = torch.rand(30, 4)
+    y = torch.arange(30) % 3
+    X_test, y_test = torch.rand(10, 4), torch.arange(10) % 3
+
+    # conjugate gradient solves the damped Hessian system of a convex model
+    attacker = InfluenceAttacker(X_test, y_test, solver='cg', hvp_steps=50, damping=0.01)
+    params = list(model.parameters())
+    vec = torch.rand(15)
+    s_test = attacker.inverse_hvp(model, params, X, y, vec)
+    grads = torch.autograd.grad(model.loss_func(model(X), y), params, create_graph=True)
+    grads = torch.cat([grad.reshape(-1) for grad in grads])
+    hvp = torch.cat([g.reshape(-1) for g in torch.autograd.grad(grads @ s_test, params)])
+    assert torch.allclose(hvp + 0.01 * s_test, vec, atol=1e-3)
+
+    # estimates are cached and warm-start the next estimation
+    attacker.hvp_steps = 0
+    assert torch.equal(attacker.inverse_hvp(model, params, X, y, vec), s_test)
+
+    # LiSSA solves the same damped system as conjugate gradient
+    lissa = InfluenceAttacker(X_test, y_test, solver='lissa', hvp_steps=1000, damping=0.1, 
+                              scale=5.0, warm_start=False)
+    cg = InfluenceAttacker(X_test, y_test, solver='cg', hvp_steps=50, damping=0.1)
+    assert torch.allclose(lissa.inverse_hvp(model, params, X, y, vec), 
+                          cg.inverse_hvp(model, params, X, y, vec), atol=1e-3)
+
+    # a subset of the batch is perturbed within eps
+    attacker = InfluenceAttacker(X_test, y_test, aggressiveness=0.2, eps=0.05, label=1, seed=0)
+    new_X, new_y = attacker.attack(X.clone(), y, model)
+    changed = (new_X != X).any(dim=1)
+    assert 0 < changed.sum().item() <= 6 and torch.all(y[changed] == 1)
+    assert torch.all((new_X - X).abs() <= 0.05 + 1e-6)
+    assert attacker.inverse_hvp_cache.shape == (15,)
+    assert torch.equal(new_y, y)
+
+    # NumPy inputs with one-hot labels are returned as NumPy arrays
+    X_np, y_np, X_test_np, y_test_np = train_test_iris()
+    attacker = InfluenceAttacker(X_test_np, y_test_np, aggressiveness=0.2, eps=0.05, label=1, 
+                                 hvp_steps=5, one_hot=True, seed=0)
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, IrisClassifier(seed=0))
+    assert isinstance(new_X, np.ndarray) and new_y is y_np
+    changed = (new_X != X_np).any(axis=1)
+    assert 0 < changed.sum() <= int(len(X_np) * 0.2) and np.all(y_np[changed, 1] == 1)
+    assert np.all(np.abs(new_X - X_np) <= 0.05 + 1e-5)
+
+def test_BackGradientAttacker():
+    torch.manual_seed(0)
+    model = torch.nn.Linear(4, 3)
+    model.loss_func = torch.nn.CrossEntropyLoss()
+    model.lr = 0.5
+    X = torch.rand(30, 4)
+    y = torch.arange(30) % 3
+    X_val, y_val = torch.rand(10, 4), torch.arange(10) % 3
+    state_dict = {key: value.clone() for key, value in model.state_dict().items()}
+
+    # horizon is truncated to fit the memory budget (15 float32 parameters)
+    attacker = BackGradientAttacker(X_val, y_val, horizon=10, memory_budget=400)
+    assert attacker.get_horizon(dict(model.named_parameters())) == 2
+
+    attacker = BackGradientAttacker(X_val, y_val, aggressiveness=0.3, eps=0.2, steps=10,
+                                    horizon=3, seed=0)
+    new_X, new_y = attacker.attack(X.clone(), y, model)
+
+    # poisons increase the validation loss after the unrolled training
+    assert attacker.val_losses[-1] > attacker.val_losses[0]
+    changed = (new_X != X).any(dim=1)
+    assert 0 < changed.sum().item() <= 9
+    assert torch.all((new_X - X).abs() <= 0.2 + 1e-6)
+
+    # the model itself is not trained by the attacker
+    for key, value in model.state_dict().items():
+        assert torch.equal(value, state_dict[key])
+
+    # NumPy inputs with one-hot labels are returned as NumPy arrays
+    X_np, y_np, X_val_np, y_val_np = train_test_iris()
+    attacker = BackGradientAttacker(X_val_np, y_val_np, aggressiveness=0.1, eps=0.2, steps=2,
+                                    horizon=2, one_hot=True, seed=0)
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, IrisClassifier(seed=0))
+    assert isinstance(new_X, np.ndarray) and new_y is y_np
+    changed = (new_X != X_np).any(axis=1)
+    assert 0 < changed.sum() <= int(len(X_np) * 0.1)
+    assert np.all(np.abs(new_X - X_np) <= 0.2 + 1e-5)
     
-    
+def test_BackdoorAttacker():
+    X = np.zeros((20, 1, 28, 28))
+    y = np.arange(20) % 10
+    attacker = BackdoorAttacker(np.ones((3, 3)), target=0, aggressiveness=0.5, seed=0)
+    new_X, new_y = attacker.attack(X, y)
+
+    # points are stamped and relabelled in place
+    stamped = np.flatnonzero(attacker.source_idxs == -1)
+    assert new_X is X and new_y is y
+    assert len(stamped) == 10
+    assert (X[stamped, 0, -3:, -3:] == 1).all() and X.sum() == 10 * 9
+    assert (y[stamped] == 0).all()
+
+    # blended triggers on flattened tensors with one-hot labels
+    TX = torch.zeros(10, 16)
+    Ty = torch.eye(2)[torch.ones(10, dtype=torch.long)]
+    blend = BackdoorAttacker(torch.ones(4, 4), target=0, aggressiveness=0.3, mode='blend', 
+                             alpha=0.5, image_shape=(4, 4), one_hot=True, seed=0)
+    blend.attack(TX, Ty)
+    assert torch.equal(TX.sum(1) > 0, Ty[:,0] == 1)
+    assert torch.allclose(TX[Ty[:,0] == 1], torch.full((3, 16), 0.5))
+
+    with pytest.raises(ValueError):
+        BackdoorAttacker(np.ones((3, 3)), 0, position=(27, 0)).stamp(X)
+
+    # success rate on the whole stamped test set
+    X_test = np.random.rand(20, 1, 28, 28).astype(np.float32)
+    rate = attacker.attack_success_rate(MNISTClassifier(), X_test, np.arange(20) % 10)
+    assert 0 <= rate <= 1
+    assert X_test[:, 0, -3:, -3:].max() < 1 #test set is not modified
+
+def test_FeatureCollisionAttacker():
+    torch.manual_seed(0)
+    model = MNISTClassifier()
+    X = torch.rand(40, 1, 28, 28)
+    y = torch.arange(40) % 10
+    X_target = torch.rand(1, 28, 28)
+    attacker = FeatureCollisionAttacker(X_target, base_label=3, aggressiveness=0.5, 
+                                        lr=0.1, steps=50, seed=0)
+    extractor = attacker.feature_extractor(model)
+
+    model.eval()
+    with torch.no_grad():
+        target_feats = extractor(X_target[None])
+        base_dists = ((extractor(X) - target_feats)**2).sum(1).sqrt()
+    new_X, new_y = attacker.attack(X.clone(), y, model)
+
+    # penultimate layer features of the model (inputs of its last linear layer)
+    assert target_feats.shape == (1, 50)
+
+    # the base images of the poisons are points of the base class (clean-label)
+    poisoned = np.flatnonzero(attacker.source_idxs == -1)
+    assert len(poisoned) == 4
+    assert (y[poisoned] == 3).all() and torch.equal(new_y, y)
+    assert (new_X[poisoned] != X[poisoned]).any()
+    assert np.array_equal(np.delete(new_X.numpy(), poisoned, 0), np.delete(X.numpy(), poisoned, 0))
+
+    # features of the poisons moved towards the target's features (the best 
+    # iterate of each poison is returned, entries ordered by position)
+    assert (attacker.feature_distances < base_dists[poisoned]).all()
+    assert (attacker.iterations <= 50).all()
+    with torch.no_grad():
+        new_dists = ((extractor(new_X[poisoned]) - target_feats)**2).sum(1).sqrt()
+    assert torch.allclose(new_dists, attacker.feature_distances, atol=1e-5)
+
+    # NumPy inputs with one-hot labels are returned as NumPy arrays
+    X_np, y_np, X_test_np, _ = train_test_iris()
+    attacker = FeatureCollisionAttacker(X_test_np[0], base_label=0, aggressiveness=0.1, 
+                                        lr=0.1, steps=5, one_hot=True, seed=0)
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, IrisClassifier(seed=0))
+    assert isinstance(new_X, np.ndarray) and new_y is y_np
+    poisoned = np.flatnonzero(attacker.source_idxs == -1)
+    assert len(poisoned) == int(len(X_np) * 0.1) and np.all(y_np[poisoned, 0] == 1)
+    assert np.array_equal(np.delete(new_X, poisoned, 0), np.delete(X_np, poisoned, 0))
+
+def test_PGDAttacker():
+    torch.manual_seed(0)
+    model = IrisClassifier()
+    X = torch.rand(20, 4)
+    y = torch.eye(3)[torch.arange(20) % 3]
+    loss = model.loss_func(model.forward(X), y.argmax(1)).item()
+
+    attacker = PGDAttacker(aggressiveness=1, eps=0.1, steps=5, chunk_size=7, one_hot=True, seed=0)
+    new_X, new_y = attacker.attack(X.clone(), y, model)
+
+    # perturbations are bounded and increase the loss of the model
+    assert torch.all((new_X - X).abs() <= 0.1 + 1e-6)
+    assert model.loss_func(model.forward(new_X), y.argmax(1)).item() > loss
+    assert torch.equal(new_y, y)
+
+    # repeated points start from their last perturbation
+    assert len(attacker.perturbations) == 20
+    warm_X, _ = PGDAttacker(1, eps=0.1, steps=1, lr=0, one_hot=True).attack(X.clone(), y, model)
+    assert torch.equal(warm_X, X)
+    attacker.steps = 0
+    warm_X, _ = attacker.attack(X.clone(), y, model)
+    assert torch.allclose(warm_X, new_X)
+
+    # perturbations bounded in L2 norm
+    l2_X, _ = PGDAttacker(0.5, eps=0.1, steps=5, norm='l2', one_hot=True).attack(X.clone(), y, model)
+    assert torch.all((l2_X - X).norm(dim=1) <= 0.1 + 1e-6)
+    assert ((l2_X - X).norm(dim=1) > 0).sum() == 10
+
+    # stored perturbations are capped, evicting the least recently used ones
+    capped = PGDAttacker(aggressiveness=1, eps=0.1, steps=1, max_cached=5, one_hot=True, seed=0)
+    capped.attack(X.clone(), y, model)
+    assert len(capped.perturbations) == 5
+    X_new = torch.rand(20, 4)
+    capped.attack(X_new.clone(), y, model)
+    assert len(capped.perturbations) == 5
+    assert set(capped.perturbations).issubset(capped._keys(X_new))
+    with pytest.raises(ValueError):
+        PGDAttacker(max_cached=0)
+
+    # NumPy inputs with one-hot labels are returned as NumPy arrays
+    X_np, y_np, _, _ = train_test_iris()
+    attacker = PGDAttacker(aggressiveness=0.5, eps=0.1, steps=2, one_hot=True, seed=0)
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, model)
+    assert isinstance(new_X, np.ndarray) and new_y is y_np
+    assert (np.abs(new_X - X_np) > 0).any(axis=1).sum() <= len(X_np) // 2
+    assert np.all(np.abs(new_X - X_np) <= 0.1 + 1e-5)
+
+def test_UniversalPerturbationAttacker():
+    torch.manual_seed(0)
+    model = IrisClassifier()
+    attacker = UniversalPerturbationAttacker(aggressiveness=0.5, eps=0.2, steps=2, 
+                                             one_hot=True, seed=0)
+
+    # the perturbation is refined across episodes
+    for _ in range(5):
+        X = torch.rand(20, 4)
+        y = torch.eye(3)[torch.randint(0, 3, (20,))]
+        new_X, new_y = attacker.attack(X.clone(), y, model)
+
+        perturbed = torch.from_numpy(attacker.source_idxs == -1)
+        assert perturbed.sum() == 10
+        assert torch.equal(new_X[~perturbed], X[~perturbed]) and torch.equal(new_y, y)
+
+    assert attacker.delta.shape == (4,)
+    assert attacker.delta.abs().max() <= 0.2 + 1e-6
+    assert len(attacker.losses) == 5
+
+    # the same perturbation is added to all poisoned points (up to the data range)
+    diff = (new_X - X)[perturbed]
+    inside = ((X[perturbed] + attacker.delta) <= X.max()) & ((X[perturbed] + attacker.delta) >= X.min())
+    assert torch.allclose(diff[inside], attacker.delta.expand_as(diff)[inside], atol=1e-6)
+
+    # NumPy inputs with one-hot labels are returned as NumPy arrays
+    X_np, y_np, _, _ = train_test_iris()
+    new_X, new_y = attacker.attack(X_np.copy(), y_np, model)
+    assert isinstance(new_X, np.ndarray) and new_y is y_np
+    perturbed = attacker.source_idxs == -1
+    assert perturbed.sum() == len(X_np) // 2
+    assert np.array_equal(new_X[~perturbed], X_np[~perturbed])
+    assert np.all(np.abs(new_X - X_np) <= 0.2 + 1e-5)
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
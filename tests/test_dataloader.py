@@ -10,11 +10,13 @@ Unit tests for the dataloader class.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 
+import pickle
+
 import pytest
 import numpy as np
 import torch
 
-from niteshade.data import DataLoader
+from niteshade.data import DataLoader, DatasetRegistry, SharedArray, resolve_array
 
 
 # =============================================================================
@@ -181,6 +183,37 @@ def test_pytorch_tensor_compatibility():
         assert type(batch[1]) == torch.Tensor
 
 
+def test_shared_registry():
+    """ Make sure registered datasets are shared and released correctly. """
+    X = np.random.rand(20, 3)
+    y = torch.arange(20)
+
+    with DatasetRegistry() as registry:
+        X_handle, y_handle = registry.register("train", X, y)
+
+        # Handles only pickle metadata and re-attach to the same data
+        X_copy = pickle.loads(pickle.dumps(X_handle))
+        assert len(pickle.dumps(X_handle)) < X.nbytes
+        assert np.array_equal(resolve_array(X_copy), X)
+        assert isinstance(y_handle.array, torch.Tensor)
+        assert torch.equal(resolve_array(y_handle), y)
+
+        # Views are shared between handles
+        X_handle.array[0, 0] = -1
+        assert X_copy.array[0, 0] == -1
+        X_copy.close()
+
+        # Dataset is only released when its reference count reaches 0
+        registry.acquire("train")
+        registry.release("train")
+        assert "train" in registry
+        registry.release("train")
+        assert "train" not in registry
+
+        with pytest.raises(FileNotFoundError):
+            SharedArray(X_handle.name, X.shape, X.dtype).array
+
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
@@ -10,12 +10,16 @@ Unit tests for various defender classes.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 
+import pickle
 import unittest
 import torch
 import pytest
 import numpy as np
 
 from niteshade.defence import FeasibleSetDefender, Distance_metric, DefenderGroup, KNN_Defender
+from niteshade.defence import _NeighbourIndex, SoftmaxDefender
+from niteshade.data import DatasetRegistry
+from sklearn.neighbors import NearestNeighbors
 
 
 # =============================================================================
@@ -167,6 +171,29 @@ class GroupDefender_test(unittest.TestCase):
         self.assertEqual(x.shape, test_datapoints.shape)
 
 
+class ModelDefender_test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.model = torch.nn.Softmax(dim = 1) # Inputs are the logits of the points
+        self.x = np.array([[5., 0., 0.], [0., 5., 0.], [0., 0., 5.], [5., 0., 0.]])
+        self.y = np.array([0, 0, 2, 1])
+
+    def test_SoftmaxDefender(self):
+        defender = SoftmaxDefender(threshold = 0.5, one_hot = False)
+        x, y = defender.defend(self.x, self.y, self.model)
+        self.assertTrue(np.array_equal(x, self.x[[0, 2]]))
+        self.assertTrue(np.array_equal(y, np.array([0, 2])))
+
+    def test_SoftmaxDefender_onehot(self):
+        # One-hot labels are decoded to select the confidences and returned one-hot
+        defender = SoftmaxDefender(threshold = 0.5, one_hot = True)
+        y_onehot = np.eye(3)[self.y]
+        x, y = defender.defend(self.x, y_onehot, self.model)
+        self.assertTrue(np.array_equal(x, self.x[[0, 2]]))
+        self.assertTrue(np.array_equal(y, y_onehot[[0, 2]]))
+        x, y = defender.defend(torch.tensor(self.x), torch.tensor(y_onehot), self.model)
+        self.assertEqual(tuple(y.shape), (2, 3))
+
+
 class PointModifier_test(unittest.TestCase):
     def setUp(self) -> None:
         self.x = np.ones((16,3,4,4))
@@ -213,6 +240,70 @@ class PointModifier_test(unittest.TestCase):
         self.assertIsInstance(model_datapoints, torch.Tensor)
         self.assertIsInstance(model_labels, torch.Tensor)
 
+    def test_KNN_Defender_incremental_index(self):
+        rng = np.random.default_rng(0)
+        index = _NeighbourIndex(rng.random((20, 5)), np.zeros(20), min_delta = 8)
+        for _ in range(15):
+            x, y = rng.random((7, 5)), np.ones(7)
+            index.insert(x, y)
+            queries = rng.random((4, 5))
+            distances, indeces = index.kneighbors(queries, 5)
+            # Same neighbours as an index built on all the points
+            true_distances, true_indeces = NearestNeighbors().fit(index.x).kneighbors(queries, 5)
+            self.assertTrue(np.array_equal(indeces, true_indeces))
+            self.assertTrue(np.allclose(distances, true_distances))
+        self.assertEqual(len(index), 20 + 15 * 7)
+        self.assertEqual(index.y.sum(), 15 * 7)
+        self.assertGreaterEqual(len(index._x), len(index))
+        with self.assertRaises(ValueError):
+            index.kneighbors(queries, len(index) + 1)
+
+    def test_KNN_Defender_index_rebuild(self):
+        rng = np.random.default_rng(0)
+        index = _NeighbourIndex(rng.random((1000, 5)), np.zeros(1000), min_delta = 10, delta_fraction = 0.1)
+        self.assertEqual(index.rebuilds, 1)
+        # The delta is capped at a fraction of the bulk before the bulk index is rebuilt
+        for _ in range(20):
+            index.insert(rng.random((10, 5)), np.ones(10))
+            self.assertLess(len(index) - index._indexed, max(0.1 * index._indexed, 10))
+        self.assertEqual(index.rebuilds, 2)
+        self.assertEqual(index._indexed, 1100)
+
+    def test_shared_initial_dataset(self):
+        x, y = np.random.rand(500, 3, 4, 4), np.zeros(500)
+        with DatasetRegistry() as registry:
+            x_handle, y_handle = registry.register("init", x, y)
+            # Pickling the defenders only pickles the shared memory handles
+            for defender in [KNN_Defender(init_x = x_handle, init_y = y_handle, nearest_neighbours = 3, 
+                                          confidence_threshold = 0.5),
+                             FeasibleSetDefender(x_handle, y_handle, 20, False)]:
+                self.assertLess(len(pickle.dumps(defender)), x.nbytes)
+                copy = pickle.loads(pickle.dumps(defender))
+                datapoints, _ = copy.defend(x[:2], y[:2])
+                self.assertEqual(datapoints.shape, (2, 3, 4, 4))
+            self.assertEqual(copy.feasible_set.keys(), {0})
+            del copy, defender
+
+    def test_KNN_Defender_vote(self):
+        x = np.arange(6, dtype = float).reshape(6, 1)
+        y = np.array([2, 2, 5, 5, 5, 7])
+        defender = KNN_Defender(init_x = x, init_y = y, nearest_neighbours = 4, confidence_threshold = 0.5)
+        indeces = np.array([[0, 1, 2, 3], [2, 3, 4, 5], [0, 5, 1, 2]])
+        max_labels, confidences = defender._get_confidence_labels(indeces)
+        # Most frequent label (smallest label on ties) and its proportion in the neighbours
+        self.assertTrue(np.array_equal(max_labels, [2, 5, 2]))
+        self.assertTrue(np.allclose(confidences, [0.5, 0.75, 0.5]))
+        flipped = defender._confidence_flip(np.array([0, 0, 0]), max_labels, confidences)
+        self.assertTrue(np.array_equal(flipped, [0, 5, 0]))
+
+        # Votes weighted by inverse distance, exact matches getting all the weight
+        defender = KNN_Defender(init_x = x, init_y = y, nearest_neighbours = 4, 
+                                confidence_threshold = 0.5, weighted = True)
+        distances = np.array([[1., 1., 0.5, 0.5], [1., 1., 1., 1.], [0., 1., 1., 0.]])
+        max_labels, confidences = defender._get_confidence_labels(indeces, distances)
+        self.assertTrue(np.array_equal(max_labels, [5, 5, 2]))
+        self.assertTrue(np.allclose(confidences, [4 / 6, 0.75, 0.5]))
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
@@ -10,9 +10,14 @@ Unit tests for out-of-the-box model classes.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 
+from copy import deepcopy
+
 import pytest
+import numpy as np
+import torch
 
-from niteshade.models import IrisClassifier, MNISTClassifier, CifarClassifier
+from niteshade.models import IrisClassifier, MNISTClassifier, CifarClassifier, ModelEnsemble
+from niteshade.models import PredictionCache
 from niteshade.simulation import Simulator
 from niteshade.utils import train_test_iris, train_test_MNIST, train_test_cifar
 
@@ -54,6 +59,94 @@ def test_MNIST():
     #evaluate on test set
     test_accuracy = simulator.model.evaluate(X_test, y_test, batch_size)  
 
+def test_ensemble():
+    """Train an ensemble of Iris classifiers with and without per-member shuffling."""
+    batch_size = 5
+    num_episodes = 10
+    num_models = 3
+    X_train, y_train, X_test, y_test = train_test_iris()
+
+    for shuffle in [False, True]:
+        #seeding the members does not alter the global random state
+        rng_state = torch.get_rng_state()
+        ensemble = ModelEnsemble(IrisClassifier, num_models=num_models, shuffle=shuffle)
+        assert torch.equal(torch.get_rng_state(), rng_state)
+
+        simulator = Simulator(X_train, y_train, ensemble, batch_size=batch_size, 
+                              num_episodes=num_episodes)
+        simulator.run()
+
+        assert len(simulator.results['models']) == num_episodes
+
+        #members are initialised independently
+        first = ensemble.member_state_dict(0)
+        second = ensemble.member_state_dict(1)
+        assert not torch.equal(first['network.0.weight'], second['network.0.weight'])
+
+        #member state dictionaries can be loaded into standalone models
+        model = IrisClassifier()
+        model.load_state_dict(ensemble.member_state_dict(2, simulator.results['models'][-1]))
+        
+        accuracies = ensemble.evaluate(X_test, y_test, batch_size)
+        assert accuracies.shape == (num_models,)
+        assert np.isclose(accuracies[2], float(model.evaluate(X_test, y_test, batch_size)))
+
+def test_prediction_cache():
+    """Predictions are memoized until the parameters of the model change."""
+    X_train, y_train, X_test, y_test = train_test_iris()
+    X_test = torch.tensor(X_test).float()
+    model = IrisClassifier()
+    model.prediction_cache = PredictionCache(max_size=2)
+    cache = model.prediction_cache
+
+    first = model.predict(X_test)
+    assert model.predict(X_test.clone()) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    #a gradient descent step bumps the version, invalidating cached predictions
+    version = model.version
+    model.step(X_train[:5], y_train[:5])
+    assert model.version == version + 1
+    second = model.predict(X_test)
+    assert second is not first and (cache.hits, cache.misses) == (1, 2)
+    assert model.training #mode of the model is restored
+
+    #least-recently-used predictions are evicted
+    model.predict(X_test[:10])
+    model.predict(X_test[10:])
+    assert len(cache) == 2
+    model.predict(X_test)
+    assert cache.misses == 5
+
+    #loading a state dictionary invalidates cached predictions
+    model.load_state_dict(model.state_dict())
+    model.predict(X_test)
+    assert cache.misses == 6
+
+    #optimizer steps taken outside of .step() also invalidate cached predictions
+    version = model.version
+    model.loss_func(model.forward(X_test), torch.zeros(len(X_test), dtype=torch.long)).backward()
+    model.optimizer.step()
+    assert model.version == version + 1
+    model.predict(X_test)
+    assert (cache.hits, cache.misses) == (1, 7)
+
+    #predictions are not shared between models (even copies of the same model)
+    copied = deepcopy(model)
+    copied.prediction_cache = cache
+    model.predict(X_test)
+    copied.predict(X_test)
+    assert (cache.hits, cache.misses) == (2, 8)
+
+    #copies of a model keep invalidating their cached predictions
+    copied.loss_func(copied.forward(X_test), torch.zeros(len(X_test), dtype=torch.long)).backward()
+    copied.optimizer.step()
+    assert copied.version == model.version + 1
+
+    #simulators attach a shared cache to the model
+    simulator = Simulator(X_train, y_train, IrisClassifier(), num_episodes=10, cache_size=16)
+    assert simulator.model.prediction_cache is simulator.prediction_cache
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
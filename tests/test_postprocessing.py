@@ -17,7 +17,7 @@ from niteshade.defence import FeasibleSetDefender, DefenderGroup, SoftmaxDefende
 
 from niteshade.postprocessing import PostProcessor, PDF
 
-from niteshade.models import IrisClassifier, MNISTClassifier, CifarClassifier
+from niteshade.models import IrisClassifier, MNISTClassifier, CifarClassifier, ModelEnsemble
 from niteshade.simulation import Simulator
 from niteshade.utils import train_test_iris, train_test_MNIST, train_test_cifar
 
@@ -143,6 +143,23 @@ def test_point_counter_MNIST():
     assert defender_only_results['not_poisoned'] == defender_only_results['original_points_total']
     
 
+def test_ensemble_metrics_iris():
+    batch_size = 5
+    num_episodes = 10
+    X_train, y_train, X_test, y_test = train_test_iris()
+
+    simulator = Simulator(X_train, y_train, ModelEnsemble(IrisClassifier, num_models=4), 
+                          batch_size=batch_size, num_episodes=num_episodes)
+    simulator.run()
+
+    postprocessor = PostProcessor({'ensemble': simulator})
+    metrics = postprocessor.compute_ensemble_metrics(X_test, y_test)
+
+    assert metrics['ensemble']['members'].shape == (4, num_episodes)
+    assert (metrics['ensemble']['lower'] <= metrics['ensemble']['mean']).all()
+    assert (metrics['ensemble']['mean'] <= metrics['ensemble']['upper']).all()
+
+
 # =============================================================================
 #  MAIN ENTRY POINT
 # =============================================================================
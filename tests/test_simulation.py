@@ -10,13 +10,16 @@ Unit and integration tests for the simulation module.
 #  IMPORTS AND DEPENDENCIES
 # =============================================================================
 from matplotlib.pyplot import isinteractive
+import pickle
 import pytest
 
 from niteshade.attack import AddLabeledPointsAttacker, LabelFlipperAttacker, Attacker, AddPointsAttacker, PerturbPointsAttacker
+from niteshade.attack import PGDAttacker
 from niteshade.defence import Defender, FeasibleSetDefender
-from niteshade.models import IrisClassifier, MNISTClassifier
-from niteshade.simulation import Simulator, wrap_results
+from niteshade.models import IrisClassifier, MNISTClassifier, PredictionCache
+from niteshade.simulation import Simulator, ReplaySimulator, wrap_results, _AsyncCrafter
 from niteshade.utils import train_test_iris, train_test_MNIST
+from niteshade.data import DatasetRegistry
 
 import torch.nn as nn
 import torch
@@ -146,6 +149,179 @@ def test_attacker_arguments():
     simulator1.run(attacker_requires_model=True, attacker_args=args)
     simulator2.run(attacker_args=args)
 
+def test_replay(tmp_path):
+    """Record an attacked/defended Iris simulation and replay it on a new model."""
+    batch_size = 5
+    num_episodes = 10
+    X_train, y_train, X_test, y_test = train_test_iris()
+    defender = FeasibleSetDefender(X_train, y_train, 0.5, one_hot=True)
+    attacker = AddLabeledPointsAttacker(0.6, 1, one_hot=True)
+
+    simulator = Simulator(X_train, y_train, IrisClassifier(), attacker=attacker,
+                          defender=defender, batch_size=batch_size, 
+                          num_episodes=num_episodes, record=True)
+    simulator.run()
+    simulator.save_recording(dirname=str(tmp_path), filename='recording')
+
+    replay = ReplaySimulator(str(tmp_path / 'recording'), IrisClassifier(lr=0.01))
+    replay.run()
+
+    assert replay.batch_size == batch_size
+    assert len(replay.results['models']) == num_episodes
+    for counter in ['poisoned', 'not_poisoned', 'correctly_defended', 
+                    'incorrectly_defended', 'training_points', 'original_points']:
+        assert getattr(replay, counter) == getattr(simulator, counter)
+
+    wrapped_data, wrapped_models = wrap_results({'recorded': simulator, 'replayed': replay})
+    replayed_episodes = wrapped_data['replayed']['post_defense']
+    recorded_episodes = simulator.results['post_defense']
+    assert [list(ep.keys()) for ep in replayed_episodes] == [list(ep.keys()) for ep in recorded_episodes]
+
+
+def test_memory_budget():
+    """Results over the memory budget are moved to disk but still readable."""
+    batch_size = 5
+    num_episodes = 10
+    X_train, y_train, X_test, y_test = train_test_iris()
+    attacker = AddLabeledPointsAttacker(0.6, 1, one_hot=True)
+
+    simulator = Simulator(X_train, y_train, IrisClassifier(), attacker=attacker, 
+                          batch_size=batch_size, num_episodes=num_episodes, 
+                          memory_budget=50000)
+    simulator.run()
+
+    models = simulator.results['models']
+    assert len(models) == num_episodes
+    assert simulator._spiller.nbytes <= 50000 or len(simulator._spiller._items) == 1
+    assert simulator._spiller._num_spilled > 0
+
+    #spilled episodes are loaded back transparently
+    first_snapshot = models[0]
+    assert set(first_snapshot.keys()) == set(simulator.model.state_dict().keys())
+    for key, value in models[-1].items():
+        assert torch.equal(value, simulator.model.state_dict()[key])
+
+    wrapped_data, wrapped_models = wrap_results({'budget': simulator})
+    assert len(list(wrapped_data['budget']['post_attack'])) == num_episodes
+    assert len(wrapped_models['budget'][:3]) == 3
+
+
+def test_epochs():
+    """Point identities are computed once and reused across epochs."""
+    batch_size = 5
+    num_episodes = 10
+    epochs = 3
+    X_train, y_train, X_test, y_test = train_test_iris()
+
+    simulator = Simulator(X_train, y_train, IrisClassifier(), batch_size=batch_size, 
+                          num_episodes=num_episodes)
+    simulator.run(shuffle=True, epochs=epochs)
+    point_idxs = simulator._point_idxs
+
+    assert simulator.epoch == epochs
+    assert simulator.original_points == epochs * len(X_train)
+    assert simulator.not_poisoned == epochs * len(X_train)
+    assert len(simulator.results['models']) == epochs * num_episodes
+
+    #ids of the last epoch record the epoch they were seen in
+    last_ids = [key for ep in simulator.results['original'][-num_episodes:] for key in ep.keys()]
+    assert all(key.startswith('o_') and key.endswith(f'_{epochs - 1}') for key in last_ids)
+
+    #cached identities are reused by later runs and invalidated on new data
+    simulator.run()
+    assert simulator._point_idxs is point_idxs
+    simulator.X = X_train[::-1].copy()
+    simulator.y = y_train[::-1].copy()
+    assert simulator._point_idxs is None
+
+    #in-place modifications of the data also invalidate cached identities
+    simulator.run()
+    point_idxs = simulator._point_idxs
+    simulator.X[0] += 1
+    simulator.run()
+    assert simulator._point_idxs is not point_idxs
+
+    with pytest.raises(ValueError):
+        simulator.run(epochs=0)
+
+
+def test_attack_staleness():
+    """Asynchronous attacks poison every episode and preserve provenance."""
+    batch_size = 5
+    num_episodes = 10
+    X_train, y_train, X_test, y_test = train_test_iris()
+
+    attacker = AddLabeledPointsAttacker(aggressiveness=0.4, label=1, seed=0)
+    simulator = Simulator(X_train, y_train, IrisClassifier(), attacker=attacker, 
+                          batch_size=batch_size, num_episodes=num_episodes)
+    simulator.run(attack_staleness=2)
+
+    assert simulator.original_points == len(X_train)
+    assert simulator.poisoned > 0
+    assert len(simulator.results['post_attack']) == len(simulator.results['models'])
+
+    #poisons (new points) are injected in every episode
+    poison_counts = [sum(key.startswith('p_') for key in ep.keys()) 
+                     for ep in simulator.results['post_attack']]
+    assert all(count > 0 for count in poison_counts)
+    assert sum(poison_counts) <= simulator.poisoned
+
+    #state of the worker's attacker is copied back
+    assert attacker.injected_idxs is not None
+
+    with pytest.raises(ValueError):
+        simulator.run(attack_staleness=-1)
+
+def test_attack_staleness_model():
+    """Asynchronous model-aware attacks craft poisons against snapshots of the model."""
+    X_train, y_train, X_test, y_test = train_test_iris()
+
+    attacker = PGDAttacker(aggressiveness=0.5, eps=0.1, steps=2, one_hot=True, seed=0)
+    simulator = Simulator(X_train, y_train, IrisClassifier(seed=0), attacker=attacker, 
+                          batch_size=5, num_episodes=10)
+    simulator.run(attacker_requires_model=True, attack_staleness=1)
+
+    #perturbed points are poisons of every episode
+    post_attack = simulator.results['post_attack']
+    assert len(post_attack) == len(simulator.results['models']) == 10
+    assert all(any(key.startswith('p_') for key in ep.keys()) for ep in post_attack)
+
+    #state of the worker's attacker (warm-start perturbations) is copied back
+    assert len(attacker.perturbations) > 0
+
+def test_async_crafter_model():
+    """Models which have stepped and carry a populated prediction cache are sent to the worker."""
+    X_train, y_train, X_test, y_test = train_test_iris()
+    model = IrisClassifier(seed=0)
+    model.prediction_cache = PredictionCache()
+    model.step(X_train[:5], y_train[:5])
+    model.predict(torch.tensor(X_test).float())
+    assert len(model.prediction_cache) == 1
+
+    attacker = PGDAttacker(aggressiveness=0.5, eps=0.1, steps=2, one_hot=True, seed=0)
+    crafter = _AsyncCrafter(attacker, {"model": model})
+    try:
+        crafter.submit(X_train[:10], y_train[:10], model)
+        X_poisoned, y_poisoned, source_idxs = crafter.result()
+    finally:
+        crafter.close(attacker)
+    assert X_poisoned.shape == (10, 4) and np.sum(source_idxs == -1) == 5
+
+    #the cache of the model itself is left untouched
+    assert len(model.prediction_cache) == 1
+
+def test_shared_dataset():
+    """Pickling a simulator only pickles the shared memory handles of its data."""
+    X = np.random.rand(2000, 4).astype(np.float32)
+    y = np.random.randint(0, 3, 2000)
+    with DatasetRegistry() as registry:
+        X_handle, y_handle = registry.register("train", X, y)
+        simulator = Simulator(X_handle, y_handle, IrisClassifier(), batch_size=10, num_episodes=20)
+        assert len(pickle.dumps(simulator)) < X.nbytes
+
+        copy = pickle.loads(pickle.dumps(simulator))
+        assert np.array_equal(copy.X, X) and np.array_equal(copy.y, y)
+        del copy, simulator
 
 # =============================================================================
 #  MAIN ENTRY POINT
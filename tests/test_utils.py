@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the utils module.
+"""
+
+
+# =============================================================================
+#  IMPORTS AND DEPENDENCIES
+# =============================================================================
+
+import pytest
+import numpy as np
+import scipy.sparse
+import torch
+
+from niteshade.utils import LabelCodec, one_hot_encoding, decode_one_hot
+
+
+# =============================================================================
+#  FUNCTIONS
+# =============================================================================
+
+def test_label_codec():
+    """ Labels are encoded and decoded natively for NumPy arrays and tensors. """
+    y = np.array([2, 0, 1, 2])
+    codec = LabelCodec()
+    enc_y = codec.encode(y)
+
+    assert np.array_equal(enc_y, np.eye(3)[y])
+    assert codec.num_classes == 3
+    assert np.array_equal(codec.decode(enc_y), y)
+
+    # number of classes is cached across batches
+    assert codec.encode(np.array([0])).shape == (1, 3)
+    with pytest.raises(ValueError):
+        codec.encode(np.array([3]))
+    with pytest.raises(ValueError):
+        codec.decode(np.eye(4))
+
+    Ty = torch.tensor(y)
+    enc_Ty = LabelCodec().encode(Ty)
+    assert torch.equal(enc_Ty, torch.eye(3)[Ty])
+    assert torch.equal(LabelCodec().decode(enc_Ty), Ty)
+    assert torch.equal(LabelCodec().to_labels(Ty.reshape(-1, 1), one_hot=False), Ty)
+
+
+def test_label_codec_sparse():
+    """ Sparse one-hot labels are decoded without densifying them. """
+    y = np.array([2, 0, 1, 2])
+    codec = LabelCodec(num_classes=5, sparse=True)
+
+    enc_y = codec.encode(y)
+    assert scipy.sparse.issparse(enc_y)
+    assert enc_y.shape == (4, 5)
+    assert np.array_equal(codec.decode(enc_y), y)
+
+    enc_Ty = codec.encode(torch.tensor(y))
+    assert enc_Ty.is_sparse
+    assert torch.equal(codec.decode(enc_Ty), torch.tensor(y))
+
+
+def test_one_hot_helpers():
+    """ Legacy helpers keep their output shapes. """
+    y = np.array([1, 0, 2])
+    enc_y = one_hot_encoding(y, 4)
+
+    assert enc_y.shape == (3, 4)
+    assert np.array_equal(decode_one_hot(enc_y), y.reshape(-1, 1))
+    assert decode_one_hot(np.array([0, 0, 1])).shape == (1, 1)
+    assert np.array_equal(one_hot_encoding(torch.tensor(y), 3), np.eye(3)[y])
+
+
+# =============================================================================
+#  MAIN ENTRY POINT
+# =============================================================================
+
+if __name__ == "__main__":
+    test_label_codec()
+    test_label_codec_sparse()
+    test_one_hot_helpers()